@@ -3,10 +3,6 @@ import os
 import sys
 import argparse
 import logging
-import datetime
-
-import re
-from re import RegexFlag
 
 from shutil import copyfile
 
@@ -18,7 +14,8 @@ from nafi.utils import importClassByName
 from nafi.utils import displayRunConfiguration
 
 from nafi.landsat import landsatScene
-from nafi.metadata import landsat8Manager
+from nafi.service import getMetadataManager
+from nafi.products import decodeProductID, decodeSceneID
 
 #===============================================================================
 #                        Begin parsing command line options
@@ -153,52 +150,20 @@ else:
         archive = args.tarfile
         tarfile = os.path.basename(args.tarfile)
 
-    patterns = [r'(^[a-zA-Z0-9]{3})(\d{3})(\d{3})(\d{7})LGN00.tgz$',\
-                r'^L([a-zA-Z]{1})([0-9]{2})_([a-zA-Z0-9]{4})_(\d{3})(\d{3})_(\d{8})_(\d{8})_(\d{2})_([a-zA-Z0-9]{2}).tgz$']
-
-
-    for pattern in patterns:
-        re_compile = re.match(pattern, tarfile, RegexFlag.IGNORECASE)
-        if re_compile != None:
-            break
+    # Collection 1 product archive, or pre-collection scene archive
+    identifier = None
+    if tarfile.lower().endswith('.tgz'):
+        identifier = decodeProductID(tarfile) or decodeSceneID(tarfile)
 
-    if re_compile is None:
+    if identifier is None:
         logger.critical('Unknown scene tarfile format')
         exit(1)
     else:
-        groups = re_compile.groups()
-
-        if len(groups) == 4:
-
-            sensor = groups[0]
-            path = groups[1]
-            row = groups[2]
-
-            try:
-                strdate = groups[3]
-                filedate = datetime.datetime.strptime(strdate, '%Y%j')
-                acqdate = filedate.strftime('%Y-%m-%d')
-
-            except ValueError:
-                logger.critical('Error parsing date: %s. Required format is [YYYY][MM][DD]', strdate)
-                exit(1)
-
-        if len(groups) == 9:
-
-            sensor = groups[0:2]
-            path = groups[3]
-            row = groups[4]
-
-            try:
-                strdate = groups[5]
-                filedate = datetime.datetime.strptime(strdate, '%Y%m%d')
-                acqdate = filedate.strftime('%Y-%m-%d')
-
-            except ValueError:
-                logger.critical('Error parsing date: %s. Required format is [YYYY][MM][DD]', strdate)
-                exit(1)
+        path = identifier.path
+        row = identifier.row
+        acqdate = identifier.acqdate
 
-        metadb = landsat8Manager()
+        metadb = getMetadataManager(config.get('metadata_service'))
         metadata = metadb.getSceneProductIDs(path, row, acqdate, acqdate)
 
         if len(metadata) == 1:
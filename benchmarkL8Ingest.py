@@ -0,0 +1,272 @@
+
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import shutil
+import sqlite3
+import logging
+import datetime
+import tempfile
+import argparse
+
+from tabulate import tabulate
+
+from nafi.utils import LogEngine
+from nafi.utils import Globals
+
+from nafi.metadata import metaParser
+from nafi.metadata import landsat8Manager
+from nafi.metadata import metadataException
+
+
+#===============================================================================
+# Ingest benchmark suite of the Landsat 8 metadata database. A synthetic bulk
+# metadata file (LANDSAT_8_C1.csv layout) is generated, then loaded without any
+# download: full import (serial and parallel parsing), incremental reload, index
+# build and typical scene lookups are timed. The results are printed and can be
+# written as JSON (--json) to track regressions between releases
+#===============================================================================
+
+# Columns of the USGS bulk metadata file
+CSV_HEADERS = ['browseAvailable', 'browseURL', 'sceneID', 'sensor', 'acquisitionDate', 'dateUpdated', 'path', 'row',
+               'upperLeftCornerLatitude', 'upperLeftCornerLongitude', 'upperRightCornerLatitude', 'upperRightCornerLongitude',
+               'lowerLeftCornerLatitude', 'lowerLeftCornerLongitude', 'lowerRightCornerLatitude', 'lowerRightCornerLongitude',
+               'sceneCenterLatitude', 'sceneCenterLongitude', 'cloudCover', 'cloudCoverFull', 'dayOrNight', 'sunElevation',
+               'sunAzimuth', 'receivingStation', 'sceneStartTime', 'sceneStopTime', 'imageQuality1', 'DATA_TYPE_L1', 'cartURL',
+               'ROLL_ANGLE', 'GEOMETRIC_RMSE_MODEL', 'GEOMETRIC_RMSE_MODEL_X', 'GEOMETRIC_RMSE_MODEL_Y', 'FULL_PARTIAL_SCENE',
+               'NADIR_OFFNADIR', 'PROCESSING_SOFTWARE_VERSION', 'CPF_NAME', 'RLUT_FILE_NAME', 'BPF_NAME_OLI', 'BPF_NAME_TIRS',
+               'GROUND_CONTROL_POINTS_MODEL', 'GROUND_CONTROL_POINTS_VERSION', 'DATE_L1_GENERATED', 'TIRS_SSM_MODEL',
+               'COLLECTION_NUMBER', 'COLLECTION_CATEGORY', 'CLOUD_COVER_LAND', 'LANDSAT_PRODUCT_ID']
+
+# Scenes younger than 'RT_DAYS' are Real Time, older ones Tier 1 or Tier 2
+RT_DAYS = 21
+
+parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('-n', '--records', type=int, default=1000000, help='Number of synthetic metadata records')
+parser.add_argument('-t', '--tier2', type=float, default=0.25, help='Fraction of Tier 2 scenes (older than %d days)' % RT_DAYS)
+parser.add_argument('-u', '--duplicates', type=float, default=0.001, help='Fraction of duplicated product IDs')
+parser.add_argument('-q', '--queries', type=int, default=200, help='Number of scene lookups')
+parser.add_argument('-w', '--workers', type=int, default=4, help='Number of parsing processes of the parallel import')
+parser.add_argument('-s', '--seed', type=int, default=2013, help='Random generator seed')
+parser.add_argument('-j', '--json', default=None, help='Write the results to this JSON file (\'-\' for stdout)')
+parser.add_argument('-o', '--output', default=None, help='Only generate the metadata file (.csv or .csv.gz) and exit')
+parser.add_argument('-d', '--directory', default=None, help='Directory of the benchmark files (default: temporary directory)')
+
+
+def syntheticCSV(filename, n_records, tier2=0.25, duplicates=0.001, seed=2013):
+    """ Write a synthetic Landsat 8 bulk metadata file 'filename' (gzipped if the
+        name ends with '.gz') of 'n_records' records, spread over the WRS-2 path/rows
+        and the days since 2013-04-11, the most recent scenes being Real Time.
+        A fraction 'duplicates' of the records repeat an earlier product ID with new
+        values, as reprocessed scenes do. Returns the number of records written
+    """
+
+    rnd = random.Random(seed)
+
+    first = datetime.date(2013, 4, 11)
+    days = max(1, (datetime.date.today() - first).days)
+    today = first + datetime.timedelta(days=days)
+
+    opener = gzip.open if filename.endswith('.gz') else open
+    recent = []
+
+    with opener(filename, 'wt', newline='\n') as fp:
+
+        fp.write(','.join(CSV_HEADERS) + '\n')
+
+        for i in range(n_records):
+
+            if recent and rnd.random() < duplicates:
+                # reprocessed scene: same identifiers, new cloud cover
+                fields = list(rnd.choice(recent))
+                fields[18] = fields[19] = '%.2f' % rnd.uniform(0, 100)
+                fields[46] = '%.2f' % rnd.uniform(0, 100)
+                fp.write(','.join(fields) + '\n')
+                continue
+
+            path, row = rnd.randint(1, 233), rnd.randint(1, 248)
+            acqdate = first + datetime.timedelta(days=rnd.randrange(days))
+            ACQdate = acqdate.strftime('%Y%m%d')
+
+            if (today - acqdate).days < RT_DAYS:
+                category = 'RT'
+            else:
+                category = 'T2' if rnd.random() < tier2 else 'T1'
+
+            daynight = 'NIGHT' if row > 122 and rnd.random() < 0.05 else 'DAY'
+            level = 'L1TP' if category == 'T1' else rnd.choice(['L1GT', 'L1TP'])
+            processed = acqdate + datetime.timedelta(days=rnd.randint(0, 3) if category == 'RT' else rnd.randint(15, 900))
+
+            # rough WRS-2 footprint, 185 km wide
+            lat = 81.8 - 0.66 * row
+            lon = 180. - 1.545 * path
+            corners = [lat + 0.9, lon - 1.2, lat + 0.9, lon + 1.2, lat - 0.9, lon - 1.2, lat - 0.9, lon + 1.2, lat, lon]
+
+            cc = rnd.uniform(0, 100)
+            cc_land = -1. if rnd.random() < 0.02 else min(100., max(0., cc + rnd.uniform(-10, 10)))
+
+            scene_id = 'LC8{0:03d}{1:03d}{2}LGN00'.format(path, row, acqdate.strftime('%Y%j'))
+            product_id = 'LC08_{0}_{1:03d}{2:03d}_{3}_{4}_01_{5}'.format(level, path, row, ACQdate, processed.strftime('%Y%m%d'), category)
+
+            fields = ['Y', 'https://earthexplorer.usgs.gov/browse/landsat_8/{0}/{1:03d}/{2:03d}/{3}.jpg'.format(acqdate.year, path, row, scene_id),
+                      scene_id, 'OLI_TIRS', acqdate.isoformat(), processed.isoformat(), str(path), str(row)] + \
+                     ['%.5f' % c for c in corners] + \
+                     ['%.2f' % cc, '%.2f' % cc, daynight, '%.8f' % rnd.uniform(-10, 70), '%.8f' % rnd.uniform(0, 360), 'LGN',
+                      '{0}:{1:02d}:{2:02d}.0000000'.format(acqdate.strftime('%Y:%j'), rnd.randint(0, 23), rnd.randint(0, 59)),
+                      '{0}:{1:02d}:{2:02d}.0000000'.format(acqdate.strftime('%Y:%j'), rnd.randint(0, 23), rnd.randint(0, 59)),
+                      '9', level, 'https://earthexplorer.usgs.gov/order/process?dataset_name=LANDSAT_8_C1&ordered={0}'.format(product_id),
+                      '-0.001', '%.3f' % rnd.uniform(3, 12), '%.3f' % rnd.uniform(2, 8), '%.3f' % rnd.uniform(2, 8), 'FULL', 'NADIR',
+                      'LPGS_2.7.0', 'LC08CPF_20170101_20170331_01.02', 'LC08RLUT_20150303_20431231_01_12.h5',
+                      'LO8BPF20170101232021_20170102000000.01', 'LT8BPF20170101225953_20170102001413.01',
+                      str(rnd.randint(100, 600)), '4', processed.isoformat(), 'FINAL', '01', category, '%.2f' % cc_land, product_id]
+
+            fp.write(','.join(fields) + '\n')
+
+            recent.append(fields)
+            if len(recent) > 1000:
+                recent = recent[-500:]
+
+    return n_records
+
+
+def timeIt(function, *args, **kwargs):
+    """ Run the function, return its result and the elapsed time in seconds
+    """
+
+    st = time.perf_counter()
+    result = function(*args, **kwargs)
+
+    return result, time.perf_counter() - st
+
+
+def loadCopy(filename, incremental, workers):
+    """ Import the metadata file with 'metaParser.loadL8Metadata'. The parser
+        deletes the file once imported: a hard link (or copy) is loaded instead
+    """
+
+    copy = filename + '.load'
+    try:
+        os.link(filename, copy)
+    except OSError:
+        shutil.copyfile(filename, copy)
+
+    try:
+        mparser = metaParser()
+        mparser.loadL8Metadata(copy, incremental, workers)
+
+    finally:
+        if os.path.isfile(copy):
+            os.remove(copy)
+
+    return mparser.records
+
+
+if __name__ == '__main__':
+
+    args = parser.parse_args()
+
+    # Init logging engine
+    engine = LogEngine()
+    engine.initLogger(name='L8_Ingest')
+    engine.setLogLevel(logging.INFO)
+    logger = engine.logger
+
+    if args.output:
+        logger.info('Writing %d synthetic metadata records into %s', args.records, args.output)
+        syntheticCSV(args.output, args.records, args.tier2, args.duplicates, args.seed)
+        exit(0)
+
+    workdir = args.directory if args.directory else tempfile.mkdtemp(prefix='nafi_ingest_')
+    status = 0
+
+    # Benchmark results: name, elapsed seconds, records/s
+    results = []
+
+    try:
+
+        # The metadata database is created in the benchmark directory, every
+        # lookup being run against the database (no result cache)
+        Globals.METADATA_LC8_BASEDIR = workdir
+        Globals.METADATA_CACHE_SIZE = 0
+
+        f_csv = os.path.join(workdir, 'LANDSAT_8_C1.csv')
+
+        logger.info('Generating %d synthetic metadata records', args.records)
+        _, elapsed = timeIt(syntheticCSV, f_csv, args.records, args.tier2, args.duplicates, args.seed)
+        results.append(['generate_csv', elapsed, args.records / elapsed])
+
+        logger.info('Full import, serial parsing')
+        records, elapsed = timeIt(loadCopy, f_csv, False, 1)
+        results.append(['import_full_serial', elapsed, records / elapsed])
+
+        if args.workers > 1:
+            logger.info('Full import, %d parsing processes', args.workers)
+            records, elapsed = timeIt(loadCopy, f_csv, False, args.workers)
+            results.append(['import_full_parallel', elapsed, records / elapsed])
+
+        logger.info('Incremental import, unchanged metadata')
+        records, elapsed = timeIt(loadCopy, f_csv, True, 1)
+        results.append(['import_incremental', elapsed, records / elapsed])
+
+        dbase = landsat8Manager()
+        n_scenes = dbase.getNumberofRecords()
+
+        logger.info('Rebuilding scene_meta indexes')
+        dbase.dropIndexes()
+        _, elapsed = timeIt(dbase.createIndexes)
+        results.append(['index_build', elapsed, n_scenes / elapsed])
+
+        # Typical lookups: one path/row over a fire season
+        rnd = random.Random(args.seed)
+        queries = []
+        for i in range(args.queries):
+            year = rnd.randint(2014, 2018)
+            queries.append((rnd.randint(1, 233), rnd.randint(1, 248), '{0}-03-01'.format(year), '{0}-10-31'.format(year), 50.))
+
+        logger.info('Running %d scene lookups', args.queries)
+        latencies = []
+        for query in queries:
+            _, elapsed = timeIt(dbase.getSceneProductIDs, *query)
+            latencies.append(elapsed)
+        latencies.sort()
+        results.append(['query_mean', sum(latencies) / len(latencies), len(latencies) / sum(latencies)])
+        results.append(['query_p95', latencies[int(0.95 * (len(latencies) - 1))], None])
+
+        logger.info('Resolving %d path/rows in one batch', args.queries)
+        _, elapsed = timeIt(dbase.getScenesByPathRow, [query[:2] for query in queries], '2014-03-01', '2018-10-31', 50.)
+        results.append(['query_batch', elapsed, args.queries / elapsed])
+
+        print(' ')
+        print(tabulate([[name, '%.4g' % seconds, '' if rate is None else '%.0f' % rate] for name, seconds, rate in results],
+                       headers=['   Benchmark   ', '   Seconds   ', '   Records/s   '], tablefmt='grid'))
+        print(' ')
+
+        if args.json:
+            report = {'version': Globals.VERSION,
+                      'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                      'python': sys.version.split()[0],
+                      'sqlite': sqlite3.sqlite_version,
+                      'records': args.records,
+                      'scenes': n_scenes,
+                      'workers': args.workers,
+                      'results': dict((name, {'seconds': seconds, 'rate': rate}) for name, seconds, rate in results)}
+
+            if args.json == '-':
+                print(json.dumps(report, indent=2))
+            else:
+                with open(args.json, 'w') as fp:
+                    json.dump(report, fp, indent=2)
+                logger.info('Results written to %s', args.json)
+
+    except metadataException as error:
+        logger.critical(repr(error))
+        status = 1
+
+    finally:
+        if not args.directory:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    exit(status)
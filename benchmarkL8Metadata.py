@@ -0,0 +1,203 @@
+
+import time
+import random
+import shutil
+import tracemalloc
+import logging
+import datetime
+import tempfile
+import argparse
+
+from tabulate import tabulate
+
+from nafi.utils import LogEngine
+from nafi.utils import Globals
+
+from nafi.metadata import landsat8Manager
+from nafi.metadata import metadataException
+
+
+#===============================================================================
+# Benchmark of the Landsat 8 metadata database (landsat8Metadata.db) on a
+# synthetic 'scene_meta' table. The scene lookup latency is measured without
+# and with the covering index 'idx_scene_lookup', and the query plan is checked
+# so that a regression of the index usage makes the script fail (exit code 1).
+# The scene query result modes (objects, tuples, numpy) are then compared on
+# the time and memory needed to hold large result sets
+#===============================================================================
+
+parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('-n', '--records', type=int, default=2000000, help='Number of synthetic scene records')
+parser.add_argument('-q', '--queries', type=int, default=50, help='Number of scene lookups per benchmark')
+parser.add_argument('-d', '--directory', default=None, help='Directory of the benchmark database (default: temporary directory)')
+parser.add_argument('-k', '--keep', help='Keep the benchmark database', default=False, action='store_true')
+args = parser.parse_args()
+
+
+# Init logging engine
+engine = LogEngine()
+engine.initLogger(name='L8_Benchmark')
+engine.setLogLevel(logging.INFO)
+logger = engine.logger
+
+
+def syntheticRecords(n_records, batch=100000):
+    """ Generator returning lists of 'scene_meta' records (as inserted
+        by 'landsat8Manager.importMetadata'), 'batch' records at a time
+    """
+
+    start = datetime.date(2013, 4, 11)
+    categories = ['T1', 'T1', 'T1', 'T2', 'RT']
+
+    records = []
+
+    for i in range(n_records):
+
+        path = random.randint(1, 233)
+        row = random.randint(1, 248)
+        acqdate = start + datetime.timedelta(days=random.randint(0, 2000))
+        category = random.choice(categories)
+
+        ACQdate = acqdate.strftime('%Y%m%d')
+        scene_id = 'LC8{0:03d}{1:03d}{2}LGN{3:02d}'.format(path, row, acqdate.strftime('%Y%j'), i % 100)
+        product_id = 'LC08_L1TP_{0:03d}{1:03d}_{2}_{2}_01_{3}_{4}'.format(path, row, ACQdate, category, i)
+
+        # rough WRS-2 footprint (UL, UR, LR, LL corners), 185 km wide
+        lat = 81.8 - 0.66 * row
+        lon = 180. - 1.545 * path
+        footprint = (lat + 0.9, lon - 1.2, lat + 0.9, lon + 1.2, lat - 0.9, lon + 1.2, lat - 0.9, lon - 1.2)
+
+        records.append(('OLI_TIRS', 1, category, path, row, acqdate.isoformat(), scene_id, product_id,
+                        round(random.uniform(0, 100), 2), round(random.uniform(0, 100), 2), 'DAY') + footprint +
+                       (acqdate.toordinal() - landsat8Manager.epoch, acqdate.year, acqdate.timetuple().tm_yday, acqdate.isoformat(), 'L1TP'))
+
+        if len(records) == batch:
+            yield records
+            records = []
+
+    if records:
+        yield records
+
+    return
+
+
+def syntheticQueries(n_queries):
+    """ Return a list of typical 'getSceneProductIDs' arguments: one path/row over
+        a fire season with a land cloud cover limit
+    """
+
+    queries = []
+
+    for i in range(n_queries):
+        year = random.randint(2014, 2018)
+        queries.append((random.randint(1, 233), random.randint(1, 248), '{0}-03-01'.format(year), '{0}-10-31'.format(year), 50.))
+
+    return queries
+
+
+def timeQueries(dbase, queries):
+    """ Run the scene lookups and return the mean and max latencies in ms
+    """
+
+    latencies = []
+
+    for query in queries:
+        st = time.perf_counter()
+        dbase.getSceneProductIDs(*query)
+        latencies.append(1000. * (time.perf_counter() - st))
+
+    return sum(latencies) / len(latencies), max(latencies)
+
+
+def timeResultModes(dbase, queries, mode):
+    """ Run the scene lookups over the whole archive period with the result 'mode',
+        keeping every result set. Return the number of scenes, the elapsed time in ms
+        and the memory (MB) held by the results
+    """
+
+    tracemalloc.start()
+    st = time.perf_counter()
+
+    results = [dbase.getSceneProductIDs(path, row, '2013-01-01', '2019-12-31', 100., mode) for path, row, _, _, _ in queries]
+
+    elapsed = 1000. * (time.perf_counter() - st)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if mode == 'tuples':
+        n_scenes = sum(len(columns[0]) for columns in results)
+    else:
+        n_scenes = sum(len(scenes) for scenes in results)
+
+    return n_scenes, elapsed, memory / 1048576.
+
+
+workdir = args.directory if args.directory else tempfile.mkdtemp(prefix='nafi_bench_')
+status = 0
+
+try:
+
+    # The metadata database is created in the benchmark directory, every
+    # lookup being run against the database (no result cache)
+    Globals.METADATA_LC8_BASEDIR = workdir
+    Globals.METADATA_CACHE_SIZE = 0
+    dbase = landsat8Manager()
+    dbase.deleteAllRecords()
+    dbase.dropIndexes()
+
+    results = []
+
+    logger.info('Creating %d synthetic records in %s', args.records, workdir)
+    st = time.perf_counter()
+    for bulk_data in syntheticRecords(args.records):
+        dbase.importMetadata(bulk_data)
+    results.append(['Import {0} records'.format(args.records), '%.1f s' % (time.perf_counter() - st), ''])
+
+    queries = syntheticQueries(args.queries)
+
+    logger.info('Running %d scene lookups without index', args.queries)
+    mean, worst = timeQueries(dbase, queries)
+    results.append(['Scene lookup, no index', '%.2f ms' % mean, '%.2f ms' % worst])
+
+    logger.info('Building scene_meta indexes')
+    st = time.perf_counter()
+    dbase.createIndexes()
+    results.append(['Index build', '%.1f s' % (time.perf_counter() - st), ''])
+
+    logger.info('Running %d scene lookups with index', args.queries)
+    mean, worst = timeQueries(dbase, queries)
+    results.append(['Scene lookup, covering index', '%.2f ms' % mean, '%.2f ms' % worst])
+
+    modes = []
+
+    for mode in landsat8Manager.resultModes:
+        logger.info('Running %d scene lookups, result mode \'%s\'', args.queries, mode)
+        try:
+            n_scenes, elapsed, memory = timeResultModes(dbase, queries, mode)
+            modes.append([mode, n_scenes, '%.1f ms' % elapsed, '%.2f MB' % memory])
+        except metadataException as error:
+            logger.warning(repr(error))
+
+    print(' ')
+    print(tabulate(results, headers=['   Benchmark   ', '   Mean   ', '   Max   '], tablefmt='grid'))
+    print(' ')
+    print(tabulate(modes, headers=['   Result mode   ', '   Scenes   ', '   Time   ', '   Memory   '], tablefmt='grid'))
+    print(' ')
+
+    # The lookup must be answered from the covering index only
+    plan = dbase.getQueryPlan(*queries[0])
+    logger.info('Query plan: %s', ' | '.join(plan))
+
+    if not any('USING COVERING INDEX idx_scene_lookup' in step for step in plan):
+        logger.critical('Scene lookup does not use the covering index \'idx_scene_lookup\'')
+        status = 1
+
+except metadataException as error:
+    logger.critical(repr(error))
+    status = 1
+
+finally:
+    if not args.keep and not args.directory:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+exit(status)
@@ -0,0 +1,216 @@
+
+import os
+import glob
+import time
+import random
+import shutil
+import logging
+import datetime
+import tempfile
+import argparse
+
+from tabulate import tabulate
+
+from nafi.utils import LogEngine
+from nafi.utils import Globals
+
+from nafi.metadata import MTLParser
+from nafi.exceptions import MTLParseError
+
+
+#===============================================================================
+# Benchmark of the Landsat MTL metadata parser. The MTL files of a directory
+# (searched recursively), or synthetic Landsat 8 Collection 1 MTL files, are
+# parsed one by one, then by a process pool ('parse_many') and finally again,
+# from the parse cache only
+#===============================================================================
+
+# Landsat 8 Collection 1 MTL layout, the band dependent items are generated
+MTL_TEMPLATE = """\
+GROUP = L1_METADATA_FILE
+  GROUP = METADATA_FILE_INFO
+    ORIGIN = "Image courtesy of the U.S. Geological Survey"
+    REQUEST_ID = "0501{seq:06d}_00001"
+    LANDSAT_SCENE_ID = "LC8{path:03d}{row:03d}{year}{doy:03d}LGN00"
+    LANDSAT_PRODUCT_ID = "LC08_L1TP_{path:03d}{row:03d}_{date}_{date}_01_T1"
+    COLLECTION_NUMBER = 01
+    FILE_DATE = {date_iso}T05:21:47Z
+    STATION_ID = "LGN"
+    PROCESSING_SOFTWARE_VERSION = "LPGS_2.7.0"
+  END_GROUP = METADATA_FILE_INFO
+  GROUP = PRODUCT_METADATA
+    DATA_TYPE = "L1TP"
+    COLLECTION_CATEGORY = "T1"
+    ELEVATION_SOURCE = "GLS2000"
+    OUTPUT_FORMAT = "GEOTIFF"
+    SPACECRAFT_ID = "LANDSAT_8"
+    SENSOR_ID = "OLI_TIRS"
+    WRS_PATH = {path}
+    WRS_ROW = {row}
+    NADIR_OFFNADIR = "NADIR"
+    TARGET_WRS_PATH = {path}
+    TARGET_WRS_ROW = {row}
+    DATE_ACQUIRED = {date_iso}
+    SCENE_CENTER_TIME = "00:{minute:02d}:36.3519010Z"
+    CORNER_UL_LAT_PRODUCT = {ul_lat:.5f}
+    CORNER_UL_LON_PRODUCT = {ul_lon:.5f}
+    CORNER_UR_LAT_PRODUCT = {ul_lat:.5f}
+    CORNER_UR_LON_PRODUCT = {lr_lon:.5f}
+    CORNER_LL_LAT_PRODUCT = {lr_lat:.5f}
+    CORNER_LL_LON_PRODUCT = {ul_lon:.5f}
+    CORNER_LR_LAT_PRODUCT = {lr_lat:.5f}
+    CORNER_LR_LON_PRODUCT = {lr_lon:.5f}
+{files}    FILE_NAME_BAND_QUALITY = "LC08_L1TP_{path:03d}{row:03d}_{date}_{date}_01_T1_BQA.TIF"
+    ANGLE_COEFFICIENT_FILE_NAME = "LC08_L1TP_{path:03d}{row:03d}_{date}_{date}_01_T1_ANG.txt"
+    METADATA_FILE_NAME = "LC08_L1TP_{path:03d}{row:03d}_{date}_{date}_01_T1_MTL.txt"
+    CPF_NAME = "LC08CPF_20170101_20170331_01.02"
+    BPF_NAME_OLI = "LO8BPF20170101232021_20170102000000.01"
+    BPF_NAME_TIRS = "LT8BPF20170101225953_20170102001413.01"
+    RLUT_FILE_NAME = "LC08RLUT_20150303_20431231_01_12.h5"
+  END_GROUP = PRODUCT_METADATA
+  GROUP = IMAGE_ATTRIBUTES
+    CLOUD_COVER = {cc:.2f}
+    CLOUD_COVER_LAND = {cc:.2f}
+    IMAGE_QUALITY_OLI = 9
+    IMAGE_QUALITY_TIRS = 9
+    TIRS_SSM_MODEL = "FINAL"
+    TIRS_SSM_POSITION_STATUS = "ESTIMATED"
+    TIRS_STRAY_LIGHT_CORRECTION_SOURCE = "TIRS"
+    ROLL_ANGLE = -0.001
+    SUN_AZIMUTH = {azimuth:.8f}
+    SUN_ELEVATION = {elevation:.8f}
+    EARTH_SUN_DISTANCE = 0.9833153
+    SATURATION_BAND_1 = "N"
+    GROUND_CONTROL_POINTS_VERSION = 4
+    GROUND_CONTROL_POINTS_MODEL = 428
+    GEOMETRIC_RMSE_MODEL = 7.112
+    GEOMETRIC_RMSE_MODEL_Y = 5.129
+    GEOMETRIC_RMSE_MODEL_X = 4.927
+  END_GROUP = IMAGE_ATTRIBUTES
+  GROUP = MIN_MAX_RADIANCE
+{radiance}  END_GROUP = MIN_MAX_RADIANCE
+  GROUP = RADIOMETRIC_RESCALING
+{rescaling}  END_GROUP = RADIOMETRIC_RESCALING
+  GROUP = TIRS_THERMAL_CONSTANTS
+    K1_CONSTANT_BAND_10 = 774.8853
+    K2_CONSTANT_BAND_10 = 1321.0789
+    K1_CONSTANT_BAND_11 = 480.8883
+    K2_CONSTANT_BAND_11 = 1201.1442
+  END_GROUP = TIRS_THERMAL_CONSTANTS
+  GROUP = PROJECTION_PARAMETERS
+    MAP_PROJECTION = "UTM"
+    DATUM = "WGS84"
+    ELLIPSOID = "WGS84"
+    UTM_ZONE = 52
+    GRID_CELL_SIZE_PANCHROMATIC = 15.00
+    GRID_CELL_SIZE_REFLECTIVE = 30.00
+    GRID_CELL_SIZE_THERMAL = 30.00
+    ORIENTATION = "NORTH_UP"
+    RESAMPLING_OPTION = "CUBIC_CONVOLUTION"
+  END_GROUP = PROJECTION_PARAMETERS
+END_GROUP = L1_METADATA_FILE
+END
+"""
+
+parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('-d', '--directory', default=None, help='Directory of MTL files (*_MTL.txt), synthetic files are generated otherwise')
+parser.add_argument('-n', '--files', type=int, default=500, help='Number of synthetic MTL files')
+parser.add_argument('-w', '--workers', type=int, default=None, help='Number of parsing processes (default: number of CPUs)')
+args = parser.parse_args()
+
+
+def syntheticMTL(directory, n_files):
+    """ Write 'n_files' Landsat 8 MTL files into 'directory', return their names
+    """
+
+    mtl_files = []
+
+    for i in range(n_files):
+
+        path, row = random.randint(1, 233), random.randint(1, 248)
+        acqdate = datetime.date(2013, 4, 11) + datetime.timedelta(days=random.randint(0, 2000))
+        ul_lat, ul_lon = random.uniform(-60, 60), random.uniform(-180, 178)
+
+        files = ''.join(['    FILE_NAME_BAND_{0} = "LC08_L1TP_{1:03d}{2:03d}_{3}_{3}_01_T1_B{0}.TIF"\n'.format(band, path, row, acqdate.strftime('%Y%m%d')) for band in range(1, 12)])
+        radiance = ''.join(['    RADIANCE_MAXIMUM_BAND_{0} = {1:.5f}\n    RADIANCE_MINIMUM_BAND_{0} = {2:.5f}\n'.format(band, random.uniform(20, 800), random.uniform(-60, 0)) for band in range(1, 12)])
+        rescaling = ''.join(['    RADIANCE_MULT_BAND_{0} = {1:.4E}\n    RADIANCE_ADD_BAND_{0} = {2:.5f}\n'.format(band, random.uniform(1e-4, 1e-2), random.uniform(-60, 0)) for band in range(1, 12)])
+
+        content = MTL_TEMPLATE.format(seq=i, path=path, row=row, year=acqdate.year, doy=acqdate.timetuple().tm_yday,
+                                      date=acqdate.strftime('%Y%m%d'), date_iso=acqdate.isoformat(), minute=random.randint(0, 59),
+                                      ul_lat=ul_lat, ul_lon=ul_lon, lr_lat=ul_lat - 2., lr_lon=ul_lon + 2.4, files=files,
+                                      cc=random.uniform(0, 100), azimuth=random.uniform(0, 360), elevation=random.uniform(0, 90),
+                                      radiance=radiance, rescaling=rescaling)
+
+        mtl_file = os.path.join(directory, 'LC08_L1TP_{0:03d}{1:03d}_{2}_{2}_01_T1_{3:05d}_MTL.txt'.format(path, row, acqdate.strftime('%Y%m%d'), i))
+        with open(mtl_file, 'w') as fp:
+            fp.write(content)
+        mtl_files.append(mtl_file)
+
+    return mtl_files
+
+
+if __name__ == '__main__':
+
+    # Init logging engine
+    engine = LogEngine()
+    engine.initLogger(name='MTL_Benchmark')
+    engine.setLogLevel(logging.INFO)
+    logger = engine.logger
+
+    workdir = tempfile.mkdtemp(prefix='nafi_mtl_')
+    status = 0
+
+    try:
+
+        # The parse cache is created in the benchmark directory
+        Globals.METADATA_LC8_BASEDIR = workdir
+
+        if args.directory:
+            mtl_files = sorted(glob.glob(os.path.join(args.directory, '**', '*_MTL.txt'), recursive=True))
+        else:
+            logger.info('Writing %d synthetic MTL files in %s', args.files, workdir)
+            mtl_files = syntheticMTL(workdir, args.files)
+
+        if not mtl_files:
+            raise MTLParseError('No MTL file found in {0}'.format(args.directory))
+
+        results = []
+
+        logger.info('Parsing %d MTL files, one by one', len(mtl_files))
+        mtl = MTLParser(cache=False)
+        st = time.perf_counter()
+        serial = [mtl.parse(mtl_file) for mtl_file in mtl_files]
+        elapsed = time.perf_counter() - st
+        results.append(['parse, no cache', '%.2f s' % elapsed, '%.3f ms' % (1000. * elapsed / len(mtl_files))])
+
+        logger.info('Parsing %d MTL files with parse_many', len(mtl_files))
+        mtl = MTLParser()
+        st = time.perf_counter()
+        parallel = mtl.parse_many(mtl_files, args.workers)
+        elapsed = time.perf_counter() - st
+        results.append(['parse_many, empty cache', '%.2f s' % elapsed, '%.3f ms' % (1000. * elapsed / len(mtl_files))])
+
+        # a new parser instance only finds the files in the disk cache
+        for label, mtl in [('parse_many, memory cache', mtl), ('parse_many, disk cache', MTLParser())]:
+            logger.info('Parsing %d MTL files again (%s)', len(mtl_files), label)
+            st = time.perf_counter()
+            cached = mtl.parse_many(mtl_files, args.workers)
+            elapsed = time.perf_counter() - st
+            results.append([label, '%.2f s' % elapsed, '%.3f ms' % (1000. * elapsed / len(mtl_files))])
+
+        print(' ')
+        print(tabulate(results, headers=['   Benchmark   ', '   Total   ', '   Per file   '], tablefmt='grid'))
+        print(' ')
+
+        if serial != parallel or serial != cached:
+            logger.critical('Parsing results differ between the parser modes')
+            status = 1
+
+    except (MTLParseError, OSError) as error:
+        logger.critical(repr(error))
+        status = 1
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    exit(status)
@@ -17,7 +17,7 @@ from nafi.utils import displayRunConfiguration
 from nafi.utils import setDownloadDates
 
 from nafi.landsat import landsatScene
-from nafi.downloader import landsatDownloader
+from nafi.downloader import createDownloader
 
 
 
@@ -213,7 +213,7 @@ setDownloadDates(config, args.dates)
 #                        Main programme starts here
 #===============================================================================
 
-downloader = landsatDownloader(config)
+downloader = createDownloader(config)
 producer = Thread(target=downloader.startDownloads, name='Downloader')
 producer.start()
 sleep(1)
@@ -0,0 +1,51 @@
+import sys
+import logging
+import datetime
+import argparse
+
+from nafi.utils import LogEngine
+from nafi.utils import Globals
+
+from nafi.service import metadataService
+from nafi.exceptions import metadataException
+
+
+# Long-lived metadata query service. Workflow processes configured with
+# '[ENV] metadata_service = <address>' query it instead of opening the
+# metadata database themselves
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-a', '--address', default=Globals.METADATA_SERVICE or 'localhost:8765', help='Service address: \'host:port\' or \'unix:/path/to/socket\'')
+    parser.add_argument('--debug', '--debug', help='Run script in debug mode', default=False, action='store_true')
+    args = parser.parse_args()
+
+    level = logging.DEBUG if args.debug else logging.INFO
+    basedir = Globals.METADATA_LC8_LOG_BASEDIR
+
+    # Init logging engine
+    engine = LogEngine()
+    engine.initLogger(name='L8_Service', location=basedir)
+    engine.addFilelogHandler(basename='L8_Meta_service')
+    engine.setLogLevel(level)
+
+    logger = engine.logger
+    logger.info('Python interpreter: {0}'.format(sys.version))
+    logger.info('Date: %s', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    logger.info('Version: {0}'.format(Globals.VERSION))
+    logger.info(' ')
+
+    status = 0
+
+    try:
+        metadataService(args.address).serve()
+
+    except KeyboardInterrupt:
+        logger.info('Metadata service interrupted')
+
+    except (metadataException, OSError) as error:
+        logger.critical(repr(error))
+        status = 1
+
+    exit(status)
@@ -4,9 +4,15 @@
     script run smooothly """
 
 import nafi.utils
+import nafi.database
+import nafi.cache
+import nafi.products
+import nafi.digest
 import nafi.workflow
 import nafi.downloader
+import nafi.asyncdownload
 import nafi.landsat
 import nafi.metadata
+import nafi.service
 import nafi.Templates
 import nafi.exceptions
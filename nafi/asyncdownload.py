@@ -0,0 +1,462 @@
+
+import os
+import ssl
+import asyncio
+
+from threading import Thread
+from functools import lru_cache
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit, urljoin
+from concurrent.futures import ThreadPoolExecutor
+
+from requests import Request
+from requests.utils import select_proxy
+
+from nafi.downloader import landsatDownloader
+from nafi.exceptions import downloadException
+
+
+#===============================================================================
+# asyncio download engine: the scene transfers run concurrently on a single
+# event loop (in its own thread) instead of one thread per transfer. Selected
+# with '[ENV] download_engine = asyncio', '[ENV] download_workers' bounds the
+# number of concurrent transfers. The HTTP/1.1 client below only implements
+# what the archive downloads need: GET requests carrying the cookies of the
+# authenticated session, redirects, and fixed-length or chunked bodies.
+#
+# The TLS settings of the session ('verify', 'cert', and the REQUESTS_CA_BUNDLE
+# environment variable) are honored. HTTP proxies are not supported: a download
+# which would go through a proxy fails, use the 'threads' engine instead.
+#===============================================================================
+
+class asyncResponse:
+    """ Response of an HTTP GET request, whose body is read with 'read'
+    """
+
+    def __init__(self, url, status, headers, reader, writer):
+
+        self.url = url
+        self.status_code = status
+        self.headers = headers
+        self.reader = reader
+        self.writer = writer
+
+        self.chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        self.remaining = int(headers['content-length']) if 'content-length' in headers and not self.chunked else None
+        self.chunk = 0
+
+        return
+
+    async def read(self, size, timeout):
+        """ Return up to 'size' bytes of the body, b'' at its end
+        """
+
+        if self.chunked:
+            if self.chunk == 0:
+                line = await asyncio.wait_for(self.reader.readline(), timeout)
+                try:
+                    self.chunk = int(line.split(b';')[0].strip() or b'0', 16)
+                except ValueError:
+                    raise downloadException('Invalid chunk in the response from [{0}]: {1}'.format(self.url, repr(line)))
+                if self.chunk == 0:
+                    return b''
+            data = await asyncio.wait_for(self.reader.read(min(size, self.chunk)), timeout)
+            self.chunk -= len(data)
+            if self.chunk == 0:
+                await asyncio.wait_for(self.reader.readline(), timeout)
+
+        elif self.remaining is not None:
+            if self.remaining == 0:
+                return b''
+            data = await asyncio.wait_for(self.reader.read(min(size, self.remaining)), timeout)
+            self.remaining -= len(data)
+
+        else:
+            data = await asyncio.wait_for(self.reader.read(size), timeout)
+
+        if not data and (self.chunked or self.remaining):
+            raise downloadException('Connection closed before the end of the response from [{0}]'.format(self.url))
+
+        return data
+
+    def close(self):
+
+        self.writer.close()
+        return
+
+
+@lru_cache(maxsize=8)
+def createSSLContext(verify=True, cert=None):
+    """ Return the SSL context of the requests settings 'verify' (True, False or the path
+        of a CA bundle or directory) and 'cert' (client certificate file, or (cert, key))
+    """
+
+    if isinstance(verify, str):
+        context = ssl.create_default_context(cafile=verify if os.path.isfile(verify) else None, capath=verify if os.path.isdir(verify) else None)
+    else:
+        context = ssl.create_default_context()
+
+    if verify is False:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    if cert:
+        if isinstance(cert, str):
+            context.load_cert_chain(cert)
+        else:
+            context.load_cert_chain(*cert)
+
+    return context
+
+
+async def openURL(session, url, headers=None, timeout=60., redirects=10):
+    """ Send a GET request with the headers and cookies of the requests 'session', follow
+        the redirections and return the asyncResponse, its body not read yet. The cookies
+        set by the server are stored into the session. The connection and protocol errors
+        are raised as downloadException
+    """
+
+    for _ in range(redirects + 1):
+
+        prepared = session.prepare_request(Request('GET', url, headers=headers))
+        address = urlsplit(prepared.url)
+        secure = address.scheme == 'https'
+        port = address.port or (443 if secure else 80)
+
+        # Session settings merged with the environment, as requests does
+        settings = session.merge_environment_settings(prepared.url, {}, None, None, None)
+
+        if select_proxy(prepared.url, settings['proxies']):
+            raise downloadException('HTTP proxies are not supported by the asyncio download engine: [{0}]'.format(prepared.url))
+
+        cert = tuple(settings['cert']) if isinstance(settings['cert'], list) else settings['cert']
+        writer = None
+
+        try:
+            context = createSSLContext(settings['verify'], cert) if secure else None
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(address.hostname, port, ssl=context), timeout)
+
+            target = address.path or '/'
+            if address.query:
+                target += '?' + address.query
+
+            lines = ['GET {0} HTTP/1.1'.format(target), 'Host: {0}'.format(address.netloc)]
+            lines += ['{0}: {1}'.format(name, value) for name, value in prepared.headers.items() if name.lower() not in ('host', 'connection', 'accept-encoding')]
+            lines += ['Accept-Encoding: identity', 'Connection: close']
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            await writer.drain()
+
+            status_line = await asyncio.wait_for(reader.readline(), timeout)
+            try:
+                status = int(status_line.split()[1])
+            except (IndexError, ValueError):
+                raise downloadException('Invalid HTTP response from [{0}]: {1}'.format(url, repr(status_line)))
+
+            response_headers = {}
+            while True:
+                line = (await asyncio.wait_for(reader.readline(), timeout)).decode('latin-1').rstrip('\r\n')
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                name, value = name.strip().lower(), value.strip()
+
+                if name == 'set-cookie':
+                    for morsel in SimpleCookie(value).values():
+                        session.cookies.set(morsel.key, morsel.value, domain=morsel['domain'] or address.hostname, path=morsel['path'] or '/')
+                else:
+                    response_headers[name] = value
+
+        except (OSError, asyncio.TimeoutError, ValueError) as error:
+            if writer is not None:
+                writer.close()
+            raise downloadException('Error requesting [{0}]: {1}'.format(prepared.url, repr(error)))
+
+        except downloadException:
+            writer.close()
+            raise
+
+        if status in (301, 302, 303, 307, 308) and 'location' in response_headers:
+            writer.close()
+            url = urljoin(prepared.url, response_headers['location'])
+            continue
+
+        return asyncResponse(prepared.url, status, response_headers, reader, writer)
+
+    raise downloadException('Too many redirections downloading [{0}]'.format(url))
+
+
+class asyncDownloader(landsatDownloader):
+    """ landsatDownloader running the scene transfers on an asyncio event loop. The archives are
+        written to disk, and the download records read and written, by a small thread pool:
+        the event loop never blocks on the disk or the database
+    """
+
+    # Bytes read from the response at a time
+    payload = 1024 * 1024
+
+    # Threads writing the archives
+    writers = 2
+
+    # Seconds without any data before a transfer is abandoned
+    timeout = 120.
+
+    def __init__(self, config=None):
+
+        landsatDownloader.__init__(self, config)
+
+        self.loop = None
+        self.thread = None
+        self.slots = None
+        self.disk = None
+
+        return
+
+    def startEngine(self):
+        """ Start the event loop thread and the archive writers
+        """
+
+        self.loop = asyncio.new_event_loop()
+        self.disk = ThreadPoolExecutor(max_workers=asyncDownloader.writers, thread_name_prefix='Writer')
+
+        self.thread = Thread(target=self.loop.run_forever, name='Downloads', daemon=True)
+        self.thread.start()
+
+        async def semaphore():
+            return asyncio.Semaphore(self.workers)
+
+        self.slots = asyncio.run_coroutine_threadsafe(semaphore(), self.loop).result()
+        return
+
+    def submitDownload(self, mdata):
+        """ Schedule the transfer of a scene on the event loop, return its (concurrent.futures) future
+        """
+
+        return asyncio.run_coroutine_threadsafe(self.runDownloadAsync(mdata), self.loop)
+
+    async def runDownloadAsync(self, mdata):
+        """ Coroutine downloading a scene, any error raised as a downloadException
+        """
+
+        with self.downloadErrors(mdata):
+            await self.downloadSceneAsync(mdata)
+
+        return
+
+    def stopEngine(self, cancel=False):
+        """ Cancel the transfers still running if requested, then stop the event loop
+        """
+
+        async def drain():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            if cancel:
+                for task in tasks:
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(drain(), self.loop).result()
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.disk.shutdown()
+
+        return
+
+    async def downloadSceneAsync(self, mdata):
+        """ Coroutine downloading the archive of a scene, unless already
+            downloaded, and queuing the scene for processing
+        """
+
+        async with self.slots:
+
+            PATH, ROW, ACQdate, outpath, outfile = self.getScenePaths(mdata)
+            url = self.getDownloadURL(mdata)
+            loop = asyncio.get_running_loop()
+
+            resume = True
+
+            while resume:
+
+                # An interrupted download resumes where it stopped
+                offset, headers = await loop.run_in_executor(self.disk, self.getResumeRange, outfile)
+
+                response = await openURL(self.browser.session, url, headers=headers, timeout=asyncDownloader.timeout)
+                self.logger.debug('USGS Server response: %s', str(response.status_code))
+                resume = False
+
+                try:
+                    # if file exists on USGS server
+                    if response.status_code == 200 or (offset > 0 and response.status_code in (206, 416)):
+
+                        scene, ar_size = await loop.run_in_executor(self.disk, self.prepareScene, mdata, outpath, outfile)
+
+                        if ar_size is None:
+
+                            transfer = self.getTransferRange(response.status_code, response.headers, url, offset)
+
+                            if transfer is None:
+                                # Download the whole archive again
+                                await loop.run_in_executor(self.disk, self.discardPart, outfile)
+                                resume = True
+
+                            else:
+                                self.logger.info('Starting download scene [%s/%s] d=[%s]', PATH, ROW, ACQdate)
+
+                                segments = self.getSegments(response.headers, *transfer)
+
+                                if segments is None:
+                                    digest = await loop.run_in_executor(self.disk, self.startDigest, outfile, transfer[0])
+                                    extractor = await loop.run_in_executor(self.disk, self.startExtractor, outfile, transfer[0])
+
+                                    try:
+                                        size_downloaded = await self.transferArchiveAsync(response, mdata, outfile, *transfer, digest, extractor)
+                                    finally:
+                                        await loop.run_in_executor(self.disk, self.stopExtractor, extractor, scene)
+                                else:
+                                    # The byte ranges are requested on connections of their own
+                                    response.close()
+                                    size_downloaded = await self.transferSegmentsAsync(url, mdata, outfile, segments, self.getValidator(response.headers), transfer[1])
+
+                                    # The byte ranges arrive out of order: the archive is hashed once downloaded
+                                    digest = await loop.run_in_executor(self.disk, self.startDigest, outfile, size_downloaded)
+
+                                await loop.run_in_executor(self.disk, self.finishPart, outfile, size_downloaded, transfer[1])
+                                await loop.run_in_executor(self.disk, self.completeDownload, mdata, scene, outfile, size_downloaded, transfer[1], digest.hexdigest())
+
+                        else:
+                            await loop.run_in_executor(self.disk, self.skipDownload, mdata, scene, ar_size)
+                    else:
+                        self.logger.warning('Scene [%s/%s] for date [%s] is not avalaible.', PATH, ROW, ACQdate)
+
+                finally:
+                    response.close()
+
+        return
+
+    async def transferArchiveAsync(self, response, mdata, outfile, offset, total_length, digest, extractor=None):
+        """ Write the response body into the '.part' file of 'outfile' from 'offset' on, into 'digest' and into
+            the band 'extractor' if any, return the size of the '.part' file. See landsatDownloader.transferArchive
+        """
+
+        loop = asyncio.get_running_loop()
+        name = os.path.basename(outfile)
+        validator = self.getValidator(response.headers)
+        location = self.config_lk['working_d']
+
+        size_downloaded = offset
+        checkpoint = offset
+
+        handle = await loop.run_in_executor(self.disk, open, outfile + landsatDownloader.partial, 'r+b' if offset else 'wb')
+
+        def store(chunk):
+            handle.write(chunk)
+            digest.update(chunk)
+            if extractor is not None:
+                extractor.write(chunk)
+
+        try:
+            await loop.run_in_executor(self.disk, handle.seek, offset)
+            await loop.run_in_executor(self.disk, handle.truncate)
+
+            while size_downloaded < total_length:
+                try:
+                    chunk = await response.read(asyncDownloader.payload, asyncDownloader.timeout)
+                except (OSError, asyncio.TimeoutError) as error:
+                    raise downloadException('Download of {0} interrupted at {1} bytes: {2}'.format(name, size_downloaded, repr(error)))
+
+                if not chunk:
+                    break
+
+                await loop.run_in_executor(self.disk, store, chunk)
+                size_downloaded += len(chunk)
+                self.showProgress(name, size_downloaded, total_length)
+
+                if size_downloaded - checkpoint >= landsatDownloader.checkpoint:
+                    await loop.run_in_executor(self.disk, handle.flush)
+                    await loop.run_in_executor(self.disk, self.dbase.logProgress, mdata, total_length, location, size_downloaded, validator)
+                    checkpoint = size_downloaded
+
+        finally:
+            await loop.run_in_executor(self.disk, handle.close)
+            if size_downloaded < total_length:
+                await loop.run_in_executor(self.disk, self.dbase.logProgress, mdata, total_length, location, size_downloaded, validator)
+            self.showProgress(name)
+
+        return size_downloaded
+
+    async def transferSegmentsAsync(self, url, mdata, outfile, segments, validator, total_length):
+        """ Download the byte ranges 'segments' of the archive concurrently into its
+            '.part' file. See landsatDownloader.transferSegments
+        """
+
+        loop = asyncio.get_running_loop()
+        name = os.path.basename(outfile)
+        location = self.config_lk['working_d']
+
+        positions = [first for first, _ in segments]
+        checkpoint = segments[0][0]
+
+        async def downloadSegment(index):
+
+            nonlocal checkpoint
+            first, end = segments[index]
+            headers = {'Range': 'bytes={0}-{1}'.format(first, end - 1), 'If-Range': validator}
+
+            response = await openURL(self.browser.session, url, headers=headers, timeout=asyncDownloader.timeout)
+
+            try:
+                # The archive has changed (If-Range) or the range is not the one requested
+                if response.status_code != 206 or self.getTransferRange(206, response.headers, url, first) != (first, total_length):
+                    raise downloadException('Download of {0} failed: byte range {1}-{2} not served (HTTP {3})'.format(name, first, end - 1, response.status_code))
+
+                while positions[index] < end:
+                    try:
+                        chunk = await response.read(min(asyncDownloader.payload, end - positions[index]), asyncDownloader.timeout)
+                    except (OSError, asyncio.TimeoutError) as error:
+                        raise downloadException('Download of {0} interrupted at {1} bytes: {2}'.format(name, positions[index], repr(error)))
+
+                    if not chunk:
+                        raise downloadException('Download of {0} failed: byte range {1}-{2} truncated'.format(name, first, end - 1))
+
+                    await loop.run_in_executor(self.disk, os.pwrite, fd, chunk, positions[index])
+                    positions[index] += len(chunk)
+
+                    downloaded = sum(position - start for position, (start, _) in zip(positions, segments))
+                    self.showProgress(name, segments[0][0] + downloaded, total_length)
+
+                    prefix = self.getSegmentPrefix(segments, positions)
+                    if prefix - checkpoint >= landsatDownloader.checkpoint:
+                        checkpoint = prefix
+                        await loop.run_in_executor(self.disk, self.dbase.logProgress, mdata, total_length, location, prefix, validator)
+
+            finally:
+                response.close()
+
+            return
+
+        fd = await loop.run_in_executor(self.disk, os.open, outfile + landsatDownloader.partial, os.O_RDWR | os.O_CREAT, 0o644)
+        tasks = []
+
+        try:
+            await loop.run_in_executor(self.disk, os.ftruncate, fd, total_length)
+
+            tasks = [asyncio.ensure_future(downloadSegment(index)) for index in range(len(segments))]
+            await asyncio.gather(*tasks)
+
+        finally:
+            # The first error stops the other byte ranges
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            prefix = self.getSegmentPrefix(segments, positions)
+
+            # Only the prefix of an incomplete archive is kept
+            if prefix < total_length:
+                await loop.run_in_executor(self.disk, os.ftruncate, fd, prefix)
+                await loop.run_in_executor(self.disk, self.dbase.logProgress, mdata, total_length, location, prefix, validator)
+
+            await loop.run_in_executor(self.disk, os.close, fd)
+            self.showProgress(name)
+
+        return prefix
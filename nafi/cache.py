@@ -0,0 +1,201 @@
+
+import time
+import pickle
+import hashlib
+
+from threading import local, Lock
+from collections import OrderedDict
+
+from nafi.database import connectionPool
+
+
+class queryCache:
+    """ LRU cache of database query results, keyed on the query and its parameters.
+        Every entry is tagged with a validity token (e.g. the latest 'journal_meta' ID):
+        an entry stored under another token than the current one is never returned,
+        and all of them are evicted as soon as the token changes.
+
+        The memory tier holds at most 'maxsize' entries. The optional disk tier
+        (SQLite file 'filename') keeps up to 'disksize' entries between processes
+    """
+
+    # The disk tier can be rebuilt at any time: no durability needed
+    pragmas = [('journal_mode', 'WAL'), ('synchronous', 'OFF')]
+
+    def __init__(self, maxsize=1024, filename=None, disksize=16384):
+
+        self.maxsize = maxsize
+        self.filename = filename
+        self.disksize = disksize
+
+        self.hits = 0
+        self.misses = 0
+
+        self.__entries = OrderedDict()
+        self.__token = None
+        self.__threads = local()
+        self.__generation = 0
+        self.__writes = 0
+        self.__lock = Lock()
+
+        if self.filename is not None:
+            with self.getConnection() as conn:
+                conn.execute("""\
+                                CREATE TABLE IF NOT EXISTS query_cache
+                                (
+                                    Key VARCHAR(40) PRIMARY KEY,
+                                    Token INTEGER,
+                                    Accessed REAL,
+                                    Data BLOB
+                                );""")
+        return
+
+    def getConnection(self):
+        """ Return the pooled connection to the disk tier
+        """
+
+        return connectionPool.getConnection(self.filename, queryCache.pragmas)
+
+    def getToken(self, conn, query):
+        """ Return the current validity token, read from the database connection 'conn'
+            with 'query' (returning a single value). The query is only run when the database
+            has been modified by another connection since the previous call ('data_version')
+            or after 'reset'
+        """
+
+        version = conn.execute('pragma data_version;').fetchone()[0]
+
+        versions = self.getVersions()
+        known = versions.get(conn)
+
+        if known is not None and known[0] == version:
+            return known[1]
+
+        token = conn.execute(query).fetchone()[0]
+        versions[conn] = (version, token)
+
+        return token
+
+    def getVersions(self):
+        """ Return the calling thread ('data_version', token) pairs, keyed on the connection
+            object (pooled connections are used by a single thread). The pairs recorded
+            before the last 'reset' or 'clear' are discarded
+        """
+
+        versions = getattr(self.__threads, 'versions', None)
+        if versions is None or self.__threads.generation != self.__generation:
+            versions = self.__threads.versions = {}
+            self.__threads.generation = self.__generation
+
+        return versions
+
+    def reset(self):
+        """ Force the next 'getToken' calls to read the token again. Must be called after
+            the token has been changed through one of the connections passed to 'getToken'
+        """
+
+        with self.__lock:
+            self.__generation += 1
+
+        return
+
+    def validate(self, token):
+        """ Evict every entry when the validity token has changed
+        """
+
+        with self.__lock:
+            if token == self.__token:
+                return
+            self.__entries.clear()
+            self.__token = token
+
+        if self.filename is not None:
+            with self.getConnection() as conn:
+                conn.execute('delete from query_cache where Token is not ?;', (token,))
+
+        return
+
+    def get(self, key, token):
+        """ Return the result cached under 'key' for 'token', or None
+        """
+
+        self.validate(token)
+
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return self.__entries[key]
+
+        value = None
+
+        if self.filename is not None:
+            digest = self.digest(key)
+            with self.getConnection() as conn:
+                row = conn.execute('select Data from query_cache where Key=? and Token=?;', (digest, token)).fetchone()
+                if row is not None:
+                    conn.execute('update query_cache set Accessed=? where Key=?;', (time.time(), digest))
+                    value = pickle.loads(row[0])
+                    self.store(key, value)
+
+        with self.__lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return value
+
+    def put(self, key, token, value):
+        """ Cache the result 'value' of the query 'key' for 'token'
+        """
+
+        self.validate(token)
+        self.store(key, value)
+
+        if self.filename is not None:
+            with self.getConnection() as conn:
+                conn.execute('insert or replace into query_cache values (?, ?, ?, ?);',
+                             (self.digest(key), token, time.time(), pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+
+                # Trim the least recently used entries from time to time
+                self.__writes += 1
+                if self.__writes % self.maxsize == 0:
+                    conn.execute("""\
+                                    delete from query_cache where Key not in
+                                    (select Key from query_cache order by Accessed desc limit ?);""", (self.disksize,))
+        return
+
+    def store(self, key, value):
+        """ Add an entry to the memory tier, evicting the least recently used ones
+        """
+
+        with self.__lock:
+            self.__entries[key] = value
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+        return
+
+    def clear(self):
+        """ Evict every entry, from both tiers
+        """
+
+        with self.__lock:
+            self.__entries.clear()
+            self.__generation += 1
+            self.__token = None
+
+        if self.filename is not None:
+            with self.getConnection() as conn:
+                conn.execute('delete from query_cache;')
+
+        return
+
+    @staticmethod
+    def digest(key):
+        """ Disk tier key: SHA-1 digest of the query and parameters
+        """
+
+        return hashlib.sha1(repr(key).encode()).hexdigest()
@@ -0,0 +1,106 @@
+
+import os
+import atexit
+import sqlite3
+
+from threading import local, Lock
+
+
+class connectionPool:
+    """ Persistent SQLite connections shared by the database managers (landsat8Manager,
+        downloadDataManager and workflowManager). Each thread gets one connection per
+        database file, opened on first use and kept until 'closeAll' is called (registered
+        at exit). The connection pragmas are applied once at creation, and the statements
+        prepared by a connection are reused through the sqlite3 statement cache
+    """
+
+    # Pragmas applied to every new connection, in order
+    pragmas = [('foreign_keys', 'on')]
+
+    # Number of prepared statements cached by each connection
+    cached_statements = 256
+
+    # Seconds a connection waits for a lock held by another connection
+    timeout = 30.
+
+    __threads = local()
+    __connections = []
+    __generation = 0
+    __lock = Lock()
+
+    @classmethod
+    def getConnection(cls, db_name, pragmas=None):
+        """ Return the calling thread persistent connection to the database file
+            'db_name'. The connection is created, along with the database directory,
+            the first time. 'pragmas' [(name, value), ...] are applied after the default ones
+        """
+
+        # Connections opened before the last 'closeAll' are discarded
+        connections = getattr(cls.__threads, 'connections', None)
+        if connections is None or cls.__threads.generation != cls.__generation:
+            connections = cls.__threads.connections = {}
+            cls.__threads.generation = cls.__generation
+
+        conn = connections.get(db_name)
+
+        if conn is None:
+
+            rootdir = os.path.dirname(db_name)
+            if rootdir and os.path.exists(rootdir) is False:
+                os.makedirs(rootdir)
+
+            # A connection is only used by the thread which created it, but it
+            # can be closed by any other thread when the pool shuts down
+            conn = sqlite3.connect(db_name, timeout=cls.timeout, cached_statements=cls.cached_statements, check_same_thread=False)
+
+            cur = conn.cursor()
+            for pragma, value in cls.pragmas + (pragmas or []):
+                cur.execute('pragma {0} = {1};'.format(pragma, value))
+            cur.close()
+
+            connections[db_name] = conn
+            with cls.__lock:
+                cls.__connections.append(conn)
+
+        return conn
+
+    @classmethod
+    def close(cls, db_name):
+        """ Close the calling thread connection to the database file 'db_name'
+        """
+
+        connections = getattr(cls.__threads, 'connections', {})
+        conn = connections.pop(db_name, None)
+
+        if conn is not None:
+            with cls.__lock:
+                if conn in cls.__connections:
+                    cls.__connections.remove(conn)
+            conn.close()
+
+        return
+
+    @classmethod
+    def closeAll(cls):
+        """ Roll back any pending transaction and close every pooled connection,
+            for all threads
+        """
+
+        with cls.__lock:
+            connections = cls.__connections[:]
+            del cls.__connections[:]
+            cls.__generation += 1
+
+        for conn in connections:
+            try:
+                conn.rollback()
+                conn.close()
+
+            except sqlite3.Error:
+                # connection already unusable, nothing left to release
+                pass
+
+        return
+
+
+atexit.register(connectionPool.closeAll)
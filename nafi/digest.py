@@ -0,0 +1,97 @@
+
+import os
+import hashlib
+
+
+#===============================================================================
+# Archive digests. The downloaders hash the archives while they stream to disk
+# and store the digest in the 'downloads' table and in a sidecar file next to
+# the archive, in the 'sha256sum' format:
+#
+#   <hex digest>  <archive name>
+#
+# Comparing the sidecar with the download record is cheap (no archive read),
+# the full verification of an archive re-reads it and compares its digest
+# with the sidecar ('sha256sum -c' works as well).
+#===============================================================================
+
+# hashlib algorithm, and suffix of the sidecar files
+algorithm = 'sha256'
+suffix = '.sha256'
+
+# Bytes read at a time when an archive is hashed from disk
+blocksize = 1024 * 1024
+
+
+def createDigest():
+    """ Return a new (hashlib) digest object
+    """
+
+    return hashlib.new(algorithm)
+
+
+def hashFile(filename, size=None, digest=None):
+    """ Update 'digest' (a new digest by default) with the first 'size' bytes
+        of 'filename' (the whole file by default), return the digest
+    """
+
+    digest = createDigest() if digest is None else digest
+    remaining = os.path.getsize(filename) if size is None else size
+
+    with open(filename, 'rb') as handle:
+        while remaining > 0:
+            block = handle.read(min(blocksize, remaining))
+            if not block:
+                raise EOFError('{0} is shorter than {1} bytes'.format(os.path.basename(filename), size))
+            digest.update(block)
+            remaining -= len(block)
+
+    return digest
+
+
+def getSidecarName(archive):
+    """ Return the name of the sidecar file of 'archive'
+    """
+
+    return archive + suffix
+
+
+def writeSidecar(archive, hexdigest):
+    """ Write the digest of 'archive' into its sidecar file
+    """
+
+    with open(getSidecarName(archive), 'w') as handle:
+        handle.write('{0}  {1}\n'.format(hexdigest, os.path.basename(archive)))
+
+    return
+
+
+def readSidecar(archive):
+    """ Return the digest (hex) stored in the sidecar file of 'archive',
+        None if the sidecar is missing or invalid
+    """
+
+    try:
+        with open(getSidecarName(archive), 'r') as handle:
+            fields = handle.readline().split()
+
+    except (IOError, UnicodeDecodeError):
+        return None
+
+    if len(fields) != 2 or fields[1].lstrip('*') != os.path.basename(archive):
+        return None
+
+    return fields[0].lower()
+
+
+def verifyArchive(archive):
+    """ Re-read 'archive' and compare its digest with its sidecar. Returns True or False,
+        None when there is nothing to compare with (no sidecar, or no archive)
+    """
+
+    expected = readSidecar(archive)
+
+    if expected is None or not os.path.isfile(archive):
+        return None
+
+    return hashFile(archive).hexdigest() == expected
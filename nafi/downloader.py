@@ -1,27 +1,54 @@
 
 import sys, os
 from queue import Queue
-from threading import Thread, Event
+from threading import Thread, Event, Lock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 
 import sqlite3
 from contextlib import contextmanager
 
 from robobrowser import RoboBrowser as rb
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
 
-from nafi.metadata import landsat8Manager
+from nafi.service import getMetadataManager
+from nafi.digest import createDigest, hashFile, readSidecar, writeSidecar, verifyArchive
 
-from nafi.landsat import landsatScene
+from nafi.landsat import landsatScene, bandExtractor
 from nafi.utils import LogEngine
 from nafi.utils import Globals
 
-from nafi.exceptions import downloadException
+from nafi.database import connectionPool
+
+from nafi.exceptions import downloadException, metadataException
 
 _NO_SET_ = -10000
 
 
+def createDownloader(config):
+    """ Return the downloader of the engine selected by '[ENV] download_engine':
+        'threads' (landsatDownloader) or 'asyncio' (asyncDownloader)
+    """
+
+    if config.get('download_engine', 'threads') == 'asyncio':
+        from nafi.asyncdownload import asyncDownloader
+        return asyncDownloader(config)
+
+    return landsatDownloader(config)
+
+
 
 class landsatDownloader:
 
+    # Suffix of the archives being downloaded
+    partial = '.part'
+
+    # Bytes downloaded between two progress records
+    checkpoint = 16 * Globals.MBYTES
+
+    # Bytes read from the response at a time
+    payload = 64 * 1024
+
     class LoginTimer(Thread):
 
         def __init__(self, timer, event, func):
@@ -55,6 +82,15 @@ class landsatDownloader:
         self.tasks = Queue()
         self.logger = LogEngine().logger
 
+        # Scenes downloaded concurrently, and the progress of the downloads in progress
+        self.workers = self.config_lk.get('download_workers', 1)
+        # Byte ranges of an archive downloaded concurrently, and their minimum size
+        self.segments = self.config_lk.get('download_segments', 1)
+        self.segmentSize = self.config_lk.get('segment_min_size', 16) * Globals.MBYTES
+        self.progress = {}
+        self.progressLock = Lock()
+        self.pool = None
+
         self.timerEvent = Event()
         duration = self.config_lk['login_timer']
         self.timer = landsatDownloader.LoginTimer(duration, self.timerEvent, self.openConnection)
@@ -84,6 +120,11 @@ class landsatDownloader:
 
             browser.submit_form(login)
 
+            # One pooled HTTP connection per download thread and byte range
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.workers * self.segments, 10))
+            browser.session.mount('https://', adapter)
+            browser.session.mount('http://', adapter)
+
             self.logger.debug('Credentials OK. Server response: %s', str(browser.response.status_code))
 
         return browser
@@ -105,12 +146,37 @@ class landsatDownloader:
 
         self.browser = self.openConnection()
 
+        # Scenes are downloaded concurrently by the download engine, each of them once
+        self.startEngine()
+        downloads = []
+        submitted = set()
+        completed = False
+
         try:
 
             # Start timer for credential renewal
             self.timer.start()
 
-            metadb = landsat8Manager()
+            metadb = getMetadataManager(self.config_lk.get('metadata_service'))
+
+            # Resolve the scenes of all path/rows at once
+            pathrows = [(path, row) for path_scenes in all_scenes for path in path_scenes for row in path_scenes[path]]
+            all_metadata = metadb.getScenesByPathRow(pathrows, dates[0], dates[-1], cc_land)
+
+            # Scenes covering the area of interest, if any, are queued along
+            # with the path/row scenes (each scene only once)
+            if self.config_lk.get('aoi'):
+                queued = set(meta.product_id for scenes in all_metadata.values() for meta in scenes)
+                aoi_metadata = [meta for meta in metadb.getScenesIntersecting(self.config_lk['aoi'], dates[0], dates[-1], cc_land) if meta.product_id not in queued]
+
+                # A path/row iterated over once: new path/rows are added to the list a single time
+                pathrows = set((int(path), int(row)) for path, row in pathrows)
+                all_scenes = list(all_scenes)
+                for meta in aoi_metadata:
+                    if (meta.path, meta.row) not in pathrows:
+                        pathrows.add((meta.path, meta.row))
+                        all_scenes.append({meta.path: [meta.row]})
+                    all_metadata.setdefault((meta.path, meta.row), []).append(meta)
 
             # Iterate throught path/row scenes
             for path_scenes in all_scenes:
@@ -118,7 +184,7 @@ class landsatDownloader:
                 for path in path_scenes:
                     for row in path_scenes[path]:
 
-                        scene_metadata = metadb.getSceneProductIDs(path, row, dates[0], dates[-1], cc_land)
+                        scene_metadata = all_metadata[(int(path), int(row))]
 
                         if self.browser is not None:
 
@@ -128,32 +194,39 @@ class landsatDownloader:
 
                             self.logger.info(' ')
                             for meta in scene_metadata:
-                                self.downloadScene(meta)
+                                if meta.product_id not in submitted:
+                                    submitted.add(meta.product_id)
+                                    downloads.append(self.submitDownload(meta))
                         else:
                             self.logger.info(' ')
                             for meta in scene_metadata:
                                 self.offlineProcessing(meta)
 
-            # Queue empty landsatScene as the end marker
-            stopdownload = landsatScene()
-            self.tasks.put(stopdownload)
-
-            # Stop the credentials timer
-            self.timerEvent.set()
-            self.timerEvent.clear()
-            self.timer.join()
+            # Each scene is queued as soon as its download completes, the end
+            # marker once all of them are done. The first error stops the downloads
+            done, _ = wait(downloads, return_when=FIRST_EXCEPTION)
+            for future in done:
+                future.result()
 
+            completed = True
             self.logger.info('Data downloader process exited.')
 
-        except downloadException as error:
+        except (downloadException, metadataException) as error:
 
             self.logger.critical('Download Manager error encountered: %s', repr(error))
             self.logger.critical('Exiting Download Thread')
 
+        finally:
+
+            # Whatever the error, the engine and the timer are stopped and the end marker
+            # queued. On error, the downloads not started yet are dropped, the running ones end
+            self.stopEngine(cancel=not completed)
+
             # Stop the credentials timer
-            self.timerEvent.set()
-            self.timerEvent.clear()
-            self.timer.join()
+            if self.timer.is_alive():
+                self.timerEvent.set()
+                self.timerEvent.clear()
+                self.timer.join()
 
             # Queue empty landsatScene as the end marker
             stopdownload = landsatScene()
@@ -161,8 +234,50 @@ class landsatDownloader:
 
         return
 
-    def downloadScene(self, mdata):
+    def startEngine(self):
+        """ Start the download engine: a pool of threads sharing the authenticated session
+        """
+
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='Download')
+        return
+
+    def submitDownload(self, mdata):
+        """ Schedule the download of a scene, return its (concurrent.futures) future
+        """
+
+        return self.pool.submit(self.runDownload, mdata)
+
+    def runDownload(self, mdata):
+        """ Download a scene (pool thread), any error raised as a downloadException
+        """
+
+        with self.downloadErrors(mdata):
+            self.downloadScene(mdata)
+
+        return
+
+    @contextmanager
+    def downloadErrors(self, mdata):
+        """ Raise the connection, file system and database errors of the download of a
+            scene as downloadException: the downloads stop and the end marker is queued
+        """
+
+        try:
+            yield
+
+        except (RequestException, OSError, sqlite3.Error) as error:
+            raise downloadException('Download of {0} failed: {1}'.format(mdata.product_id, repr(error)))
+
+    def stopEngine(self, cancel=False):
+        """ Wait for the scheduled downloads, or cancel the ones not started yet, and stop the engine
         """
+
+        self.pool.shutdown(cancel_futures=cancel)
+        return
+
+    def getScenePaths(self, mdata):
+        """ Return the scene path, row and acquisition date strings ('PPP', 'RRR', 'YYYYMMDD'),
+            the scene directory and its archive file name
         """
 
         working_dir = self.config_lk['working_d']
@@ -176,109 +291,512 @@ class landsatDownloader:
         outpath = os.path.join(working_dir, '{0}{1}'.format(PATH, ROW), ACQdate)
         outfile = os.path.join(outpath, mdata.product_id + '.tgz')
 
-        # Compose download URL
+        return PATH, ROW, ACQdate, outpath, outfile
+
+    def getDownloadURL(self, mdata):
+        """ Compose the download URL of a scene
+        """
+
         url = mdata.getSceneURL()
         if not url:
             raise downloadException('Download URL error. Returned empty string')
 
         self.logger.debug('Data URL: %s', url)
 
-        response = self.browser.session.get(url, stream=True, headers={'Accept-Encoding': None})
-        self.logger.debug('USGS Server response: %s', str(response.status_code))
+        return url
+
+    def prepareScene(self, mdata, outpath, outfile):
+        """ Return the landsatScene to queue, and the size of its archive if it has already been
+            downloaded (None otherwise: the stale download record, if any, is deleted)
+        """
 
-        # if file exists on USGS server
-        if response.status_code == 200:
+        working_dir = self.config_lk['working_d']
 
-            scene = landsatScene(mdata)
-            scene.enableCleanup(self.config_lk['cleanup'])
+        scene = landsatScene(mdata)
+        scene.enableCleanup(self.config_lk['cleanup'])
+
+        # Create directories only if there are data to download (avoid empty dirs)
+        if os.path.exists(outpath) is False:
+            os.makedirs(outpath, exist_ok=True)
+
+        # Check if archive has already been downloaded.
+        # Returns -1, if record doesn't exist
+        f_size = _NO_SET_
+        ar_size = self.dbase.getDownloadSize(os.path.basename(outfile), working_dir)
+
+        if os.path.isfile(outfile) is True:
+            f_size = os.path.getsize(outfile)
+            # Set tarfile archive name to scene object
+            scene.setTarArchive(os.path.basename(outfile))
+
+        elif ar_size > 0:
+            # record present in database, but scene tar file deleted?
+            # Skip download and band projections in workflow
+            f_size = ar_size
+
+        if ar_size != f_size:
+
+            # Delete record, archive might be missing. The progress record
+            # of an interrupted download is kept to resume it
+            if ar_size > 0:
+                self.dbase.deleteDownloadRecord(os.path.basename(outfile), working_dir)
+            return scene, None
+
+        if os.path.isfile(outfile) and not self.checkArchive(outfile):
+
+            # The archive is not the one downloaded
+            self.logger.warning('%s does not match its download record, downloading it again', os.path.basename(outfile))
+            self.dbase.deleteDownloadRecord(os.path.basename(outfile), working_dir)
+            return scene, None
+
+        return scene, ar_size
 
-            # Create directories only if there are data to download (avoid empty dirs)
-            if os.path.exists(outpath) is False:
-                os.makedirs(outpath)
+    def checkArchive(self, outfile):
+        """ Check a downloaded archive against its download record: the digest of its sidecar file
+            must be the one recorded, and with '[ENV] verify_archives' the digest of its content as well.
+            The sidecar of a recorded digest is written again when missing
+        """
+
+        digest = self.dbase.getDownloadDigest(os.path.basename(outfile), self.config_lk['working_d'])
+
+        # Archives downloaded without digest
+        if digest is None:
+            return True
+
+        sidecar = readSidecar(outfile)
+
+        if sidecar is None:
+            writeSidecar(outfile, digest)
+        elif sidecar != digest:
+            return False
+
+        if self.config_lk.get('verify_archives'):
+            return verifyArchive(outfile) is True
+
+        return True
+
+    def getContentLength(self, headers, url):
+        """ Return the size of the archive to download, from the response headers
+        """
+
+        content_length = headers.get('content-length')
+
+        if content_length is None:
+            raise downloadException('Download error. Unable to retrieve the download file size for URL [%s]' % url)
+
+        return int(content_length)
+
+    def getResumeRange(self, outfile):
+        """ Return the offset where the download of 'outfile' resumes, i.e. the size of its
+            '.part' file, and the HTTP Range headers requesting the rest of the archive.
+            (0, {}) when there is no interrupted download to resume
+        """
+
+        partfile = outfile + landsatDownloader.partial
+        if not os.path.isfile(partfile):
+            return 0, {}
+
+        progress = self.dbase.getPartialDownload(os.path.basename(outfile), self.config_lk['working_d'])
+
+        # Without the validator of the archive, the bytes downloaded might belong
+        # to another version of it: the download starts again from the beginning
+        if progress is None or not progress[2] or os.path.getsize(partfile) > progress[1]:
+            self.logger.debug('%s cannot be resumed, downloading the whole archive', os.path.basename(partfile))
+            return 0, {}
+
+        # Only the bytes recorded are certain to be in the '.part' file: the
+        # segmented downloads write into a file preallocated to the archive size
+        offset = min(os.path.getsize(partfile), progress[0])
+        if offset == 0:
+            return 0, {}
+
+        self.logger.info('Resuming download of %s at %d MB', os.path.basename(outfile), int(offset/Globals.MBYTES))
+
+        return offset, {'Range': 'bytes={0}-'.format(offset), 'If-Range': progress[2]}
+
+    def getTransferRange(self, status, headers, url, offset):
+        """ Return (first byte to download, archive size) from the response to a download
+            request resuming at 'offset', None if the '.part' file cannot be resumed
+        """
+
+        # The archive has changed (If-Range) or the server ignored the range
+        if status == 200:
+            return 0, self.getContentLength(headers, url)
+
+        # 'Content-Range: bytes first-last/size' (206) or 'bytes */size' (416)
+        interval, _, size = headers.get('content-range', '').partition(' ')[2].partition('/')
+
+        try:
+            size = int(size)
+        except ValueError:
+            return None
+
+        if status == 206 and interval.split('-')[0] == str(offset):
+            return offset, size
+
+        # Range not satisfiable: the '.part' file is either complete or invalid
+        if status == 416 and size == offset:
+            return offset, size
+
+        return None
+
+    def getValidator(self, headers):
+        """ Return the validator of an archive, which the resumed requests send as 'If-Range':
+            its strong ETag, or else its modification date. None if the server sends neither
+        """
+
+        etag = headers.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
 
-            # Check if archive has already been downloaded.
-            # Returns -1, if record doesn't exist
-            f_size = _NO_SET_
-            ar_size = self.dbase.getDownloadSize(os.path.basename(outfile), working_dir)
+        return headers.get('last-modified')
+
+    def getSegments(self, headers, offset, total_length):
+        """ Return the byte ranges [first, end) to download concurrently from 'offset' on, None
+            when the archive is downloaded in a single stream: segmented downloads disabled,
+            archive too small, or byte ranges not advertised ('Accept-Ranges') by the server
+        """
+
+        count = min(self.segments, (total_length - offset) // self.segmentSize)
+
+        if count < 2 or headers.get('accept-ranges', '').lower() != 'bytes' or self.getValidator(headers) is None:
+            return None
+
+        bounds = [offset + (total_length - offset) * i // count for i in range(count + 1)]
+
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def getSegmentPrefix(self, segments, positions):
+        """ Return the size of the archive prefix downloaded by the 'segments', which
+            have been written up to 'positions': where a resumed download starts
+        """
+
+        for (_, end), position in zip(segments, positions):
+            if position < end:
+                return position
+
+        return segments[-1][1]
+
+    def discardPart(self, outfile):
+        """ Delete the '.part' file of an archive and its progress record
+        """
+
+        partfile = outfile + landsatDownloader.partial
+
+        self.logger.warning('%s cannot be resumed, downloading the whole archive', os.path.basename(partfile))
+
+        if os.path.isfile(partfile):
+            os.remove(partfile)
+        self.dbase.deleteDownloadRecord(os.path.basename(outfile), self.config_lk['working_d'])
+
+        return
+
+    def startDigest(self, outfile, offset):
+        """ Return the digest of the archive being downloaded into the '.part'
+            file of 'outfile', the first 'offset' bytes (already downloaded) hashed
+        """
+
+        if offset == 0:
+            return createDigest()
+
+        return hashFile(outfile + landsatDownloader.partial, offset)
+
+    def startExtractor(self, outfile, offset):
+        """ Return the bandExtractor of an archive downloaded from its first byte, with
+            '[ENV] stream_extract' enabled. None otherwise: the bands are extracted by the workflow
+        """
+
+        if offset > 0 or not self.config_lk.get('stream_extract'):
+            return None
+
+        return bandExtractor(os.path.join(os.path.dirname(outfile), 'Bands'))
+
+    def stopExtractor(self, extractor, scene):
+        """ Wait for the extraction of the bands of 'scene', flag them as extracted on success
+        """
+
+        if extractor is not None:
+            scene.setExtracted(extractor.close())
+
+        return
+
+    def finishPart(self, outfile, size_downloaded, total_length):
+        """ Rename the '.part' file of a complete archive to its archive name
+        """
+
+        if size_downloaded == total_length:
+            os.replace(outfile + landsatDownloader.partial, outfile)
+
+        return
+
+    def completeDownload(self, mdata, scene, outfile, size_downloaded, total_length, digest=None):
+        """ Record a complete download, its digest (hex) written into the
+            sidecar file of the archive, and queue its scene for processing
+        """
+
+        PATH, ROW, ACQdate, _, _ = self.getScenePaths(mdata)
+
+        # Download has terminated
+        if os.path.isfile(outfile):
+
+            self.logger.debug('Size downloaded: [%d] -- Size on server [%d]', size_downloaded, total_length)
+
+            if size_downloaded == total_length:
+
+                self.logger.info('Scene [%s/%s] d=[%s], download complete: %d MB', PATH, ROW, ACQdate, int(os.path.getsize(outfile)/Globals.MBYTES))
+
+                if digest is not None:
+                    writeSidecar(outfile, digest)
+                self.dbase.logComplete(mdata, total_length, self.config_lk['working_d'], digest)
 
-            if os.path.isfile(outfile) is True:
-                f_size = os.path.getsize(outfile)
                 # Set tarfile archive name to scene object
                 scene.setTarArchive(os.path.basename(outfile))
 
-            elif ar_size > 0:
-                # record present in database, but scene tar file deleted?
-                # Skip download and band projections in workflow
-                f_size = ar_size
+                # Queue landsatScene object for processing
+                self.logger.debug('Queuing scene [%s/%s], d=[%s]', PATH, ROW, ACQdate)
+                self.tasks.put(scene)
+
+            else:
+                self.logger.critical('%s download failed to complete.', os.path.basename(outfile))
+        else:
+            self.logger.critical('%s download failed.', os.path.basename(outfile))
+
+        return
+
+    def skipDownload(self, mdata, scene, ar_size):
+        """ Queue for processing a scene whose archive has already been downloaded
+        """
 
-            if ar_size != f_size:
+        PATH, ROW, ACQdate, _, _ = self.getScenePaths(mdata)
 
-                # Delete record, archive might be missing
-                self.dbase.deleteDownloadRecord(os.path.basename(outfile), working_dir)
+        self.logger.info('Scene [%s/%s] d=[%s] has already been downloaded: %s MB', PATH, ROW, ACQdate, int(ar_size/Globals.MBYTES))
+
+        # Queue landsatScene object for processing
+        self.logger.debug('Queuing scene [%s/%s], d=[%s]', PATH, ROW, ACQdate)
+        self.tasks.put(scene)
+
+        return
+
+    def downloadScene(self, mdata):
+        """ Download the archive of a scene, unless already downloaded,
+            and queue the scene for processing
+        """
+
+        PATH, ROW, ACQdate, outpath, outfile = self.getScenePaths(mdata)
+        url = self.getDownloadURL(mdata)
+
+        resume = True
+
+        while resume:
+
+            # An interrupted download resumes where it stopped
+            offset, headers = self.getResumeRange(outfile)
+            headers['Accept-Encoding'] = None
 
-                # Get file to download size
-                content_length = response.headers.get('content-length')
-                
-                if content_length is None:
-                    raise downloadException('Download error. Unable to retrieve the download file size for URL [%s]' % url ) 
-                
-                total_length = int(response.headers.get('content-length'))
+            response = self.browser.session.get(url, stream=True, headers=headers)
+            self.logger.debug('USGS Server response: %s', str(response.status_code))
+            resume = False
 
-                with open(outfile, 'wb') as handle:   # the 'with' syntax if part of ContextManager it ensures the file is properly initialized and closed at the end
+            # if file exists on USGS server
+            if response.status_code == 200 or (offset > 0 and response.status_code in (206, 416)):
 
-                    payload = 512
-                    sys.stdout.write('\n')
-                    mesg1 = '\t\t\tDownloading {0}:'.format(mdata.product_id + '.tgz')
+                scene, ar_size = self.prepareScene(mdata, outpath, outfile)
 
-                    f_size = int(total_length/Globals.MBYTES)
-                    mesg2 = '/{0} MB'.format(f_size)
+                if ar_size is None:
+
+                    transfer = self.getTransferRange(response.status_code, response.headers, url, offset)
+
+                    if transfer is None:
+                        # Download the whole archive again
+                        self.discardPart(outfile)
+                        resume = True
+
+                    else:
+                        self.logger.info('Starting download scene [%s/%s] d=[%s]', PATH, ROW, ACQdate)
+
+                        segments = self.getSegments(response.headers, *transfer)
+
+                        if segments is None:
+                            digest = self.startDigest(outfile, transfer[0])
+                            extractor = self.startExtractor(outfile, transfer[0])
+
+                            try:
+                                size_downloaded = self.transferArchive(response, mdata, outfile, *transfer, digest, extractor)
+                            finally:
+                                self.stopExtractor(extractor, scene)
+                        else:
+                            # The byte ranges are requested on connections of their own
+                            response.close()
+                            size_downloaded = self.transferSegments(url, mdata, outfile, segments, self.getValidator(response.headers), transfer[1])
+
+                            # The byte ranges arrive out of order: the archive is hashed once downloaded
+                            digest = self.startDigest(outfile, size_downloaded)
+
+                        self.finishPart(outfile, size_downloaded, transfer[1])
+                        self.completeDownload(mdata, scene, outfile, size_downloaded, transfer[1], digest.hexdigest())
+
+                else:
+                    self.skipDownload(mdata, scene, ar_size)
+            else:
+                self.logger.warning('Scene [%s/%s] for date [%s] is not avalaible.', PATH, ROW, ACQdate)
+
+            # Release the connection to the session pool, the archive may not have been read
+            response.close()
+
+        return
+
+    def transferArchive(self, response, mdata, outfile, offset, total_length, digest, extractor=None):
+        """ Write the response body into the '.part' file of 'outfile' from 'offset' on, into 'digest'
+            and into the band 'extractor' if any, return the size of the '.part' file. The progress is
+            recorded every 'checkpoint' bytes and when the transfer is interrupted, for the next run
+            to resume the download
+        """
+
+        name = os.path.basename(outfile)
+        validator = self.getValidator(response.headers)
+
+        size_downloaded = offset
+        checkpoint = offset
+
+        with open(outfile + landsatDownloader.partial, 'r+b' if offset else 'wb') as handle:
+
+            handle.seek(offset)
+            handle.truncate()
+
+            try:
+                if offset < total_length:
 
                     ichunk = 0
-                    size_downloaded = 0
-                    self.logger.info('Starting download scene [%s/%s] d=[%s]', PATH, ROW, ACQdate)
 
-                    for chunk in response.iter_content(chunk_size=payload):
+                    for chunk in response.iter_content(chunk_size=landsatDownloader.payload):
                         if chunk:   # filter out keep-alive new chunks
                             handle.write(chunk)
+                            digest.update(chunk)
+                            if extractor is not None:
+                                extractor.write(chunk)
 
                             size_downloaded += len(chunk)
 
                             ichunk += 1
-                            if (ichunk % 2000) == 0:
-                                progress = int(ichunk * payload/(1024*1024))
-                                sys.stdout.write('%s: %d%s   \r' % (mesg1, progress, mesg2))
-                                sys.stdout.flush()
+                            if (ichunk % 16) == 0:
+                                self.showProgress(name, size_downloaded, total_length)
+
+                            if size_downloaded - checkpoint >= landsatDownloader.checkpoint:
+                                handle.flush()
+                                self.dbase.logProgress(mdata, total_length, self.config_lk['working_d'], size_downloaded, validator)
+                                checkpoint = size_downloaded
 
-                    # Download has terminated
-                    if os.path.isfile(outfile):
-                        
-                        self.logger.debug('Size downloaded: [%d] -- Size on server [%d]', size_downloaded, total_length)
+            except RequestException as error:
+                raise downloadException('Download of {0} interrupted at {1} bytes: {2}'.format(name, size_downloaded, repr(error)))
 
-                        if size_downloaded == total_length:
+            finally:
+                if size_downloaded < total_length:
+                    handle.flush()
+                    self.dbase.logProgress(mdata, total_length, self.config_lk['working_d'], size_downloaded, validator)
+                self.showProgress(name)
 
-                            self.logger.info('Scene [%s/%s] d=[%s], download complete: %d MB', PATH, ROW, ACQdate, int(os.path.getsize(outfile)/Globals.MBYTES))
-                            self.dbase.logComplete(mdata, total_length, working_dir)
+        return size_downloaded
 
-                            # Set tarfile archive name to scene object
-                            scene.setTarArchive(os.path.basename(outfile))
+    def transferSegments(self, url, mdata, outfile, segments, validator, total_length):
+        """ Download the byte ranges 'segments' of the archive concurrently into its '.part'
+            file, preallocated to 'total_length'. Return the size of the archive prefix
+            downloaded, recorded as the progress of the download when it is interrupted
+        """
 
-                            # Queue landsatScene object for processing
-                            self.logger.debug('Queuing scene [%s/%s], d=[%s]', PATH, ROW, ACQdate)
-                            self.tasks.put(scene)
+        name = os.path.basename(outfile)
+        location = self.config_lk['working_d']
 
-                        else:
-                            self.logger.critical('%s download failed to complete.', os.path.basename(outfile))
-                    else:
-                        self.logger.critical('%s download failed.', os.path.basename(outfile))
-            else:
+        positions = [first for first, _ in segments]
+        checkpoint = [segments[0][0]]
+        lock = Lock()
 
-                self.logger.info('Scene [%s/%s] d=[%s] has already been downloaded: %s MB', PATH, ROW, ACQdate, int(ar_size/Globals.MBYTES))
+        def downloadSegment(index):
 
-                # Queue landsatScene object for processing
-                self.logger.debug('Queuing scene [%s/%s], d=[%s]', PATH, ROW, ACQdate)
-                self.tasks.put(scene)
-        else:
-            self.logger.warning('Scene [%s/%s] for date [%s] is not avalaible.', PATH, ROW, ACQdate)
+            first, end = segments[index]
+            headers = {'Range': 'bytes={0}-{1}'.format(first, end - 1), 'If-Range': validator, 'Accept-Encoding': None}
+
+            response = self.browser.session.get(url, stream=True, headers=headers)
+            ichunk = 0
+
+            try:
+                # The archive has changed (If-Range) or the range is not the one requested
+                if response.status_code != 206 or self.getTransferRange(206, response.headers, url, first) != (first, total_length):
+                    raise downloadException('Download of {0} failed: byte range {1}-{2} not served (HTTP {3})'.format(name, first, end - 1, response.status_code))
+
+                for chunk in response.iter_content(chunk_size=landsatDownloader.payload):
+                    if not chunk:
+                        continue
+                    if positions[index] + len(chunk) > end:
+                        raise downloadException('Download of {0} failed: byte range {1}-{2} overrun'.format(name, first, end - 1))
+
+                    os.pwrite(fd, chunk, positions[index])
+
+                    with lock:
+                        positions[index] += len(chunk)
+                        downloaded = sum(position - first for position, (first, _) in zip(positions, segments))
+                        prefix = self.getSegmentPrefix(segments, positions)
+                        record = prefix - checkpoint[0] >= landsatDownloader.checkpoint
+                        if record:
+                            checkpoint[0] = prefix
+
+                    ichunk += 1
+                    if (ichunk % 16) == 0:
+                        self.showProgress(name, segments[0][0] + downloaded, total_length)
+                    if record:
+                        self.dbase.logProgress(mdata, total_length, location, prefix, validator)
+
+                if positions[index] != end:
+                    raise downloadException('Download of {0} failed: byte range {1}-{2} truncated'.format(name, first, end - 1))
+
+            except RequestException as error:
+                raise downloadException('Download of {0} interrupted at {1} bytes: {2}'.format(name, positions[index], repr(error)))
+
+            finally:
+                response.close()
+
+            return
+
+        fd = os.open(outfile + landsatDownloader.partial, os.O_RDWR | os.O_CREAT, 0o644)
+
+        try:
+            os.ftruncate(fd, total_length)
+
+            with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix='Segment') as pool:
+                for future in [pool.submit(downloadSegment, index) for index in range(len(segments))]:
+                    future.result()
+
+        finally:
+            prefix = self.getSegmentPrefix(segments, positions)
+
+            # Only the prefix of an incomplete archive is kept
+            if prefix < total_length:
+                os.ftruncate(fd, prefix)
+                self.dbase.logProgress(mdata, total_length, location, prefix, validator)
+
+            os.close(fd)
+            self.showProgress(name)
+
+        return prefix
+
+    def showProgress(self, name, downloaded=None, total=None):
+        """ Display on one line the progress of all the downloads in progress.
+            The archive 'name' is removed from the display when 'downloaded' is None
+        """
+
+        with self.progressLock:
+
+            if downloaded is None:
+                self.progress.pop(name, None)
+                return
+
+            if name not in self.progress:
+                sys.stdout.write('\n')
+            self.progress[name] = (downloaded, total)
+
+            status = ' | '.join(['{0}: {1}/{2} MB'.format(archive, int(size / Globals.MBYTES), int(length / Globals.MBYTES))
+                                 for archive, (size, length) in self.progress.items()])
+            sys.stdout.write('\t\t\tDownloading %s   \r' % status)
+            sys.stdout.flush()
 
         return
 
@@ -336,25 +854,22 @@ class downloadDataManager:
 
     @contextmanager
     def getConnection(self):
-        """ Manage the connection with the SQLite database and enable
-            foreign keys support. The connection is wrapped within a
-            context manager generator
+        """ Manage the connection with the SQLite database. The thread persistent
+            connection (foreign keys support enabled) is taken from the shared pool
+            and wrapped within a context manager generator
         """
 
+        conn = None
+
         try:
-            if os.path.exists(self.rootdir) is False:
-                os.makedirs(self.rootdir)
             db_name = os.path.join(self.rootdir, '{0}.db'.format(self.wfname))
-            conn = sqlite3.connect(db_name)
-
-            # Enable foreign key support for database
-            cur = conn.cursor()
-            cur.execute('pragma foreign_keys = on;')
+            conn = connectionPool.getConnection(db_name)
 
             yield conn
 
         except Exception as error:
-            conn.rollback()
+            if conn is not None:
+                conn.rollback()
             raise downloadException('Downloader Database Error: {0}'.format(repr(error)))
 
         else:
@@ -383,8 +898,19 @@ class downloadDataManager:
                                     Filename VARCHAR(100) NOT NULL,
                                     Filesize BIGINT NOT NULL,
                                     Location VARCHAR(300) NOT NULL,
+                                    Status VARCHAR(10) NOT NULL DEFAULT 'complete',
+                                    Downloaded BIGINT,
+                                    Validator VARCHAR(100),
+                                    Digest VARCHAR(128),
                                     unique(Filename, Location)
                             );""")
+
+                # Upgrade the table created by earlier versions: the existing records are complete downloads
+                existing = [info[1].lower() for info in cur.execute('pragma table_info(downloads)').fetchall()]
+                for name, declaration in [('Status', 'VARCHAR(10) NOT NULL DEFAULT \'complete\''), ('Downloaded', 'BIGINT'), ('Validator', 'VARCHAR(100)'), ('Digest', 'VARCHAR(128)')]:
+                    if name.lower() not in existing:
+                        cur.execute('alter table downloads add column {0} {1}'.format(name, declaration))
+
                 cur.close()
 
             except sqlite3.OperationalError:
@@ -395,22 +921,39 @@ class downloadDataManager:
                 raise downloadException('Error creating table database \'downloads\'')
         return
 
-    def logComplete(self, mdata, fsize, location):
+    def logComplete(self, mdata, fsize, location, digest=None):
         """ Create a database record in the 'downloads' table.
             The record contains sensor code, the landsat data collection
             mumber, the tar archive file name, the archive filesize and
             the download folder
         """
 
+        self.logStatus(mdata, fsize, location, 'complete', fsize, digest=digest)
+        return
+
+    def logProgress(self, mdata, fsize, location, downloaded, validator=None):
+        """ Record the progress of an interrupted or running download: the number of
+            bytes 'downloaded' (in the '.part' file) out of 'fsize', and the HTTP validator
+            (ETag or Last-Modified) of the archive, required to resume the download
+        """
+
+        self.logStatus(mdata, fsize, location, 'partial', downloaded, validator)
+        return
+
+    def logStatus(self, mdata, fsize, location, status, downloaded, validator=None, digest=None):
+        """ Create or replace the 'downloads' record of an archive
+        """
+
         fname = mdata.product_id + '.tgz'
-        data = (mdata.sensor, mdata.coll_number, mdata.coll_type, mdata.path, mdata.row, mdata.acqdate, fname, fsize, location)
+        data = (mdata.sensor, mdata.coll_number, mdata.coll_type, mdata.path, mdata.row, mdata.acqdate, fname, fsize, location, status, downloaded, validator, digest)
 
         with self.getConnection() as conn:
             try:
                 cur = conn.cursor()
+                # A record left by a concurrent download of the same archive is replaced
                 cur.execute("""\
-                            insert into downloads ('Sensor', 'Coll_number', 'Coll_category', 'Path', 'Row', 'acqdate', 'Filename', 'Filesize', 'Location')
-                            values (?, ?, ?, ?, ?, ?, ?, ? ,?)""", data)
+                            insert or replace into downloads ('Sensor', 'Coll_number', 'Coll_category', 'Path', 'Row', 'acqdate', 'Filename', 'Filesize', 'Location', 'Status', 'Downloaded', 'Validator', 'Digest')
+                            values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", data)
                 cur.close()
 
             except sqlite3.Error as error:
@@ -418,15 +961,50 @@ class downloadDataManager:
                 raise downloadException('Error accessing database: {0}'.format(repr(error)))
         return
 
+    def getPartialDownload(self, filename, location):
+        """ Return (bytes downloaded, archive size, validator) of an interrupted
+            download, None if the archive is not partially downloaded
+        """
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                data = cur.execute("select Downloaded, Filesize, Validator from downloads where Filename=? and Location=? and Status='partial'", (filename, location)).fetchone()
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise downloadException('Error accessing database: {0}'.format(repr(error)))
+
+        return data
+
+    def getDownloadDigest(self, filename, location):
+        """ Return the digest (hex) of a complete download, None if the archive
+            is not downloaded or was downloaded without a digest
+        """
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                digest = cur.execute("select Digest from downloads where Filename=? and Location=? and Status='complete'", (filename, location)).fetchone()
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise downloadException('Error accessing database: {0}'.format(repr(error)))
+
+        return None if digest is None else digest[0]
+
     def getDownloadSize(self, filenane, location):
         """ Return the downloaded file size for a given archive filename
-            and download location
+            and download location, -1 unless the download is complete
         """
 
         with self.getConnection() as conn:
             try:
                 cur = conn.cursor()
-                size = cur.execute("select Filesize from downloads where Filename=? and Location=?", (filenane, location)).fetchone()
+                size = cur.execute("select Filesize from downloads where Filename=? and Location=? and Status='complete'", (filenane, location)).fetchone()
+                cur.close()
 
                 if size == None: size = (-1,)
 
@@ -1,13 +1,22 @@
 
 import os
+import zlib
+import shutil
 import tarfile
 from tarfile import TarError
 
 import re
 from re import RegexFlag
 
+from queue import Queue
+from threading import Thread
+
 from nafi.utils import LogEngine
 
+from nafi.metadata import MTLParser
+from nafi.digest import verifyArchive
+from nafi.exceptions import MTLParseError
+
 
 
 class landsatScene:
@@ -39,6 +48,7 @@ class landsatScene:
 
 
         self.archive = None
+        self.extracted = False
         self.bCleanup = True
         self.logger = LogEngine().logger
 
@@ -57,7 +67,11 @@ class landsatScene:
         if self.archive is not None:
             f_archive = os.path.join(outpath, self.archive)
 
-            if os.path.isfile(f_archive):
+            # Band files extracted while the archive was downloaded
+            if self.extracted and os.path.isdir(os.path.join(outpath, 'Bands')):
+                self.logger.info('Band files of %s extracted during download', os.path.basename(f_archive))
+
+            elif os.path.isfile(f_archive):
                 self.logger.info('Extracting downloaded file: %s', os.path.basename(f_archive))
 
                 try:
@@ -66,6 +80,8 @@ class landsatScene:
 
                 except (IOError, TarError, EOFError) as error:
                     self.logger.critical('Error decompressing %s: %s', os.path.basename(f_archive), error.args)
+                    if verifyArchive(f_archive) is False:
+                        self.logger.critical('%s is corrupted: its digest differs from the one downloaded', os.path.basename(f_archive))
                     outpath = None
             else:
                 self.logger.critical('Data tar file: %s not found', os.path.basename(f_archive))
@@ -76,6 +92,26 @@ class landsatScene:
 
         return None if outpath is None else os.path.join(outpath, 'Bands')
 
+    def readMetadata(self, target_directory, suffix='_MTL.txt'):
+        """ Parse the scene metadata file (MTL by default, or ANG with the '_ANG.txt'
+            suffix) straight from the downloaded archive, without extracting it. Used to
+            triage scenes (sun elevation, cloud cover, processing level) before the bands
+            are extracted. Returns the metadata dictionary, None on error
+        """
+
+        mdata = None
+
+        if self.archive is not None:
+            f_archive = os.path.join(target_directory, self.directory, self.archive)
+
+            try:
+                mdata = MTLParser().parsearchive(f_archive, suffix)
+
+            except MTLParseError as error:
+                self.logger.critical('Error reading scene metadata: %s', error.args)
+
+        return mdata
+
 
     def setTarArchive(self, archive=None):
         self.archive = archive
@@ -83,6 +119,9 @@ class landsatScene:
     def getTarArchive(self):
         return self.archive
 
+    def setExtracted(self, flag=True):
+        self.extracted = flag
+
 
     def endMarker(self):
         return self.marker
@@ -121,3 +160,104 @@ class landsatScene:
     def __repr__(self):
 
         return 'Scene [Sensor: {0}, PATH/ROW: [{1}/{2}], date: [MMDDYYYY]={3}'.format(self.metadata.sensor, self.path, self.row, self.acqdate)
+
+
+class bandExtractor:
+    """ Extract the band files ('_Bx.TIF') of a scene archive while it is being downloaded:
+        the downloader writes the archive bytes with 'write', a thread decompresses them
+        (tarfile stream 'r|gz') into 'target_directory'. 'close' returns once the archive
+        has been read, True if all its band files have been extracted
+    """
+
+    # Archive chunks waiting to be decompressed
+    backlog = 64
+
+    bandPattern = re.compile(r'_B(\d+)\.TIF$', flags=RegexFlag.IGNORECASE)
+
+    def __init__(self, target_directory):
+
+        self.directory = target_directory
+        self.logger = LogEngine().logger
+
+        self.chunks = Queue(maxsize=bandExtractor.backlog)
+        self.buffer = bytearray()
+        self.eof = False
+        self.bands = []
+        self.done = False
+        self.error = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.thread = Thread(target=self.extract, name='Extractor', daemon=True)
+        self.thread.start()
+
+        return
+
+    def write(self, chunk):
+        """ Queue archive bytes for decompression, blocks while the backlog is full
+        """
+
+        self.chunks.put(bytes(chunk))
+        return
+
+    def close(self):
+        """ Signal the end of the archive and wait for the extraction. Returns True if the
+            archive has been read without error, False otherwise (truncated download...)
+        """
+
+        self.chunks.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            self.logger.warning('Band files extraction during download failed: %s', repr(self.error))
+
+        return self.done
+
+    def read(self, size=-1):
+        """ File object interface of the archive stream, for tarfile
+        """
+
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.eof = True
+            else:
+                self.buffer += chunk
+
+        if size < 0:
+            size = len(self.buffer)
+
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+
+        return data
+
+    def extract(self):
+        """ Thread: decompress the archive stream, extract the band files. The stream
+            is always read to its end, the downloader never waits on a failed extraction
+        """
+
+        try:
+            with tarfile.open(fileobj=self, mode='r|gz') as tar:
+                for member in tar:
+                    name = os.path.basename(member.name)
+                    if not member.isfile() or bandExtractor.bandPattern.search(name) is None:
+                        continue
+
+                    with tar.extractfile(member) as source, open(os.path.join(self.directory, name), 'wb') as target:
+                        shutil.copyfileobj(source, target, 1024 * 1024)
+                    self.bands.append(name)
+
+            self.done = True
+
+        except (IOError, TarError, EOFError, zlib.error) as error:
+            self.error = error
+
+        finally:
+            # Discard the rest of the stream (end of archive padding, or after an error)
+            self.buffer = bytearray()
+            while not self.eof:
+                if self.chunks.get() is None:
+                    self.eof = True
+
+        return
@@ -1,27 +1,160 @@
 
 import os, sys
+import time
 import datetime
 import logging
 
 import re
-from re import RegexFlag
 import dateutil.parser as iso8601
 import gzip
+import pickle
+import tarfile
 
 import sqlite3
 
+from queue import Queue
+from threading import Thread
+from concurrent.futures import ProcessPoolExecutor
+
 from contextlib import contextmanager
 from abc import abstractmethod
 
 from robobrowser import RoboBrowser as rb
+from requests.exceptions import RequestException
+
+# NumPy is only needed by the 'numpy' result mode of the scene queries
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from nafi.utils import LogEngine
 from nafi.utils import benchmark
 from nafi.utils import Globals
 
+from nafi.database import connectionPool
+from nafi.cache import queryCache
+from nafi.products import decodeProductID, decodeProductIDs
+
 from nafi.exceptions import metadataException
 from nafi.exceptions import MTLParseError
 
+
+def pointInPolygon(point, polygon):
+    """ Ray casting test: return True if the point (lon, lat) lies inside
+        the polygon [(lon, lat), ...]
+    """
+
+    x, y = point
+    inside = False
+
+    for i in range(len(polygon)):
+        x1, y1 = polygon[i - 1]
+        x2, y2 = polygon[i]
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+
+    return inside
+
+
+def segmentsIntersect(p1, p2, q1, q2):
+    """ Return True if the segments [p1, p2] and [q1, q2] intersect
+    """
+
+    def orientation(a, b, c):
+        value = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+        return (value > 0) - (value < 0)
+
+    def onSegment(a, b, c):
+        return min(a[0], b[0]) <= c[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= c[1] <= max(a[1], b[1])
+
+    o1, o2 = orientation(p1, p2, q1), orientation(p1, p2, q2)
+    o3, o4 = orientation(q1, q2, p1), orientation(q1, q2, p2)
+
+    if o1 != o2 and o3 != o4:
+        return True
+
+    # collinear cases
+    return (o1 == 0 and onSegment(p1, p2, q1)) or (o2 == 0 and onSegment(p1, p2, q2)) or \
+           (o3 == 0 and onSegment(q1, q2, p1)) or (o4 == 0 and onSegment(q1, q2, p2))
+
+
+def polygonsIntersect(polygon1, polygon2):
+    """ Return True if the polygons [(lon, lat), ...] overlap, i.e. two of
+        their edges intersect or one polygon lies inside the other
+    """
+
+    for i in range(len(polygon1)):
+        for j in range(len(polygon2)):
+            if segmentsIntersect(polygon1[i - 1], polygon1[i], polygon2[j - 1], polygon2[j]):
+                return True
+
+    return pointInPolygon(polygon1[0], polygon2) or pointInPolygon(polygon2[0], polygon1)
+
+
+def acquisitionDays(dates):
+    """ Return the tuples (day number, year, day of year) of ISO dates 'YYYY-MM-DD', the day
+        number counting the days since 1970-01-01, (None, None, None) for invalid dates.
+        The distinct dates (a few thousands in the bulk metadata file) are converted at once
+    """
+
+    unique = list(set(dates))
+    days = None
+
+    if numpy is not None:
+        try:
+            days = numpy.array(unique, dtype='datetime64[D]')
+        except (TypeError, ValueError):
+            days = None
+
+    if days is not None:
+        years = days.astype('datetime64[Y]')
+        numbers = days.astype(numpy.int64).tolist()
+        doys = (days - years.astype('datetime64[D]')).astype(numpy.int64) + 1
+        converted = zip(numbers, (years.astype(numpy.int64) + 1970).tolist(), doys.tolist())
+        lookup = {date: (None, None, None) if nat else values for date, values, nat in zip(unique, converted, numpy.isnat(days).tolist())}
+
+    else:
+        lookup = {}
+        for date in unique:
+            try:
+                day = datetime.date.fromisoformat(date)
+                lookup[date] = (day.toordinal() - landsat8Manager.epoch, day.year, day.timetuple().tm_yday)
+            except (TypeError, ValueError):
+                lookup[date] = (None, None, None)
+
+    return [lookup[date] for date in dates]
+
+
+def parseL8Lines(lines, indices):
+    """ Extract the relevant metadata fields from lines of the bulk CSV file, followed by
+        the acquisition day columns and the product ID columns (processing date, correction
+        level) decoded column-wise. Defined at module level to be run by a process pool
+    """
+
+    records = [tuple(metas[i] for i in indices) for metas in (line.rstrip('\n').split(',') for line in lines)]
+    acqdate = landsat8Manager.columns.index('acqdate')
+    product_id = landsat8Manager.columns.index('Product_ID')
+
+    days = acquisitionDays([record[acqdate] for record in records])
+    products = decodeProductIDs([record[product_id] for record in records], ['procdate', 'correction'])
+
+    return [record + day + product for record, day, product in zip(records, days, zip(products['procdate'], products['correction']))]
+
+
+def parseL8Range(f_L8meta, start, end, indices):
+    """ Extract the relevant metadata fields from the lines of the plain CSV
+        file found between the byte offsets 'start' and 'end' (aligned on line
+        boundaries). Defined at module level to be run by a process pool
+    """
+
+    with open(f_L8meta, 'rb') as fp:
+        fp.seek(start)
+        data = fp.read(end - start)
+
+    return parseL8Lines(data.decode().splitlines(), indices)
+
+
 class metadata:
     """ Landsat platforms metadata base class. Holds download URLs, and sensor
         characterisitics and Landsat products naming convention
@@ -38,6 +171,9 @@ class metadata:
 
     bandCount = {'OLI_TIRS':11, 'ETM+':8, 'LT5':6}
 
+    # Scene records are created by the thousands: no per-instance dictionary
+    __slots__ = ('sensor', 'coll_number', 'coll_type', 'path', 'row', 'acqdate', 'scene_id', 'product_id', 'cc_land')
+
 
     def __init__(self):
 
@@ -71,39 +207,30 @@ class metadata:
             https://landsat.usgs.gov/what-are-naming-conventions-landsat-scene-identifiers
         """
 
-        pattern = r'^L([a-zA-Z]{1})([0-9]{2})_([a-zA-Z0-9]{4})_(\d{6})_(\d{8})_(\d{8})_(\d{2})_([a-zA-Z0-9]{2})_B(\d+)\.TIF$'
-        re_compile = re.match(pattern, filename, RegexFlag.IGNORECASE)
-
-        if re_compile is not None:
+        title, caption1, caption2, caption3 = 'Scene details:', '', '', ''
 
-            groups = re_compile.groups()
+        fields = decodeProductID(filename)
 
-            if len(groups) == 9:
+        if fields is not None:
 
-                attributes = []
-                x = metadata.sensors[groups[0]]
-                ss = metadata.satellites[groups[1]]
-                attributes.append('{0}, sensor: \'{1}\''.format(ss, x))
-                caption1 = ' '.join(attributes)
+            attributes = []
+            x = metadata.sensors.get(fields.sensor, fields.sensor)
+            ss = metadata.satellites.get(fields.satellite, fields.satellite)
+            attributes.append('{0}, sensor: \'{1}\''.format(ss, x))
+            caption1 = ' '.join(attributes)
 
-                attributes = []
-                llll = metadata.corrections[groups[2]]
-                attributes.append('Correction level: \'{0}\','.format(llll))
+            attributes = []
+            llll = metadata.corrections.get(fields.correction, fields.correction)
+            attributes.append('Correction level: \'{0}\','.format(llll))
+            attributes.append('Processing date: \'{0}\''.format(fields.procdate))
+            caption2 = ' '.join(attributes)
 
-                date = groups[5]
-                attributes.append('Processing date: \'{0}\''.format(date))
-                caption2 = ' '.join(attributes)
+            attributes = []
+            attributes.append('Collection number: \'{0}\','.format(fields.collection))
 
-                attributes = []
-                cc = int(groups[6])
-                attributes.append('Collection number: \'{0}\','.format(cc))
-
-                tx = metadata.ccategories[groups[7]]
-                attributes.append('Collection category: \'{0}\''.format(tx))
-                caption3 = ' '.join(attributes)
-
-                #details = ' '.join(attributes)
-                title = 'Scene details:'
+            tx = metadata.ccategories.get(fields.category, fields.category)
+            attributes.append('Collection category: \'{0}\''.format(tx))
+            caption3 = ' '.join(attributes)
 
         return  title, caption1, caption2, caption3
 
@@ -113,11 +240,11 @@ class L8metadata(metadata):
         Only a selected subset of metadata is used
     """
 
-    def __init__(self, fields):
+    __slots__ = ()
 
-        # Call base class constructor
-        super(L8metadata, self).__init__()
+    def __init__(self, fields):
 
+        # All the base class fields are set from the query results
         self.sensor = fields[0]
         self.coll_number = fields[1]
         self.coll_type = fields[2]
@@ -153,11 +280,84 @@ class landsat8Manager():
         and managing all records in landsat8Metadata.db
     """
 
+    # Scene footprint corners (decimal degrees), in the order UL, UR, LR, LL
+    footprint = ['UL_Lat', 'UL_Lon', 'UR_Lat', 'UR_Lon', 'LR_Lat', 'LR_Lon', 'LL_Lat', 'LL_Lon']
+
+    # Acquisition date as integers: days since 1970-01-01, year and day of year
+    days = ['Day_Number', 'Year', 'DOY']
+    epoch = datetime.date(1970, 1, 1).toordinal()
+
+    # Product ID fields: processing date and correction level
+    product = ['Proc_date', 'Corr_level']
+
+    # 'scene_meta' columns filled from the bulk metadata file
+    columns = ['Sensor', 'Coll_number', 'Coll_category', 'Path', 'Row', 'acqdate', 'Scene_ID', 'Product_ID', 'CC_Full', 'CC_Land', 'DayNight'] + footprint + days + product
+
+    # Staging table used by incremental imports
+    staging = 'tmp_meta'
+
+    # Secondary indexes on 'scene_meta'. 'idx_scene_lookup' matches the access pattern
+    # of 'getSceneProductIDs' (equality on Path/Row, range on acqdate, filter on CC_Land)
+    # and covers all its selected columns, the table itself is never read. The tier and
+    # product ID filters are evaluated on the index as well
+    # 'idx_scene_season' serves the seasonal lookups (range on the day of year, then on the day number)
+    indexes = {'idx_scene_lookup': 'scene_meta(Path, Row, acqdate, CC_Land, Sensor, Coll_number, Coll_category, Scene_ID, Product_ID, Proc_date, Corr_level)',
+               'idx_scene_season': 'scene_meta(Path, Row, DOY, Day_Number, CC_Land)'}
+
+    # Pragmas applied to the connection of a bulk load session
+    bulkPragmas = [('journal_mode', 'WAL'), ('synchronous', 'NORMAL'), ('cache_size', -262144), ('temp_store', 'MEMORY')]
+
+    # Maximum number of path/row pairs resolved by one batch query (SQLite host parameters limit)
+    batchSize = 400
+
+    # Layout of the NumPy structured arrays returned by the 'numpy' result mode
+    sceneDtype = [('sensor', 'U8'), ('coll_number', 'i1'), ('coll_type', 'U2'), ('path', 'i2'), ('row', 'i2'),
+                  ('acqdate', 'datetime64[D]'), ('scene_id', 'U21'), ('product_id', 'U40'), ('cc_land', 'f4')]
+
+    # Result modes of the scene queries
+    resultModes = ['objects', 'tuples', 'numpy']
+
+    # Scene lookup by path/row, acquisition dates and land cloud cover
+    sceneQuery = """\
+                    select Sensor, Coll_number, Coll_Category, Path, Row, acqdate, Scene_ID, Product_ID, CC_Land from scene_meta
+                    where Path=? and Row=? and acqdate>=? and acqdate<=? and CC_Land<=? order by acqdate asc;"""
+
+    # Scene lookup with additional conditions {0} (season, tiers, processing date...)
+    filterQuery = """\
+                    select Sensor, Coll_number, Coll_Category, Path, Row, acqdate, Scene_ID, Product_ID, CC_Land from scene_meta
+                    where Path=? and Row=? and {0} and CC_Land<=? order by acqdate asc;"""
+
+    # Land cloud cover thresholds (%) of the 'cc_summary' scene counts
+    ccThresholds = [10, 20, 30, 50]
+
+    # Monthly land cloud cover statistics of the scenes selected by {0}. The median is
+    # the mean of the one or two middle values of each month cloud covers
+    summaryQuery = """\
+                    insert into cc_summary
+                    with scenes as (
+                        select s.Path, s.Row, cast(strftime('%Y', s.acqdate) as integer) as Year,
+                               cast(strftime('%m', s.acqdate) as integer) as Month, s.CC_Land,
+                               row_number() over win as rank, count() over win as n
+                        from {0}
+                        where s.CC_Land >= 0
+                        window win as (partition by s.Path, s.Row, strftime('%Y-%m', s.acqdate) order by s.CC_Land)
+                    )
+                    select Path, Row, Year, Month, count(), avg(CC_Land),
+                           avg(case when rank in ((n + 1) / 2, (n + 2) / 2) then CC_Land end), {1}
+                    from scenes group by Path, Row, Year, Month;"""
+
+    # Query result caches, one per database file. The results are valid
+    # as long as the latest 'journal_meta' record stays the same
+    caches = {}
+    journalQuery = 'select max(ID) from journal_meta;'
+
     def __init__(self):
 
         self.wfname = r'landsat8Metadata'
         self.rootdir = self.getRootDirectory()
+        self.session = None
         self.initDatabase()
+        self.cache = self.getCache()
 
         return
 
@@ -170,27 +370,75 @@ class landsat8Manager():
         else:
             return os.path.join('', Globals.METADATA_LC8_BASEDIR)
 
+    def getDatabaseName(self):
+        """ Return the SQLite database file name
+        """
+
+        return os.path.join(self.rootdir, '{0}.db'.format(self.wfname))
+
+    def getCache(self):
+        """ Return the query result cache shared by the managers of the database,
+            None if disabled ('Globals.METADATA_CACHE_SIZE' set to 0). With
+            'Globals.METADATA_CACHE_DISK', results are also kept in 'landsat8Cache.db'
+            and reused by the next processes until the metadata is updated
+        """
+
+        if Globals.METADATA_CACHE_SIZE <= 0:
+            return None
+
+        db_name = self.getDatabaseName()
+
+        if db_name not in landsat8Manager.caches:
+            filename = os.path.join(self.rootdir, 'landsat8Cache.db') if Globals.METADATA_CACHE_DISK else None
+            landsat8Manager.caches[db_name] = queryCache(Globals.METADATA_CACHE_SIZE, filename)
+
+        return landsat8Manager.caches[db_name]
+
+    def fetchScenes(self, cur, query, parameters):
+        """ Execute a scene query and return all its rows, from the result cache when possible
+        """
+
+        if self.cache is None:
+            return cur.execute(query, parameters).fetchall()
+
+        key = (query, tuple(parameters))
+        token = self.cache.getToken(cur.connection, landsat8Manager.journalQuery)
+
+        data = self.cache.get(key, token)
+
+        if data is None:
+            data = cur.execute(query, parameters).fetchall()
+            self.cache.put(key, token, data)
+
+        return data
+
     @contextmanager
     def getConnection(self):
-        """ Manage the connection with the SQLite database and enable
-            foreign keys support. The connection is wrapped within a
-            context manager generator
+        """ Manage the connection with the SQLite database. The thread persistent
+            connection (foreign keys support enabled) is taken from the shared pool
+            and wrapped within a context manager generator. During a bulk load session,
+            the session connection is returned and the commit is left to the session
         """
 
-        try:
-            if os.path.exists(self.rootdir) is False:
-                os.makedirs(self.rootdir)
-            db_name = os.path.join(self.rootdir, '{0}.db'.format(self.wfname))
-            conn = sqlite3.connect(db_name)
+        if self.session is not None:
+            try:
+                yield self.session
 
-            # Enable foreign key support for database
-            cur = conn.cursor()
-            cur.execute('pragma foreign_keys = on;')
+            except Exception as error:
+                raise metadataException('Metadata Database Error: {0}'.format(repr(error)))
+
+            return self.session
+
+        conn = None
+
+        try:
+            conn = connectionPool.getConnection(self.getDatabaseName())
 
             yield conn
 
         except Exception as error:
-            conn.rollback()
+            if conn is not None:
+                conn.rollback()
             raise metadataException('Downloader Database Error: {0}'.format(repr(error)))
 
         else:
@@ -199,10 +447,62 @@ class landsat8Manager():
 
         return conn
 
+    @contextmanager
+    def bulkLoad(self, drop_indexes=True):
+        """ Bulk load session. All the calls made within the session share one
+            connection and one transaction, tuned for bulk imports (WAL journal,
+            large page cache, in-memory temporary storage). The secondary indexes are
+            dropped at the beginning of the session (if 'drop_indexes' is set) and rebuilt
+            once the data are committed, then the query planner statistics are updated.
+            Any error rolls back the whole session
+        """
+
+        if self.session is not None:
+            raise metadataException('A bulk load session is already opened')
+
+        conn = sqlite3.connect(self.getDatabaseName(), check_same_thread=False)
+
+        try:
+            cur = conn.cursor()
+            for pragma, value in landsat8Manager.bulkPragmas:
+                cur.execute('pragma {0} = {1};'.format(pragma, value))
+            cur.execute('pragma foreign_keys = on;')
+            cur.close()
+
+            self.session = conn
+
+            if drop_indexes:
+                self.dropIndexes()
+
+            yield self
+
+            conn.commit()
+
+            if drop_indexes:
+                self.createIndexes()
+
+            conn.execute('analyze;')
+            conn.commit()
+
+        except Exception as error:
+            conn.rollback()
+            if isinstance(error, metadataException):
+                raise
+            raise metadataException('Bulk load error: {0}'.format(repr(error)))
+
+        finally:
+            self.session = None
+            conn.close()
+
+        return
+
     def initDatabase(self):
 
         self.createJournalTable()
         self.createMetadataTable()
+        self.createSummaryTables()
+        self.createCheckpointTable()
+        self.createIndexes()
         return
 
     def createJournalTable(self):
@@ -219,10 +519,24 @@ class landsat8Manager():
                                     last_update DATE NOT NULL,
                                     archive_size INTEGER NOT NULL,
                                     all_records INTEGER NOT NULL,
-                                    RT_records INTEGER NOT NULL
+                                    RT_records INTEGER NOT NULL,
+                                    inserted_records INTEGER DEFAULT 0,
+                                    updated_records INTEGER DEFAULT 0,
+                                    deleted_records INTEGER DEFAULT 0,
+                                    rows_per_sec REAL DEFAULT 0,
+                                    etag VARCHAR(100),
+                                    last_modified VARCHAR(40)
                             );""")
                 cur.close()
 
+                # Upgrade journal tables created by earlier versions
+                self.addMissingColumns(conn, 'journal_meta', [('inserted_records', 'INTEGER DEFAULT 0'),
+                                                              ('updated_records', 'INTEGER DEFAULT 0'),
+                                                              ('deleted_records', 'INTEGER DEFAULT 0'),
+                                                              ('rows_per_sec', 'REAL DEFAULT 0'),
+                                                              ('etag', 'VARCHAR(100)'),
+                                                              ('last_modified', 'VARCHAR(40)')])
+
             except sqlite3.OperationalError as error:
                 cur.close()
                 raise metadataException(repr(error))
@@ -232,15 +546,33 @@ class landsat8Manager():
                 raise metadataException('Error creating table database \'journal_meta\'')
         return
 
-    def createMetadataTable(self):
-        """ Create the main table holding every Landsat8 metadata since 2013
+    def addMissingColumns(self, conn, table, columns):
+        """ Add to 'table' the columns [(name, declaration), ...] missing from
+            a database created by an earlier version of the module. Returns the added columns
+        """
+
+        added = []
+        cur = conn.cursor()
+        existing = [info[1].lower() for info in cur.execute('pragma table_info({0})'.format(table)).fetchall()]
+
+        for name, declaration in columns:
+            if name.lower() not in existing:
+                cur.execute('alter table {0} add column {1} {2}'.format(table, name, declaration))
+                added.append(name)
+
+        cur.close()
+        return added
+
+    def createMetadataTable(self, table='scene_meta'):
+        """ Create the main table holding every Landsat8 metadata since 2013.
+            The staging table used by incremental imports shares the same layout
         """
 
         with self.getConnection() as conn:
             try:
                 cur = conn.cursor()
                 cur.execute("""\
-                                CREATE TABLE IF NOT EXISTS scene_meta
+                                CREATE TABLE IF NOT EXISTS {0}
                                 (
                                     ID INTEGER PRIMARY KEY AUTOINCREMENT,
                                     Sensor VARCHAR(10),
@@ -254,10 +586,37 @@ class landsat8Manager():
                                     CC_Full REAL,
                                     CC_Land REAL,
                                     DayNight VARCHAR(6),
+                                    UL_Lat REAL, UL_Lon REAL,
+                                    UR_Lat REAL, UR_Lon REAL,
+                                    LR_Lat REAL, LR_Lon REAL,
+                                    LL_Lat REAL, LL_Lon REAL,
+                                    Day_Number INTEGER, Year INTEGER, DOY INTEGER,
+                                    Proc_date DATE, Corr_level VARCHAR(4),
                                     UNIQUE(Product_ID)
-                            );""")
+                            );""".format(table))
                 cur.close()
 
+                # Upgrade metadata tables created by earlier versions
+                self.addMissingColumns(conn, table, [(name, 'REAL') for name in landsat8Manager.footprint])
+
+                if self.addMissingColumns(conn, table, [(name, 'INTEGER') for name in landsat8Manager.days]):
+                    cur = conn.cursor()
+                    cur.execute("""\
+                                    update {0} set Day_Number=cast(julianday(acqdate) - julianday('1970-01-01') as integer),
+                                    Year=cast(strftime('%Y', acqdate) as integer), DOY=cast(strftime('%j', acqdate) as integer);""".format(table))
+                    cur.close()
+
+                if self.addMissingColumns(conn, table, [('Proc_date', 'DATE'), ('Corr_level', 'VARCHAR(4)')]):
+                    cur = conn.cursor()
+                    cur.execute("""\
+                                    update {0} set Proc_date=substr(Product_ID, 27, 4) || '-' || substr(Product_ID, 31, 2) || '-' || substr(Product_ID, 33, 2),
+                                    Corr_level=upper(substr(Product_ID, 6, 4)) where length(Product_ID) = 40 and substr(Product_ID, 26, 1) = '_';""".format(table))
+
+                    # The lookup index gains the new columns
+                    if table == 'scene_meta':
+                        cur.execute('drop index if exists idx_scene_lookup;')
+                    cur.close()
+
             #UNIQUE(Scene_ID, Product_ID)
             
             except sqlite3.OperationalError as error:
@@ -266,62 +625,699 @@ class landsat8Manager():
 
             except sqlite3.Error:
                 cur.close()
-                raise metadataException('Error creating table database \'scene_meta\'')
+                raise metadataException('Error creating table database \'{0}\''.format(table))
+        return
+
+    def createIndexes(self):
+        """ Create the secondary indexes of 'scene_meta', if they don't exist.
+            Bulk imports drop them beforehand and rebuild them once loaded.
+
+            The scene footprints bounding boxes are indexed by the R-tree 'scene_rtree',
+            kept up to date by triggers on 'scene_meta'. When the triggers are missing
+            (new database or bulk import), the R-tree is rebuilt before creating them
+        """
+
+        lon = ', '.join(['new.{0}'.format(c) for c in landsat8Manager.footprint[1::2]])
+        lat = ', '.join(['new.{0}'.format(c) for c in landsat8Manager.footprint[0::2]])
+        bbox = 'new.ID, min({0}), max({0}), min({1}), max({1})'.format(lon, lat)
+        valid = 'typeof(new.UL_Lat) = \'real\' and typeof(new.LR_Lon) = \'real\''
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                for name, definition in landsat8Manager.indexes.items():
+                    cur.execute('create index if not exists {0} on {1};'.format(name, definition))
+
+                cur.execute('create virtual table if not exists scene_rtree using rtree(ID, min_lon, max_lon, min_lat, max_lat);')
+
+                triggers = cur.execute("select count() from sqlite_master where type='trigger' and name like 'scene_rtree_%'").fetchone()[0]
+
+                if triggers == 0:
+                    cur.execute('delete from scene_rtree;')
+                    cur.execute('insert into scene_rtree select {0} from scene_meta new where {1};'.format(bbox, valid))
+
+                    cur.execute("""\
+                                    create trigger scene_rtree_insert after insert on scene_meta when {1}
+                                    begin insert into scene_rtree values ({0}); end;""".format(bbox, valid))
+                    cur.execute("""\
+                                    create trigger scene_rtree_update after update of {2} on scene_meta
+                                    begin
+                                        delete from scene_rtree where ID = old.ID;
+                                        insert into scene_rtree select {0} where {1};
+                                    end;""".format(bbox, valid, ', '.join(landsat8Manager.footprint)))
+                    cur.execute("""\
+                                    create trigger scene_rtree_delete after delete on scene_meta
+                                    begin delete from scene_rtree where ID = old.ID; end;""")
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error creating indexes on \'scene_meta\': {0}'.format(repr(error)))
+
+        self.createSummaryTriggers()
+
+        return
+
+    def dropIndexes(self):
+        """ Drop the secondary indexes of 'scene_meta' and the R-tree triggers
+            before a bulk import
+        """
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                for name in landsat8Manager.indexes:
+                    cur.execute('drop index if exists {0};'.format(name))
+                for name in ['scene_rtree_insert', 'scene_rtree_update', 'scene_rtree_delete',
+                             'cc_summary_insert', 'cc_summary_update', 'cc_summary_delete']:
+                    cur.execute('drop trigger if exists {0};'.format(name))
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error dropping indexes on \'scene_meta\': {0}'.format(repr(error)))
+        return
+
+    def createSummaryTables(self):
+        """ Create the land cloud cover summary table 'cc_summary': number of scenes, mean
+            and median land cloud cover and number of scenes under each of the 'ccThresholds'
+            per path/row, year and month. The months whose scenes were modified since the
+            last refresh are listed in 'cc_summary_dirty'
+        """
+
+        thresholds = ''.join(['Under{0} INTEGER, '.format(threshold) for threshold in landsat8Manager.ccThresholds])
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""\
+                                CREATE TABLE IF NOT EXISTS cc_summary
+                                (
+                                    Path INTEGER NOT NULL,
+                                    Row INTEGER NOT NULL,
+                                    Year INTEGER NOT NULL,
+                                    Month INTEGER NOT NULL,
+                                    Scenes INTEGER,
+                                    CC_Mean REAL,
+                                    CC_Median REAL,
+                                    {0}
+                                    PRIMARY KEY(Path, Row, Year, Month)
+                            ) WITHOUT ROWID;""".format(thresholds))
+                cur.execute("""\
+                                CREATE TABLE IF NOT EXISTS cc_summary_dirty
+                                (
+                                    Path INTEGER NOT NULL,
+                                    Row INTEGER NOT NULL,
+                                    Start DATE NOT NULL,
+                                    PRIMARY KEY(Path, Row, Start)
+                            ) WITHOUT ROWID;""")
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error creating table database \'cc_summary\': {0}'.format(repr(error)))
         return
 
-    def importMetadata(self, bulk_data):
-        """ import into 'tmp_meta' table the Landsat 8 metadata
+    def createSummaryTriggers(self):
+        """ Create the triggers recording the months modified in 'scene_meta'. When
+            they are missing (new database or bulk import), 'cc_summary' is rebuilt first
+        """
+
+        thresholds = ', '.join(['sum(CC_Land <= {0})'.format(threshold) for threshold in landsat8Manager.ccThresholds])
+        # Not an 'insert or ignore': the conflict clause would be overridden by the upsert of 'mergeStagingTable'
+        dirty = """\
+                    insert into cc_summary_dirty select {0}.Path, {0}.Row, date({0}.acqdate, 'start of month')
+                    where not exists (select 1 from cc_summary_dirty where Path={0}.Path and Row={0}.Row and Start=date({0}.acqdate, 'start of month'));"""
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                triggers = cur.execute("select count() from sqlite_master where type='trigger' and name like 'cc_summary_%'").fetchone()[0]
+
+                if triggers == 0:
+                    cur.execute('delete from cc_summary;')
+                    cur.execute('delete from cc_summary_dirty;')
+                    cur.execute(landsat8Manager.summaryQuery.format('scene_meta s', thresholds))
+
+                    cur.execute("""\
+                                    create trigger cc_summary_insert after insert on scene_meta
+                                    begin {0} end;""".format(dirty.format('new')))
+                    cur.execute("""\
+                                    create trigger cc_summary_update after update of Path, Row, acqdate, CC_Land on scene_meta
+                                    begin {0} {1} end;""".format(dirty.format('old'), dirty.format('new')))
+                    cur.execute("""\
+                                    create trigger cc_summary_delete after delete on scene_meta
+                                    begin {0} end;""".format(dirty.format('old')))
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error building table \'cc_summary\': {0}'.format(repr(error)))
+        return
+
+    def refreshCloudSummary(self):
+        """ Recompute the 'cc_summary' months listed in 'cc_summary_dirty', i.e. the ones whose
+            scenes were inserted, updated or deleted since the last refresh. Returns the number
+            of path/row months refreshed
+        """
+
+        thresholds = ', '.join(['sum(CC_Land <= {0})'.format(threshold) for threshold in landsat8Manager.ccThresholds])
+        months = """\
+                    cc_summary_dirty d join scene_meta s
+                    on s.Path=d.Path and s.Row=d.Row and s.acqdate>=d.Start and s.acqdate<date(d.Start, '+1 month')"""
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                refreshed = cur.execute('select count() from cc_summary_dirty;').fetchone()[0]
+
+                if refreshed > 0:
+                    cur.execute("""\
+                                    delete from cc_summary where (Path, Row, Year, Month) in
+                                    (select Path, Row, cast(strftime('%Y', Start) as integer), cast(strftime('%m', Start) as integer)
+                                     from cc_summary_dirty);""")
+                    cur.execute(landsat8Manager.summaryQuery.format(months, thresholds))
+                    cur.execute('delete from cc_summary_dirty;')
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error refreshing table \'cc_summary\': {0}'.format(repr(error)))
+
+        return refreshed
+
+    def getCloudSummary(self, path, row, first_year=None, last_year=None, months=None):
+        """ Return the monthly land cloud cover statistics of a path/row, as a list of tuples
+            (Year, Month, Scenes, CC_Mean, CC_Median, Under10, Under20, ...) following 'ccThresholds',
+            ordered by year and month. The years and months ([1, 12]) can be restricted
+        """
+
+        columns = ', '.join(['Year', 'Month', 'Scenes', 'CC_Mean', 'CC_Median'] + ['Under{0}'.format(t) for t in landsat8Manager.ccThresholds])
+        conditions = ['Path=?', 'Row=?']
+        parameters = [int(path), int(row)]
+
+        if first_year is not None:
+            conditions.append('Year>=?')
+            parameters.append(first_year)
+        if last_year is not None:
+            conditions.append('Year<=?')
+            parameters.append(last_year)
+        if months:
+            conditions.append('Month in ({0})'.format(', '.join(['?'] * len(months))))
+            parameters.extend(months)
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                data = cur.execute('select {0} from cc_summary where {1} order by Year, Month;'.format(columns, ' and '.join(conditions)), parameters).fetchall()
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error accessing table database \'cc_summary\': {0}'.format(repr(error)))
+
+        return data
+
+    def getSeasonalAvailability(self, path, row, months=None, threshold=20):
+        """ Summarize, month by month over all the archive years, the scenes of a path/row
+            acquired with a land cloud cover <= 'threshold' (one of 'ccThresholds'). Returns a
+            list of tuples (Month, Years, Scenes, Clear scenes, Mean land cloud cover)
+        """
+
+        if threshold not in landsat8Manager.ccThresholds:
+            raise metadataException('Cloud cover threshold must be one of {0}'.format(landsat8Manager.ccThresholds))
+
+        conditions = 'Path=? and Row=?'
+        parameters = [int(path), int(row)]
+
+        if months:
+            conditions += ' and Month in ({0})'.format(', '.join(['?'] * len(months)))
+            parameters.extend(months)
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                data = cur.execute("""\
+                                select Month, count(), sum(Scenes), sum(Under{0}), sum(Scenes * CC_Mean) / sum(Scenes)
+                                from cc_summary where {1} group by Month order by Month;""".format(threshold, conditions), parameters).fetchall()
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error accessing table database \'cc_summary\': {0}'.format(repr(error)))
+
+        return data
+
+    def createStagingTable(self):
+        """ Create an empty staging table 'tmp_meta', the bulk metadata file
+            is loaded there before being merged into 'scene_meta'
+        """
+
+        self.dropStagingTable()
+        self.createMetadataTable(landsat8Manager.staging)
+        return
+
+    def swapStagingTable(self):
+        """ Replace 'scene_meta' with the staging table, within the current transaction:
+            concurrent readers see either the old or the new metadata. The indexes, R-tree
+            and cloud cover summary of the new table are rebuilt in the same transaction.
+
+            Returns the number of rows of the new 'scene_meta' (duplicate products
+            of the metadata file collapse into a single row)
+        """
+
+        with self.getConnection() as conn:
+            try:
+                # DDL statements don't open a transaction by themselves
+                if not conn.in_transaction:
+                    conn.execute('begin immediate;')
+
+                cur = conn.cursor()
+                inserted = cur.execute('select count() from {0};'.format(landsat8Manager.staging)).fetchone()[0]
+                cur.execute('drop table scene_meta;')
+                cur.execute('alter table {0} rename to scene_meta;'.format(landsat8Manager.staging))
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error swapping table \'{0}\' with \'scene_meta\': {1}'.format(landsat8Manager.staging, repr(error)))
+
+        self.createIndexes()
+
+        return inserted
+
+    def createCheckpointTable(self):
+        """ Create the table 'import_checkpoint' recording the progress of the import
+            into the staging table: metadata source, byte offset reached in the file,
+            records and chunks committed
+        """
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("""\
+                                CREATE TABLE IF NOT EXISTS import_checkpoint
+                                (
+                                    Source VARCHAR(255) PRIMARY KEY,
+                                    Offset INTEGER NOT NULL,
+                                    Records INTEGER NOT NULL,
+                                    Chunks INTEGER NOT NULL,
+                                    Updated DATE
+                            );""")
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error creating table database \'import_checkpoint\': {0}'.format(repr(error)))
+        return
+
+    def getCheckpoint(self, source):
+        """ Return the last checkpoint (offset, records, chunks) of an interrupted import
+            of 'source', None if there is none or if the staging table is gone
+        """
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                checkpoint = cur.execute('select Offset, Records, Chunks from import_checkpoint where Source=?;', (source,)).fetchone()
+                staging = cur.execute("select count() from sqlite_master where type='table' and name=?;", (landsat8Manager.staging,)).fetchone()[0]
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error accessing table database \'import_checkpoint\': {0}'.format(repr(error)))
+
+        return checkpoint if staging else None
+
+    def saveCheckpoint(self, source, offset, records, chunks):
+        """ Commit the records imported so far along with the checkpoint of 'source'.
+            Any checkpoint of another source is discarded
+        """
+
+        last = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                cur.execute('delete from import_checkpoint where Source<>?;', (source,))
+                cur.execute('insert or replace into import_checkpoint values (?, ?, ?, ?, ?);', (source, offset, records, chunks, last))
+                cur.close()
+
+                # Also commits a bulk load session
+                conn.commit()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error updating table database \'import_checkpoint\': {0}'.format(repr(error)))
+        return
+
+    def clearCheckpoint(self):
+        """ Execute the SQL 'delete from import_checkpoint', once the import is complete
+        """
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                cur.execute('delete from import_checkpoint;')
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error accessing table database \'import_checkpoint\': {0}'.format(repr(error)))
+        return
+
+    def dropStagingTable(self):
+        """ Execute the SQL 'drop table if exists tmp_meta'
+        """
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                cur.execute('drop table if exists {0}'.format(landsat8Manager.staging))
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error accessing database: {0}'.format(repr(error)))
+        return
+
+    def importMetadata(self, bulk_data, table='scene_meta'):
+        """ import into 'scene_meta' table (or the staging table 'tmp_meta') the Landsat 8
+            metadata. Duplicated product IDs are overwritten by the last record: replaced in
+            the staging table, updated in place (triggers fired) in 'scene_meta'
+        """
+
+        columns = ', '.join(landsat8Manager.columns)
+        values = ', '.join(['?'] * len(landsat8Manager.columns))
+
+        # Every reader must emit the derived columns (acquisition days, product ID columns)
+        if bulk_data and len(bulk_data[0]) != len(landsat8Manager.columns):
+            raise metadataException('Metadata records have {0} fields, {1} expected: {2}'.format(len(bulk_data[0]), len(landsat8Manager.columns), ', '.join(landsat8Manager.columns)))
+
+        if table == landsat8Manager.staging:
+            statement = 'insert or replace into {0} ({1}) values ({2});'.format(table, columns, values)
+        else:
+            updates = ', '.join(['{0}=excluded.{0}'.format(c) for c in landsat8Manager.columns])
+            statement = 'insert into {0} ({1}) values ({2}) on conflict(Product_ID) do update set {3};'.format(table, columns, values, updates)
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                cur.executemany(statement, bulk_data)
+
+                cur.close()
+
+            except sqlite3.OperationalError as error:
+                cur.close()
+                raise metadataException(repr(error))
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error importing data into table \'scene_meta\' : {0}'.format(repr(error)))
+        return
+
+    def mergeStagingTable(self):
+        """ Merge the staging table into 'scene_meta' within a single transaction:
+            new products are inserted, modified ones updated (upsert on Product_ID)
+            and products no longer listed in the bulk metadata file (e.g. RT scenes
+            superseded by T1/T2 scenes) deleted. 'scene_meta' remains queryable
+            until the transaction is committed.
+
+            Returns the tuple (inserted, updated, deleted)
+        """
+
+        staging = landsat8Manager.staging
+        columns = ', '.join(landsat8Manager.columns)
+        updates = ', '.join(['{0}=excluded.{0}'.format(c) for c in landsat8Manager.columns])
+        changes = ' or '.join(['{0} is not excluded.{0}'.format(c) for c in landsat8Manager.columns])
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+
+                cur.execute("""\
+                                delete from scene_meta where not exists
+                                (select 1 from {0} t where t.Product_ID = scene_meta.Product_ID);""".format(staging))
+                deleted = cur.rowcount
+
+                inserted = cur.execute("""\
+                                select count() from {0} t where not exists
+                                (select 1 from scene_meta s where s.Product_ID = t.Product_ID);""".format(staging)).fetchone()[0]
+
+                # 'where true' avoids the parsing ambiguity of 'select ... on conflict'
+                cur.execute("""\
+                                insert into scene_meta ({1}) select {1} from {0} where true
+                                on conflict(Product_ID) do update set {2} where {3};""".format(staging, columns, updates, changes))
+                updated = cur.rowcount - inserted
+
+                cur.close()
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error merging table \'{0}\' into \'scene_meta\': {1}'.format(staging, repr(error)))
+
+        return inserted, updated, deleted
+
+    @staticmethod
+    def formatScenes(data, mode='objects'):
+        """ Convert the scene query results (rows of 'sceneQuery' columns) according to 'mode':
+
+            'objects': list of L8metadata, one per scene
+            'tuples':  tuple of 9 column tuples (sensor, coll_number, coll_type, path, row,
+                       acqdate, scene_id, product_id, cc_land), no per-scene object created
+            'numpy':   NumPy structured array with the 'sceneDtype' layout
+        """
+
+        if mode == 'objects':
+            return [L8metadata(fields) for fields in data]
+
+        elif mode == 'tuples':
+            return tuple(zip(*data)) if data else tuple(() for _ in landsat8Manager.sceneDtype)
+
+        elif mode == 'numpy':
+            if numpy is None:
+                raise metadataException('The \'numpy\' result mode requires the NumPy package')
+            return numpy.array(data, dtype=landsat8Manager.sceneDtype)
+
+        raise metadataException('Unknown result mode: \'{0}\', expected one of {1}'.format(mode, landsat8Manager.resultModes))
+
+    @staticmethod
+    def dayRange(first, last):
+        """ SQL condition on the days of year [first, last], wrapping around the end
+            of the year when first > last (no index range scan in that case)
+        """
+
+        if first <= last:
+            return 'DOY between ? and ?', [first, last]
+
+        return '(DOY >= ? or DOY <= ?)', [first, last]
+
+    @staticmethod
+    def seasonCondition(months=None, doy=None):
+        """ Return the SQL condition on the day of year, and its parameters, selecting the season
+            given either by the months (first, last), e.g. (8, 10) for August to October, or by
+            the days of year (first, last). Seasons may wrap around the end of the year, e.g. (11, 2).
+            The month boundaries fall one day later in leap years: the days of both kinds of
+            years are selected through the index, the exact ones are filtered afterwards
+        """
+
+        if months is None:
+            first, last = doy
+            if not (1 <= first <= 366 and 1 <= last <= 366):
+                raise metadataException('Invalid days of year: {0}, expected (first, last) in [1, 366]'.format(repr(doy)))
+
+            return landsat8Manager.dayRange(first, last)
+
+        first, last = months
+        if not (1 <= first <= 12 and 1 <= last <= 12):
+            raise metadataException('Invalid months: {0}, expected (first, last) in [1, 12]'.format(repr(months)))
+
+        # Days of year of the season in a leap year, then in a common year
+        days = []
+        for year in (2000, 2001):
+            start = datetime.date(year, first, 1).timetuple().tm_yday
+            end = (datetime.date(year + last // 12, last % 12 + 1, 1) - datetime.timedelta(days=1)).timetuple().tm_yday
+            days.append(landsat8Manager.dayRange(start, end))
+
+        condition, parameters = landsat8Manager.dayRange(min(days[0][1][0], days[1][1][0]), max(days[0][1][1], days[1][1][1]))
+        condition = '{0} and (Year % 4 = 0 and {1} or Year % 4 != 0 and {2})'.format(condition, days[0][0], days[1][0])
+
+        return condition, parameters + days[0][1] + days[1][1]
+
+    def getSceneProductIDs(self, path, row, begin_date, end_date, cc_land=100., mode='objects', months=None, doy=None, tiers=None, processed_after=None):
+        """ Return the scenes of a path/row acquired between 'begin_date' and 'end_date' with a land
+            cloud cover <= 'cc_land', ordered by acquisition date. See 'formatScenes' for the result modes.
+            The scenes can be restricted to a season of every year, given by its 'months' or its
+            days of year 'doy' (see 'seasonCondition'), to collection categories 'tiers' (e.g. ['T1'])
+            and to the products processed on or after the date 'processed_after'
+        """
+
+        if months is None and doy is None and not tiers and processed_after is None:
+            query, parameters = landsat8Manager.sceneQuery, (path, row, begin_date, end_date, cc_land)
+
+        else:
+            conditions, parameters = [], [path, row]
+
+            if months is None and doy is None:
+                conditions.append('acqdate>=? and acqdate<=?')
+                parameters.extend([begin_date, end_date])
+            else:
+                condition, season = landsat8Manager.seasonCondition(months, doy)
+                try:
+                    days = [datetime.date.fromisoformat(str(date)[:10]).toordinal() - landsat8Manager.epoch for date in (begin_date, end_date)]
+                except ValueError as error:
+                    raise metadataException('Invalid date, expected YYYY-MM-DD: {0}'.format(repr(error)))
+                conditions.append('({0}) and Day_Number>=? and Day_Number<=?'.format(condition))
+                parameters.extend(season + days)
+
+            if tiers:
+                conditions.append('Coll_category in ({0})'.format(', '.join(['?'] * len(tiers))))
+                parameters.extend(tiers)
+
+            if processed_after is not None:
+                conditions.append('Proc_date>=?')
+                parameters.append(processed_after)
+
+            query, parameters = landsat8Manager.filterQuery.format(' and '.join(conditions)), tuple(parameters + [cc_land])
+
+        with self.getConnection() as conn:
+
+            try:
+                cur = conn.cursor()
+                data = self.fetchScenes(cur, query, parameters)
+                cur.close()
+
+                scenes_meta = self.formatScenes(data, mode)
+
+            except sqlite3.OperationalError as error:
+                cur.close()
+                raise metadataException(repr(error))
+
+            except sqlite3.Error as error:
+                cur.close()
+                message = 'Error accessing table database \'scene_meta\': {0}'.format(repr(error))
+                raise metadataException(message)
+
+        return scenes_meta
+
+    def getScenesByPathRow(self, pathrows, begin_date, end_date, cc_land=100.):
+        """ Batch version of 'getSceneProductIDs': the scenes of all the (path, row)
+            pairs are resolved with a single query (one per 'batchSize' pairs), each pair
+            being looked up through the covering index. Returns a dictionary
+            {(path, row): [L8metadata, ...]} with integer keys and the scenes ordered by
+            acquisition date. Pairs without any scene get an empty list
+        """
+
+        pairs = sorted(set((int(path), int(row)) for path, row in pathrows))
+        scenes_meta = dict((pair, []) for pair in pairs)
+
+        with self.getConnection() as conn:
+
+            try:
+                cur = conn.cursor()
+
+                for i in range(0, len(pairs), landsat8Manager.batchSize):
+
+                    batch = pairs[i:i + landsat8Manager.batchSize]
+                    values = ', '.join(['(?, ?)'] * len(batch))
+                    parameters = [value for pair in batch for value in pair] + [begin_date, end_date, cc_land]
+
+                    # 'cross join' keeps the path/row list as the outer loop of the join
+                    data = self.fetchScenes(cur, """\
+                                    with pathrows(p, r) as (values {0})
+                                    select s.Sensor, s.Coll_number, s.Coll_Category, s.Path, s.Row, s.acqdate, s.Scene_ID, s.Product_ID, s.CC_Land
+                                    from pathrows cross join scene_meta s on s.Path=pathrows.p and s.Row=pathrows.r
+                                    where s.acqdate>=? and s.acqdate<=? and s.CC_Land<=? order by s.Path, s.Row, s.acqdate asc;""".format(values), parameters)
+
+                    for fields in data:
+                        scenes_meta[(fields[3], fields[4])].append(L8metadata(fields))
+
+                cur.close()
+
+            except sqlite3.OperationalError as error:
+                cur.close()
+                raise metadataException(repr(error))
+
+            except sqlite3.Error as error:
+                cur.close()
+                message = 'Error accessing table database \'scene_meta\': {0}'.format(repr(error))
+                raise metadataException(message)
+
+        return scenes_meta
+
+    def getScenesIntersecting(self, geometry, begin_date, end_date, cc_land=100.):
+        """ Return the scenes [L8metadata, ...] whose footprint intersects 'geometry', acquired
+            between 'begin_date' and 'end_date' with a land cloud cover <= 'cc_land' and ordered
+            by acquisition date. 'geometry' is a point (lon, lat), a bounding box (min_lon, min_lat,
+            max_lon, max_lat) or a polygon [(lon, lat), ...], in decimal degrees.
+
+            Candidate scenes are selected through the R-tree index of the footprints bounding
+            boxes, then tested against the footprint itself
         """
 
+        scenes_meta = []
+
+        if isinstance(geometry[0], (tuple, list)):
+            polygon = [tuple(vertex) for vertex in geometry]
+            lons, lats = list(zip(*polygon))
+            bbox = (min(lons), min(lats), max(lons), max(lats))
+        elif len(geometry) == 2:
+            polygon = None
+            bbox = (geometry[0], geometry[1], geometry[0], geometry[1])
+        elif len(geometry) == 4:
+            bbox = tuple(geometry)
+            polygon = [(bbox[0], bbox[1]), (bbox[2], bbox[1]), (bbox[2], bbox[3]), (bbox[0], bbox[3])]
+        else:
+            raise metadataException('Invalid geometry: {0}'.format(repr(geometry)))
+
         with self.getConnection() as conn:
+
             try:
                 cur = conn.cursor()
-                cur.executemany("""\
-                                insert into scene_meta (Sensor, Coll_number, Coll_category, Path, Row, acqdate, Scene_ID , Product_ID, CC_Full, CC_Land, DayNight)
-                                values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);""", bulk_data)
-
+                data = self.fetchScenes(cur, """\
+                                select s.Sensor, s.Coll_number, s.Coll_Category, s.Path, s.Row, s.acqdate, s.Scene_ID, s.Product_ID, s.CC_Land, {0}
+                                from scene_rtree r join scene_meta s on s.ID=r.ID
+                                where r.max_lon>=? and r.min_lon<=? and r.max_lat>=? and r.min_lat<=?
+                                and s.acqdate>=? and s.acqdate<=? and s.CC_Land<=? order by s.acqdate asc;""".format(', '.join('s.' + c for c in landsat8Manager.footprint)),
+                                (bbox[0], bbox[2], bbox[1], bbox[3], begin_date, end_date, cc_land))
                 cur.close()
 
-            except sqlite3.OperationalError as error:
+            except sqlite3.Error as error:
                 cur.close()
-                raise metadataException(repr(error))
+                message = 'Error accessing table database \'scene_meta\': {0}'.format(repr(error))
+                raise metadataException(message)
 
-            except sqlite3.Error:
-                cur.close()
-                raise metadataException('Error importing data into table \'scene_meta\' : %s', repr(error))
-        return
+        for fields in data:
 
-    def getSceneProductIDs(self, path, row, begin_date, end_date, cc_land=100.):
+            corners = fields[9:]
+            footprint = [(corners[i + 1], corners[i]) for i in range(0, 8, 2)]
 
-        scenes_meta = []
-        
-        with self.getConnection() as conn:
+            if polygon is None:
+                hit = pointInPolygon(geometry, footprint)
+            else:
+                hit = polygonsIntersect(polygon, footprint)
 
-            try:
-                cur = conn.cursor()
-                
-#                data = cur.execute("""\
-#                                select Sensor, Coll_number, Coll_Category, Path, Row, acqdate, Scene_ID, Product_ID, CC_Land from scene_meta
-#                                where Path=? and Row=? and acqdate>=? and acqdate<=? order by acqdate asc;""", (path, row, '2018-02-01', '2018-03-8')).fetchall()
-                                
-                data = cur.execute("""\
-                                select Sensor, Coll_number, Coll_Category, Path, Row, acqdate, Scene_ID, Product_ID, CC_Land from scene_meta
-                                where Path=? and Row=? and acqdate>=? and acqdate<=? and CC_Land<=? order by acqdate asc;""", (path, row, begin_date, end_date, cc_land)).fetchall()
-                cur.close()
+            if hit:
+                scenes_meta.append(L8metadata(fields[:9]))
+
+        return scenes_meta
 
-                for fields in data:
-                    scenes_meta.append(L8metadata(fields))
+    def getQueryPlan(self, path, row, begin_date, end_date, cc_land=100.):
+        """ Return the 'EXPLAIN QUERY PLAN' details of the scene lookup
+            executed by 'getSceneProductIDs'
+        """
 
-            except sqlite3.OperationalError as error:
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                data = cur.execute('explain query plan ' + landsat8Manager.sceneQuery, (path, row, begin_date, end_date, cc_land)).fetchall()
                 cur.close()
-                raise metadataException(repr(error))
 
             except sqlite3.Error as error:
                 cur.close()
-                message = 'Error accessing table database \'scene_meta\': {0}'.format(repr(error))
-                raise metadataException(message)
+                raise metadataException('Error accessing table database \'scene_meta\': {0}'.format(repr(error)))
 
-        return scenes_meta
+        return [step[-1] for step in data]
 
     def getNumberofRecords(self, category=None):
         """ return number of records filtered by Collection Category
@@ -354,8 +1350,10 @@ class landsat8Manager():
 
         return n_records
 
-    def updateJournalTable(self, length):
-        """ import into 'journal_meta' Landsat 8 metadata last update
+    def updateJournalTable(self, length, inserted=0, updated=0, deleted=0, rate=0., etag=None, last_modified=None):
+        """ import into 'journal_meta' Landsat 8 metadata last update, the number
+            of records inserted, updated and deleted, the ingest rate (rows/s) and
+            the HTTP validators of the imported archive
         """
 
         last = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -366,8 +1364,8 @@ class landsat8Manager():
             try:
                 cur = conn.cursor()
                 cur.execute("""\
-                                insert into journal_meta (last_update, archive_size, all_records, RT_records)
-                                values (?, ?, ?, ?);""", (last, length, records, RTime))
+                                insert into journal_meta (last_update, archive_size, all_records, RT_records, inserted_records, updated_records, deleted_records, rows_per_sec, etag, last_modified)
+                                values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);""", (last, length, records, RTime, inserted, updated, deleted, rate, etag, last_modified))
 
                 cur.close()
 
@@ -378,8 +1376,35 @@ class landsat8Manager():
             except sqlite3.Error:
                 cur.close()
                 raise metadataException('Error creating table database \'scene_meta\'')
+
+        # The new journal record invalidates the cached results
+        if self.cache is not None:
+            self.cache.reset()
+
         return
 
+    def getLastValidators(self):
+        """ Return the HTTP validators (ETag, Last-Modified) of the bulk metadata
+            archive imported last, (None, None) if unknown
+        """
+
+        validators = (None, None)
+
+        with self.getConnection() as conn:
+            try:
+                cur = conn.cursor()
+                data = cur.execute('select etag, last_modified from journal_meta order by ID desc limit 1').fetchone()
+                cur.close()
+
+                if data is not None:
+                    validators = data
+
+            except sqlite3.Error as error:
+                cur.close()
+                raise metadataException('Error accessing table database \'journal_meta\': {0}'.format(repr(error)))
+
+        return validators
+
     def deleteAllRecords(self):
         """ Execute the SQL 'delete from scene_meta'
         """
@@ -392,18 +1417,37 @@ class landsat8Manager():
             except sqlite3.Error as error:
                 cur.close()
                 raise metadataException('Error accessing database: {0}'.format(repr(error)))
+
+        if self.cache is not None:
+            self.cache.clear()
+
         return
 
 
 class metaParser:
 
     metafields = ['sensor', 'collection_number', 'collection_category', 'path', 'row', 'acquisitiondate', 'sceneid',\
-                  'landsat_product_id', 'cloudcover', 'cloud_cover_land', 'dayornight']
+                  'landsat_product_id', 'cloudcover', 'cloud_cover_land', 'dayornight',\
+                  'upperleftcornerlatitude', 'upperleftcornerlongitude', 'upperrightcornerlatitude', 'upperrightcornerlongitude',\
+                  'lowerrightcornerlatitude', 'lowerrightcornerlongitude', 'lowerleftcornerlatitude', 'lowerleftcornerlongitude']
+
+    # Landsat 8 bulk metadata archive
+    metaURL = r'https://landsat.usgs.gov/landsat/metadata_service/bulk_metadata_files/LANDSAT_8_C1.csv.gz'
+
+    # Number of times an interrupted metadata download is resumed
+    retries = 5
+
+    # Content-Range of a partial response: bytes [first]-[last]/[archive size]
+    contentRange = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
     
     def __init__(self):
 
         self.records = 0
+        self.chunks = 0
+        self.source = None
         self.archive_length = -1
+        self.etag = None
+        self.last_modified = None
         self.dbase = landsat8Manager()
         self.logger = LogEngine().logger
         
@@ -459,44 +1503,295 @@ class metaParser:
         return indices
 
 
+    def openL8Metadata(self, source):
+        """ Return a binary stream over the Landsat 8 bulk metadata. The source
+            can be the plain CSV file, the downloaded gzipped archive (.gz) or
+            an HTTP response streaming the archive: the gzipped content is then
+            decompressed on the fly and never written to disk. Binary streams
+            report the byte offsets recorded by the import checkpoints
+        """
+
+        if isinstance(source, str):
+            if source.endswith('.gz'):
+                return gzip.open(source, 'rb')
+            else:
+                return open(source, 'rb')
+
+        # HTTP response (stream=True), read the raw gzipped payload
+        return gzip.GzipFile(fileobj=source.raw, mode='rb')
+
+    def readL8Metadata(self, fp, indices, chunk_size=pow(2, 24)):
+        """ Generator returning the relevant metadata fields as lists of tuples,
+            one list per chunk of 'chunk_size' bytes read from the binary stream 'fp'.
+            Only one chunk is held in memory at a time
+        """
+
+        idebug = 1
+
+        while True:
+
+            lines = b''.join(fp.readlines(chunk_size)).decode().splitlines()
+            if not lines:
+                break
+
+            # Same columns as the parallel ingest: fields, acquisition days, product ID columns
+            bulk_data = parseL8Lines(lines, indices)
+
+            if idebug <= 50 and LogEngine().getLogLevel() == logging.DEBUG:
+                for line, record in zip(lines[:51 - idebug], bulk_data):
+                    self.logger.debug('\n=== line # {0}'.format(idebug))
+                    self.logger.debug(line.rstrip('\n').split(','))
+                    self.logger.debug('---------------------------------------------------------')
+                    self.logger.debug(record)
+                    idebug += 1
+
+            yield bulk_data
+
+        return
+
+    def getByteRanges(self, f_L8meta, chunk_size=pow(2, 24), offset=0):
+        """ Split the plain CSV file (header excluded) into byte ranges of about
+            'chunk_size' bytes, aligned on line boundaries, from the line starting
+            at 'offset' if any. Returns a list of (start, end) offsets
+        """
+
+        ranges = []
+
+        with open(f_L8meta, 'rb') as fp:
+
+            fp.readline()
+            start = max(fp.tell(), offset)
+            length = os.fstat(fp.fileno()).st_size
+
+            while start < length:
+                fp.seek(min(start + chunk_size, length))
+                fp.readline()
+                end = min(fp.tell(), length)
+                ranges.append((start, end))
+                start = end
+
+        return ranges
+
+    def importL8Chunk(self, bulk_data, table, offset=None):
+        """ Import one chunk of parsed records into 'table' and report progress. When the
+            metadata source can be resumed, the chunk is committed with a checkpoint at
+            'offset', the position in the source following the chunk
+        """
+
+        self.logger.debug('\n\n\tImporting Landsat 8 metadata: %d records   \r' % (self.records))
+
+        self.dbase.importMetadata(bulk_data, table)
+        sys.stdout.write('\t\t\tImporting Landsat 8 metadata: %d records   \r' % (self.records))
+        sys.stdout.flush()
+        self.records += len(bulk_data)
+        self.chunks += 1
+
+        if self.source is not None and offset is not None:
+            self.dbase.saveCheckpoint(self.source, offset, self.records, self.chunks)
+
+        return
+
+    def getSourceKey(self, f_L8meta):
+        """ Identity of a metadata file for the import checkpoints: file name, size and
+            ETag of the downloaded archive (modification time if unknown). Returns None
+            for HTTP responses, whose import can't be resumed
+        """
+
+        if not isinstance(f_L8meta, str):
+            return None
+
+        stat = os.stat(f_L8meta)
+
+        return '{0}|{1}|{2}'.format(os.path.abspath(f_L8meta), stat.st_size, self.etag or stat.st_mtime_ns)
+
+    def importL8Parallel(self, f_L8meta, fp, indices, table, workers, chunk_size=pow(2, 24), offset=0):
+        """ Parse the metadata with a pool of 'workers' processes and import the records
+            from one writer thread, in the file order. A plain CSV file is split into byte
+            ranges read by the workers themselves, otherwise (gzipped archive, HTTP response)
+            the decompressed lines are read here and dispatched to the workers. The number
+            of chunks in flight is bounded, so memory use does not depend on the file size.
+            The lines before 'offset' (already imported) are skipped
+        """
+
+        pending = Queue(maxsize=2 * workers)
+        errors = []
+
+        def writer():
+            while True:
+                item = pending.get()
+                if item is None:
+                    break
+                try:
+                    if not errors:
+                        future, end = item
+                        self.importL8Chunk(future.result(), table, end)
+                except Exception as error:
+                    errors.append(error)
+            return
+
+        thread = Thread(target=writer, name='MetaWriter')
+        thread.start()
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+
+                if isinstance(f_L8meta, str) and not f_L8meta.endswith('.gz'):
+                    for start, end in self.getByteRanges(f_L8meta, chunk_size, offset):
+                        if errors:
+                            break
+                        pending.put((pool.submit(parseL8Range, f_L8meta, start, end, indices), end))
+                else:
+                    while not errors:
+                        lines = b''.join(fp.readlines(chunk_size)).decode().splitlines()
+                        if not lines:
+                            break
+                        end = fp.tell() if self.source is not None else None
+                        pending.put((pool.submit(parseL8Lines, lines, indices), end))
+
+                pending.put(None)
+                thread.join()
+
+        finally:
+            if thread.is_alive():
+                pending.put(None)
+                thread.join()
+
+        if errors:
+            raise metadataException('Error importing L8 metadata: {0}'.format(repr(errors[0])))
+
+        return
+
+    def requestL8Meta(self, conditional=True, offset=0, validator=None):
+        """ Send the HTTP request for the Landsat 8 bulk metadata archive and return the
+            streamed response, or None when the archive has not changed since the last
+            import ('conditional' request on the ETag/Last-Modified validators recorded
+            in 'journal_meta'). With 'offset' > 0, only the end of the archive is requested
+            (HTTP Range), provided the archive still matches 'validator' (HTTP If-Range).
+
+            The archive size is kept in 'archive_length', its validators in 'etag'
+            and 'last_modified'
+        """
+
+        browser = rb(parser='html.parser', history=True)
+        url = metaParser.metaURL
+
+        headers = {'Accept-Encoding': None}
+
+        if conditional:
+            etag, last_modified = self.dbase.getLastValidators()
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        if offset > 0:
+            headers['Range'] = 'bytes={0}-'.format(offset)
+            if validator:
+                headers['If-Range'] = validator
+
+        response = browser.session.get(url, stream=True, headers=headers)
+
+        # Partial archive already complete (or longer than the archive): start over
+        if response.status_code == 416 and offset > 0:
+            response.close()
+            return self.requestL8Meta(conditional)
+
+        # The archive has not changed since the last import
+        if response.status_code == 304:
+            response.close()
+            return None
+
+        # if file exists on USGS server
+        if response.status_code not in (200, 206):
+            response.close()
+            raise metadataException('Download error. Server response [{0}] for URL [{1}]'.format(response.status_code, url))
+
+        # Get file to download size
+        content_length = response.headers.get('content-length')
+
+        if content_length is None:
+            response.close()
+            raise metadataException('Download error. Unable to retrieve the download file size for URL [%s]' % url )
+
+        if response.status_code == 206:
+            # The partial content must start at 'offset' and state the archive size
+            content_range = metaParser.contentRange.match(response.headers.get('content-range', '').strip())
+
+            if content_range is None or int(content_range.group(1)) != offset:
+                response.close()
+                raise metadataException('Download error. Invalid Content-Range [{0}] for URL [{1}]'.format(response.headers.get('content-range'), url))
+
+            self.archive_length = int(content_range.group(3))
+        else:
+            self.archive_length = int(content_length)
+
+        self.etag = response.headers.get('etag')
+        self.last_modified = response.headers.get('last-modified')
+
+        return response
+
     @benchmark
-    def downloadL8Meta(self):
+    def downloadL8Meta(self, decompress=False, conditional=True):
         """ Download Landsat8 metadata. The metadata are updated daily.
 
             https://landsat.usgs.gov/download-entire-collection-metadata
+
+            The gzipped archive is kept as is and its path returned, unless 'decompress'
+            is set, in which case it is inflated and the CSV file path is returned. An
+            empty path is returned when the archive has not changed since the last import.
+
+            The archive is written to 'LANDSAT_8_C1.csv.gz.part' (its validator saved
+            alongside) and renamed once complete. A partial archive left by a dropped
+            connection, or by an earlier run, is resumed from its current length
         """
-        
+
         self.logger.debug('=== Entering function \'metaParser.downloadL8Meta()\' ===')
-        
-        fn_csv = ''
-        browser = rb(parser='html.parser', history=True)
+
+        fn_meta = ''
+
+        archive = r'LANDSAT_8_C1.csv.gz'
+        outpath = self.getRootDirectory()
+        outfile = os.path.join(outpath, archive)
+        partfile = outfile + '.part'
+        f_validator = outfile + '.validator'
+
+        attempt = 0
 
         try:
 
-            if browser is not None:
+            while True:
+
+                offset = 0
+                validator = None
+
+                # Resume a partial download only if its validator is known
+                if os.path.isfile(partfile) and os.path.isfile(f_validator):
+                    with open(f_validator) as fp:
+                        validator = fp.read().strip()
+                    if validator:
+                        offset = os.path.getsize(partfile)
 
-                archive = r'LANDSAT_8_C1.csv.gz'
-                url = r'https://landsat.usgs.gov/landsat/metadata_service/bulk_metadata_files/{0}'.format(archive)
+                try:
+                    response = self.requestL8Meta(conditional, offset, validator)
 
-                response = browser.session.get(url, stream=True, headers={'Accept-Encoding': None})
+                    if response is None:
+                        self.logger.info('Landsat 8 metadata unchanged since the last import')
+                        return fn_meta
 
-                # if file exists on USGS server
-                if response.status_code == 200:
+                    if response.status_code == 200:
+                        # Range ignored or archive modified: start over
+                        offset = 0
+                    else:
+                        self.logger.info('Resuming metadata download at %d MB', int(offset/Globals.MBYTES))
+
+                    with open(f_validator, 'w') as fp:
+                        fp.write(self.etag or self.last_modified or '')
 
-                    # Get file to download size
-                    content_length = response.headers.get('content-length')
-                
-                    if content_length is None:
-                        raise metadataException('Download error. Unable to retrieve the download file size for URL [%s]' % url ) 
-                
-                    total_length = int(response.headers.get('content-length'))
+                    total_length = self.archive_length
 
-                    outpath = self.getRootDirectory()
-                    outfile = os.path.join(outpath, archive)
-                        
-                    with open(outfile, 'wb') as handle:   # the 'with' syntax if part of ContextManager it ensures the file is properly initialized and closed at the end
+                    with open(partfile, 'ab' if offset else 'wb') as handle:   # the 'with' syntax if part of ContextManager it ensures the file is properly initialized and closed at the end
 
-                        payload = 512
+                        payload = 1 << 16
                         sys.stdout.write('\n')
                         mesg1 = '\t\t\tDownloading {0}:'.format(archive)
 
@@ -504,7 +1799,7 @@ class metaParser:
                         mesg2 = '/{0} MB'.format(f_size)
 
                         ichunk = 0
-                        size_downloaded = 0
+                        size_downloaded = offset
                         self.logger.info('Starting metadata download')
 
                         for chunk in response.iter_content(chunk_size=payload):
@@ -514,110 +1809,162 @@ class metaParser:
                                 size_downloaded += len(chunk)
 
                                 ichunk += 1
-                                if (ichunk % 2000) == 0:
-                                    progress = int(ichunk * payload/(1024*1024))
+                                if (ichunk % 16) == 0:
+                                    progress = int(size_downloaded/Globals.MBYTES)
                                     sys.stdout.write('%s: %d%s   \r' % (mesg1, progress, mesg2))
                                     sys.stdout.flush()
 
+                    response.close()
+                    break
 
-                    handle.close()
+                except RequestException as error:
+                    # Dropped connection, the partial archive is resumed
+                    attempt += 1
+                    if attempt > metaParser.retries:
+                        raise metadataException('Error downloading L8 metadata file: {0}'.format(repr(error)))
 
-                    # Download has terminated
-                    if os.path.isfile(outfile):
-                            
-                        self.logger.debug('Size downloaded: [%d] -- Size on server [%d]', size_downloaded, total_length)
+                    self.logger.warning('Metadata download interrupted (%s), attempt %d/%d', repr(error), attempt, metaParser.retries)
 
-                        if size_downloaded == total_length:
+            # Download has terminated
+            size_downloaded = os.path.getsize(partfile)
+            self.logger.debug('Size downloaded: [%d] -- Size on server [%d]', size_downloaded, total_length)
 
-                            self.archive_length = total_length
+            if size_downloaded != total_length:
+                raise metadataException('Error downloading L8 metadata file: {0} bytes out of {1}'.format(size_downloaded, total_length))
 
-                            # Decompress metadata archive
-                            self.logger.info('Decompressing %s', archive)
+            os.replace(partfile, outfile)
+            os.remove(f_validator)
+            fn_meta = outfile
 
-                            fn_csv = outfile[:-3]
+            if decompress:
+                # Decompress metadata archive
+                self.logger.info('Decompressing %s', archive)
 
-                            try:
-                                self.gzipfile(outfile, fn_csv)
-                                os.remove(outfile)
+                fn_meta = outfile[:-3]
 
-                            except (ValueError, OSError, EOFError) as error:
-                                raise metadataException(repr(error))
+                try:
+                    self.gzipfile(outfile, fn_meta)
+                    os.remove(outfile)
 
-                    else:
-                        raise metadataException('Error downloading L8 metadata file: %s', archive)
+                except (ValueError, OSError, EOFError) as error:
+                    raise metadataException(repr(error))
+
+        except (ValueError, OSError) as error:
+            raise metadataException('Error downloading L8 metadata file: {0}'.format(repr(error)))
+
+        return fn_meta
+
+    @benchmark
+    def streamL8Metadata(self, incremental=False, workers=1, conditional=True):
+        """ Import the Landsat 8 metadata straight from the HTTP response. The
+            archive is decompressed and parsed on the fly, nothing is written to disk.
+            Returns False when the archive has not changed since the last import
+        """
+
+        self.logger.debug('=== Entering function \'metaParser.streamL8Metadata()\' ===')
+        self.logger.info('Streaming Landsat 8 metadata from USGS')
+
+        try:
+            response = self.requestL8Meta(conditional)
+
+            if response is None:
+                self.logger.info('Landsat 8 metadata unchanged since the last import')
+                return False
+
+            try:
+                self.loadL8Metadata(response, incremental, workers)
+
+            finally:
+                response.close()
 
-        except (ValueError, FileNotFoundError) as error:
-            raise metadataException('Error downloading L8 metadata file: %s', repr(error))
+        except (ValueError, OSError, EOFError, RequestException) as error:
+            raise metadataException('Error streaming L8 metadata file: {0}'.format(repr(error)))
 
-        return fn_csv
+        return True
 
     @benchmark
-    def loadL8Metadata(self, f_L8meta):
-        """ Read metadata fields from csv file and insert them into the
-            database (landsat8Metadata.db)
+    def loadL8Metadata(self, f_L8meta, incremental=False, workers=1):
+        """ Read metadata fields from the csv file, the gzipped archive or the
+            HTTP response and insert them into the database (landsat8Metadata.db)
+
+            The records are first loaded into the staging table 'tmp_meta', chunk by chunk.
+            With 'incremental' set, they are then merged into 'scene_meta', otherwise the
+            staging table replaces 'scene_meta' (atomic swap). 'scene_meta' stays queryable
+            during the whole import. With more than one worker, the CSV lines are parsed
+            by a process pool.
+
+            Each chunk is committed with a checkpoint (offset in the file, records imported):
+            the import of a file interrupted by a crash resumes from its last checkpoint
         """
 
         self.logger.debug('=== Entering function \'metaParser.loadL8Metadata(f_L8meta)\' ===')
         self.logger.info('Importing Landsat 8 metadata into the database')
-        
-        self.dbase.deleteAllRecords()
-        
-        with open(f_L8meta) as fp:
+
+        inserted = updated = deleted = 0
+        table = landsat8Manager.staging
+        self.source = self.getSourceKey(f_L8meta)
+
+        # 'scene_meta' indexes are kept: only the staging table is loaded
+        with self.dbase.bulkLoad(False), self.openL8Metadata(f_L8meta) as fp:
 
             # read header row and get index list
-            headers = fp.readline().split(',')
+            headers = fp.readline().decode().rstrip('\r\n').split(',')
             indices = self.getIndexList(headers)
 
-            # Input buffer size in bytes
-            chunk_size = pow(2, 24)
+            checkpoint = self.dbase.getCheckpoint(self.source) if self.source is not None else None
+
+            if checkpoint is not None:
+                offset, self.records, self.chunks = checkpoint
+                self.logger.info('Resuming interrupted import: %d records already imported (%d chunks)', self.records, self.chunks)
+                fp.seek(offset)
+            else:
+                self.dbase.createStagingTable()
+                offset = 0
+
             ipass = 1
-            
-            self.logger.debug('File \'{0}\', opened successfully'.format(f_L8meta))
-                        
-            while True:
-                
-                idebug = 1
-                self.logger.debug('Extracting relevant fields from CSV metadata file')
-                self.logger.debug('  ')
-                
-                lines = fp.readlines(chunk_size)
-                if lines:
+            first = self.records
+            st = time.time()
+
+            self.logger.debug('Metadata source \'{0}\', opened successfully'.format(f_L8meta))
+            self.logger.debug('Extracting relevant fields from CSV metadata file')
 
-                    bulk_data = []
+            if workers > 1:
+                self.logger.info('Parsing metadata with %d worker processes', workers)
+                self.importL8Parallel(f_L8meta, fp, indices, table, workers, offset=offset)
+
+            else:
+                for bulk_data in self.readL8Metadata(fp, indices):
 
-                    self.logger.debug('Pass number {0}, {1} lines read'.format(ipass, len(lines)))
+                    self.logger.debug('Pass number {0}, {1} lines read'.format(ipass, len(bulk_data)))
                     self.logger.debug('============================')
-                    
-                    for line in lines:
-                        
-                        metas = line.split(',')
-                        
-                        if idebug <= 50 and LogEngine().getLogLevel() == logging.DEBUG:
-                            self.logger.debug('\n=== line # {0}'.format(idebug))
-                            self.logger.debug(metas)
-                            self.logger.debug('---------------------------------------------------------')
-                            self.logger.debug(tuple(map(lambda i: metas[i], indices)))
-                            idebug += 1
-                            
-                        bulk_data.append(tuple(map(lambda i: metas[i], indices)))
-
-                    self.logger.debug('\n\n\tImporting Landsat 8 metadata: %d records   \r' % (self.records))
-                    
-                    self.dbase.importMetadata(bulk_data)
-                    sys.stdout.write('\t\t\tImporting Landsat 8 metadata: %d records   \r' % (self.records))
-                    sys.stdout.flush()
-                    self.records += len(lines)
-                    
+
+                    self.importL8Chunk(bulk_data, table, fp.tell() if self.source is not None else None)
                     ipass += 1
-                
-                else:
-                    break
-            
-            self.dbase.updateJournalTable(self.archive_length)
-            self.logger.info('{0} records imported into \'scene_meta\''.format(self.records))
 
-        
-        if self.logger.level == logging.INFO:
+            elapsed = time.time() - st
+            rate = (self.records - first) / elapsed if elapsed > 0 else 0.
+            self.logger.info('%d records parsed and imported in %.1fs (%d rows/s)', self.records - first, elapsed, rate)
+
+            if incremental:
+                inserted, updated, deleted = self.dbase.mergeStagingTable()
+                self.dbase.dropStagingTable()
+                self.logger.info('Metadata merged: %d records inserted, %d updated, %d deleted', inserted, updated, deleted)
+
+                refreshed = self.dbase.refreshCloudSummary()
+                self.logger.info('Cloud cover summary refreshed for %d path/row months', refreshed)
+            else:
+                self.logger.info('Replacing \'scene_meta\' and building its indexes')
+                inserted = self.dbase.swapStagingTable()
+                table = 'scene_meta'
+
+            # committed along with the merge (or swap) when the session ends
+            self.dbase.clearCheckpoint()
+
+        self.dbase.updateJournalTable(self.archive_length, inserted, updated, deleted, rate, self.etag, self.last_modified)
+        self.logger.info('{0} records imported into \'{1}\''.format(self.records, table))
+
+
+        if self.logger.level == logging.INFO and isinstance(f_L8meta, str):
             os.remove(f_L8meta)
 
         return
@@ -682,223 +2029,287 @@ class MTLParser:
 
 
     # Elements from the file format used for parsing
-    GRPSTART = r'GROUP = '
-    GRPEND = r'END_GROUP = '
+    GRPSTART = r'GROUP'
+    GRPEND = r'END_GROUP'
     ASSIGNCHAR = r' = '
     FINAL = r'END'
 
-    # A state machine is used to parse the file. There are 5 states (0 to 4):
-    STATUSCODE = ['begin', 'enter metadata group', 'add metadata item', 'leave metadata group', 'end']
+    # Value types, tested in this order
+    INTPATTERN = re.compile(r'^\-?\d+$')
+    FLOATPATTERN = re.compile(r'^\-?\d+\.\d+(E[+-]?\d\d+)?$')
+    TIMEPATTERN = re.compile(r'^\d{2}:\d{2}:\d{2}(\.\d{6})?')
+    DATEPATTERN = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
 
+    # Parsed files cache version, to be changed with the parser output
+    cacheVersion = 1
 
-    def __init__(self):
-        self.logger = LogEngine().logger
-        return
 
-    # Help functions to identify the current line and extract information
-    def _islinetype(self, line, testchar):
-        """ Checks for various kinds of line types based on line head
+    def __init__(self, cache=True):
+        """ With 'cache' set, the files parsed are cached (in memory and, with
+            'Globals.METADATA_CACHE_DISK', in 'mtlCache.db'), keyed by their
+            path, size and modification time
         """
-        return line.strip().startswith(testchar)
 
-    def _isassignment(self, line):
-        """ Checks if the line is a key-value assignment
-        """
-        return MTLParser.ASSIGNCHAR in line
+        self.logger = LogEngine().logger
+        self.cache = None
 
-    def _isfinal(self, line):
-        """ Checks if line finishes a group
-        """
-        return line.strip() == MTLParser.FINAL
+        if cache:
+            filename = None
+            if Globals.METADATA_CACHE_DISK:
+                rootdir = os.path.expanduser(Globals.METADATA_LC8_BASEDIR)
+                if os.path.exists(rootdir) is False:
+                    os.makedirs(rootdir)
+                filename = os.path.join(rootdir, 'mtlCache.db')
+            self.cache = queryCache(256, filename)
 
-    def _getgroupname(self, line):
-        """ Returns group name, if used with group start lines
-        """
-        return line.strip().split(MTLParser.GRPSTART)[-1]
+        return
 
-    def _getendgroupname(self, line):
-        """ Returns group name, if used with group end lines
+    # Identifying data type of a metadata item
+    @staticmethod
+    def _postprocess(valuestr, logger):
         """
-        return line.strip().split(MTLParser.GRPEND)[-1]
-
-    def _getmetadataitem(self, line):
-        """ Returns key/value pair for assignment type lines
+        Takes value as str, returns str, int, float, date, datetime, or time
         """
-        return line.strip().split(MTLParser.ASSIGNCHAR)
 
-    # After reading a line, what state we're in depends on the line
-    # and the state before reading
-    def _checkstatus(self, status, line):
-        """ Returns state/status after reading the next line.
+        try:
+            if valuestr.startswith('"') and valuestr.endswith('"'):
+                # it's a string
+                return valuestr[1:-1]
 
-        The status codes are::
-            0 - BEGIN parsing; 1 - ENTER METADATA GROUP, 2 - READ METADATA LINE,
-            3 - END METDADATA GROUP, 4 - END PARSING
+            elif MTLParser.INTPATTERN.match(valuestr):
+                # it's an integer
+                return int(valuestr)
 
-        Permitted Transitions:
+            elif MTLParser.FLOATPATTERN.match(valuestr):
+                # floating point number
+                return float(valuestr)
 
-            0 --> 1, 0 --> 4
-            1 --> 1, 1 --> 2, 1 --> 3
-            2 --> 2, 2 --> 3
-            3 --> 1, 1 --> 3, 3 --> 4
+            elif MTLParser.TIMEPATTERN.match(valuestr):
+                time = valuestr[0:-2]
+                return datetime.datetime.strptime(time, '%H:%M:%S.%f').time()
 
-        """
+            date = MTLParser.DATEPATTERN.match(valuestr)
+            if date:
+                # plain dates, as returned by dateutil
+                return datetime.datetime(*[int(field) for field in date.groups()])
 
-        newstatus = 0
+            # now let's try the datetime objects
+            return iso8601.parse(valuestr)
 
-        if status == 0:
-            # begin --> enter metadata group OR end
-            if self._islinetype(line, MTLParser.GRPSTART):
-                newstatus = 1
-            elif self._isfinal(line):
-                newstatus = 4
+        except (OverflowError, ValueError):
+            pass
 
-        elif status == 1:
-            # enter metadata group --> enter metadata group
-            # OR add metadata item OR leave metadata group
-            if self._islinetype(line, MTLParser.GRPSTART):
-                newstatus = 1
-            elif self._islinetype(line, MTLParser.GRPEND):
-                newstatus = 3
-            elif self._isassignment(line):
-                # test AFTER start and end, as both are also assignments
-                newstatus = 2
+        # If we get here, we still haven't returned anything.
+        logger.info('The value %s couldn\'t be parsed as int, float, or datetime. Returning it as string.' % valuestr)
 
-        elif status == 2:
-            if self._islinetype(line, MTLParser.GRPEND):
-                newstatus = 3
-            elif self._isassignment(line):
-                # test AFTER start and end, as both are also assignments
-                newstatus = 2
+        return valuestr
 
-        elif status == 3:
-            if self._islinetype(line, MTLParser.GRPSTART):
-                newstatus = 1
-            elif self._islinetype(line, MTLParser.GRPEND):
-                newstatus = 3
-            elif self._isfinal(line):
-                newstatus = 4
+    @staticmethod
+    def _postprocesslist(valuestr, logger):
+        """ Takes a list of values '( v1, v2, ... )' as str, returns a tuple
+        """
 
-        if newstatus != 0:
-            return newstatus
-        elif status != 4:
-            err_mesg = 'Cannot parse the following line after status [%s]: (%s)' % (MTLParser.STATUSCODE[status], line)
-            raise MTLParseError(err_mesg)
+        return tuple(MTLParser._postprocess(value.strip(), logger) for value in valuestr[1:-1].split(',') if value.strip())
 
-    # Function to execute when reading a line in a given state
-    def _transstat(self, status, grouppath, dictpath, line):
-        """Executes processing steps when reading a line
+    @staticmethod
+    def tokenize(lines, name='', logger=None):
+        """ Single pass parser of the MTL (or ANG) lines: returns the nested metadata dictionary
+            {group: {key: value, subgroup: {...}}}, the content of the 'L1_METADATA_FILE' group
+            for MTL files. Lists of values '( v1, v2, ... )', possibly spanning several lines,
+            are returned as tuples. Raises MTLParseError on malformed files.
+            Worker processes have no log engine, messages go to the 'Globals.LOGNAME' logger
         """
 
-        if status == 0:
-            err_mesg = 'Status should not be [%s] after reading line: (%s)' % (MTLParser.STATUSCODE[status], line)
-            raise MTLParseError(err_mesg)
+        if logger is None:
+            logger = logging.getLogger(Globals.LOGNAME)
 
-        elif status == 1:
-            currentdict = dictpath[-1]
-            currentgroup = self._getgroupname(line)
-            grouppath.append(currentgroup)
-            currentdict[currentgroup] = {}
-            dictpath.append(currentdict[currentgroup])
+        mdata = {}
+        grouppath = []
+        dictpath = [mdata]
+        final = False
+        pending = None
+
+        for line in lines:
+
+            line = line.strip()
+
+            if pending is not None:
+                # continuation of a list of values
+                pending[1].append(line)
+                if line.endswith(')'):
+                    dictpath[-1][pending[0]] = MTLParser._postprocesslist(' '.join(pending[1]), logger)
+                    pending = None
+                continue
+
+            if final:
+                # we reached the end, but are still reading lines
+                if line:
+                    logger.warning('Metadata file %s appears to have extra lines after at the end.' % name)
+                continue
+
+            key, assign, value = line.partition(MTLParser.ASSIGNCHAR)
+
+            if not assign:
+                if line != MTLParser.FINAL:
+                    raise MTLParseError('Cannot parse the following line: (%s)' % line)
+                if grouppath:
+                    raise MTLParseError('Reached end before end of group [%s]' % grouppath[-1])
+                final = True
+
+            elif key == MTLParser.GRPSTART:
+                dictpath[-1][value] = {}
+                dictpath.append(dictpath[-1][value])
+                grouppath.append(value)
+
+            elif key == MTLParser.GRPEND:
+                if not grouppath or value != grouppath[-1]:
+                    raise MTLParseError("Reached line '%s' while reading group '%s'." % (line, grouppath[-1] if grouppath else None))
+                del grouppath[-1]
+                del dictpath[-1]
+
+            elif grouppath:
+                # USGS has started quoting the scene center time.  If this
+                # happens strip quotes before post processing.
+                if key == 'SCENE_CENTER_TIME' and value.startswith('"') and value.endswith('"'):
+                    value = value[1:-1]
+
+                if not value.startswith('('):
+                    dictpath[-1][key] = MTLParser._postprocess(value, logger)
+                elif value.endswith(')'):
+                    dictpath[-1][key] = MTLParser._postprocesslist(value, logger)
+                else:
+                    pending = (key, [value])
 
-        elif status == 2:
-            currentdict = dictpath[-1]
-            newkey, newval = self._getmetadataitem(line)
-
-            # USGS has started quoting the scene center time.  If this
-            # happens strip quotes before post processing.
-            if newkey == 'SCENE_CENTER_TIME' and newval.startswith('"') \
-                    and newval.endswith('"'):
-                self.logger.warning('Strip quotes off SCENE_CENTER_TIME.')
-                newval = newval[1:-1]
-
-            currentdict[newkey] = self._postprocess(newval)
-
-        elif status == 3:
-            oldgroup = self._getendgroupname(line)
-            if oldgroup != grouppath[-1]:
-                raise MTLParseError(
-                    "Reached line '%s' while reading group '%s'."
-                    % (line.strip(), grouppath[-1]))
-            del grouppath[-1]
-            del dictpath[-1]
-            try:
-                currentgroup = grouppath[-1]
-            except IndexError:
-                currentgroup = None
+            else:
+                raise MTLParseError('Cannot parse the following line outside of a group: (%s)' % line)
 
-        elif status == 4:
-            if grouppath:
-                raise MTLParseError('Reached end before end of group [%s]' % grouppath[-1])
+        if pending is not None or grouppath:
+            raise MTLParseError('Metadata file %s is truncated' % name)
 
-        return grouppath, dictpath
+        return mdata.get('L1_METADATA_FILE', mdata)
 
-    # Identifying data type of a metadata item
-    def _postprocess(self, valuestr):
-        """
-        Takes value as str, returns str, int, float, date, datetime, or time
+    @staticmethod
+    def parsefile(mtl_file, logger=None):
+        """ Parse the metadata file 'mtl_file'. Defined as a static method
+            to be run by a process pool
         """
 
-        intpattern = re.compile(r'^\-?\d+$')
-        floatpattern = re.compile(r'^\-?\d+\.\d+(E[+-]?\d\d+)?$')
-        timepattern = re.compile(r'^\d{2}:\d{2}:\d{2}(\.\d{6})?')
+        with open(mtl_file, 'r') as filehandle:
+            return MTLParser.tokenize(filehandle, mtl_file, logger)
 
-        try:
-            if valuestr.startswith('"') and valuestr.endswith('"'):
-                # it's a string
-                return valuestr[1:-1]
+    def _cachekey(self, mtl_file):
+        """ Cache key of a metadata file: absolute path, size and modification time
+        """
 
-            elif re.match(intpattern, valuestr):
-                # it's an integer
-                return int(valuestr)
+        stat = os.stat(mtl_file)
+        return (os.path.abspath(mtl_file), stat.st_size, stat.st_mtime_ns)
 
-            elif re.match(floatpattern, valuestr):
-                # floating point number
-                return float(valuestr)
+    def _cached(self, key):
+        """ Return the cached metadata dictionary, None if not cached. The entries are
+            stored pickled: each call returns a new dictionary
+        """
 
-            elif re.match(timepattern, valuestr):
-                time = valuestr[0:-2]
-                return datetime.datetime.strptime(time, '%H:%M:%S.%f').time()
+        if self.cache is None:
+            return None
 
-            else:
-            # now let's try the datetime objects
-                return iso8601.parse(valuestr)
+        data = self.cache.get(key, MTLParser.cacheVersion)
+        return pickle.loads(data) if data is not None else None
 
-        except (OverflowError, ValueError) as error:
-            print(error)
-            pass
+    def _store(self, key, mdata):
+        """ Cache a parsed metadata dictionary
+        """
 
-        # If we get here, we still haven't returned anything.
-        self.logger.info('The value %s couldn\'t be parsed as int, float, or datetime. Returning it as string.' % valuestr)
+        if self.cache is not None:
+            self.cache.put(key, MTLParser.cacheVersion, pickle.dumps(mdata, pickle.HIGHEST_PROTOCOL))
 
-        return valuestr
+        return
 
     def parse(self, mtl_file):
         """ Parses the metadata.
 
         Arguments:
-            metadataloc: a filename or a directory.
+            mtl_file: the MTL file name.
         Returns metadata dictionary, mdata
         """
         if os.path.isfile(mtl_file) is False:
             raise MTLParseError('Metadate file (MTL) not found: %s' % mtl_file)
 
-        filehandle = open(mtl_file, 'rU')
+        key = self._cachekey(mtl_file)
+        mdata = self._cached(key)
 
-        # Reading file line by line and inserting data into metadata dictionary
-        status = 0
-        mdata = {}
-        grouppath = []
-        dictpath = [mdata]
+        if mdata is None:
+            mdata = MTLParser.parsefile(mtl_file, self.logger)
+            self._store(key, mdata)
+
+        return mdata
+
+    @staticmethod
+    def readmember(f_archive, suffix):
+        """ Return the text of the first member of the scene archive 'f_archive' (.tgz)
+            whose name ends with 'suffix' (e.g. '_MTL.txt', '_ANG.txt'). The archive is read
+            as a stream, nothing is written to disk and the decompression stops as soon as
+            the member has been read
+        """
+
+        try:
+            with tarfile.open(f_archive, 'r|gz') as tar:
+                for member in tar:
+                    if member.isfile() and member.name.upper().endswith(suffix.upper()):
+                        return tar.extractfile(member).read().decode()
+
+        except (IOError, tarfile.TarError, EOFError) as error:
+            raise MTLParseError('Error reading %s: %s' % (f_archive, repr(error)))
 
-        for line in filehandle:
-            if status == 4:
-                # we reached the end in the previous iteration,
-                # but are still reading lines
-                mesg = 'Metadata file %s appears to have extra lines after at the end.' % mtl_file
-                self.logger.warning(mesg)
+        raise MTLParseError('No member *%s found in %s' % (suffix, f_archive))
+
+    def parsearchive(self, f_archive, suffix='_MTL.txt'):
+        """ Parses a metadata file (MTL or ANG) stored in a scene archive, without extracting it.
+
+        Arguments:
+            f_archive: the scene archive (.tgz) file name.
+            suffix: the end of the metadata file name.
+        Returns metadata dictionary, mdata
+        """
+        if os.path.isfile(f_archive) is False:
+            raise MTLParseError('Scene archive not found: %s' % f_archive)
+
+        key = self._cachekey(f_archive) + (suffix.upper(),)
+        mdata = self._cached(key)
+
+        if mdata is None:
+            text = MTLParser.readmember(f_archive, suffix)
+            mdata = MTLParser.tokenize(text.splitlines(), '{0}[*{1}]'.format(f_archive, suffix), self.logger)
+            self._store(key, mdata)
+
+        return mdata
+
+    def parse_many(self, mtl_files, workers=None):
+        """ Parses a list of metadata files. The files not found in the cache are
+            parsed by a pool of 'workers' processes (default: number of CPUs).
+        Returns the list of metadata dictionaries, in the order of 'mtl_files'
+        """
+
+        results = [None] * len(mtl_files)
+        pending = []
+
+        for i, mtl_file in enumerate(mtl_files):
+            if os.path.isfile(mtl_file) is False:
+                raise MTLParseError('Metadate file (MTL) not found: %s' % mtl_file)
+
+            key = self._cachekey(mtl_file)
+            results[i] = self._cached(key)
+
+            if results[i] is None:
+                pending.append((i, key))
+
+        if len(pending) > 1 and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parsed = list(executor.map(MTLParser.parsefile, [mtl_files[i] for i, _ in pending], chunksize=8))
+        else:
+            parsed = [MTLParser.parsefile(mtl_files[i], self.logger) for i, _ in pending]
 
-            status = self._checkstatus(status, line)
-            grouppath, dictpath = self._transstat(status, grouppath, dictpath, line)
+        for (i, key), mdata in zip(pending, parsed):
+            self._store(key, mdata)
+            results[i] = mdata
 
-        return mdata['L1_METADATA_FILE']
+        return results
@@ -0,0 +1,147 @@
+
+import re
+import datetime
+
+from functools import lru_cache
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+#===============================================================================
+# Landsat product and scene identifiers codec. Collection 1 product IDs have a
+# fixed layout (40 characters), e.g.
+#
+#   LC08_L1TP_044069_20181122_20181129_01_T1
+#   LXSS_LLLL_PPPRRR_YYYYMMDD_yyyymmdd_CC_TX
+#
+# sensor (X), satellite (SS), correction level (LLLL), WRS path/row (PPPRRR),
+# acquisition and processing dates, collection number (CC) and category (TX).
+# The pre-collection scene IDs (21 characters) are laid out as
+#
+#   LC80440692018326LGN00
+#   LXSPPPRRRYYYYDDDGSIVV
+#
+# with the acquisition year and day of year (YYYYDDD), ground station (GSI)
+# and archive version (VV).
+#
+# File names starting with an identifier (archives, band files...) are decoded
+# as well. Bulk decoding slices the identifiers column-wise (NumPy when available),
+# single identifiers go through an LRU cache.
+#===============================================================================
+
+productFields = namedtuple('productFields', ['sensor', 'satellite', 'correction', 'path', 'row', 'acqdate', 'procdate', 'collection', 'category'])
+sceneFields = namedtuple('sceneFields', ['sensor', 'satellite', 'path', 'row', 'acqdate', 'station', 'version'])
+
+# Length of a product ID, offsets of its separators and of its numeric fields
+productLength = 40
+separators = [4, 9, 16, 25, 34, 37]
+digits = [(2, 4), (10, 16), (17, 25), (26, 34), (35, 37)]
+
+productPattern = re.compile(r'^L([A-Z])(\d{2})_([A-Z0-9]{4})_(\d{3})(\d{3})_(\d{4})(\d{2})(\d{2})_(\d{4})(\d{2})(\d{2})_(\d{2})_([A-Z0-9]{2})', re.IGNORECASE)
+scenePattern = re.compile(r'^L([A-Z])(\d)(\d{3})(\d{3})(\d{4})(\d{3})([A-Z]{3})(\d{2})', re.IGNORECASE)
+
+
+def decodeIdentifier(product_id):
+    """ Decode a product ID (or a name starting with one), return productFields or None
+    """
+
+    match = productPattern.match(product_id) if isinstance(product_id, str) else None
+    if match is None:
+        return None
+
+    groups = match.groups()
+
+    return productFields(groups[0].upper(), groups[1], groups[2].upper(), int(groups[3]), int(groups[4]),
+                         '-'.join(groups[5:8]), '-'.join(groups[8:11]), int(groups[11]), groups[12].upper())
+
+
+@lru_cache(maxsize=4096)
+def decodeProductID(product_id):
+    """ Decode a product ID, or a file name starting with one (e.g. 'LC08_..._T1.tgz' or
+        'LC08_..._T1_B4.TIF'), into productFields. Returns None for any other name.
+        The results are cached: the workflows decode the same few names over and over
+    """
+
+    return decodeIdentifier(product_id)
+
+
+@lru_cache(maxsize=4096)
+def decodeSceneID(scene_id):
+    """ Decode a pre-collection scene ID, or a file name starting with one
+        (e.g. 'LC80440692018326LGN00.tgz'), into sceneFields. None for any other name
+    """
+
+    match = scenePattern.match(scene_id) if isinstance(scene_id, str) else None
+    if match is None:
+        return None
+
+    groups = match.groups()
+
+    try:
+        acqdate = datetime.datetime.strptime(groups[4] + groups[5], '%Y%j').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+    return sceneFields(groups[0].upper(), '0' + groups[1], int(groups[2]), int(groups[3]), acqdate, groups[6].upper(), int(groups[7]))
+
+
+def decodeProductIDs(product_ids, fields=productFields._fields):
+    """ Decode a sequence of product IDs column-wise. Returns a dictionary of lists, one per
+        productFields field in 'fields', holding None for the invalid IDs. The acquisition and
+        processing dates are ISO dates 'YYYY-MM-DD', the path, row and collection numbers integers
+    """
+
+    product_ids = list(product_ids)
+    codes = None
+
+    if numpy is not None and product_ids:
+        try:
+            # One more character than a product ID: longer names are told apart
+            ids = numpy.array(product_ids, dtype='S{0}'.format(productLength + 1))
+            codes = ids.view(numpy.uint8).reshape(len(product_ids), productLength + 1)
+        except (TypeError, ValueError, UnicodeEncodeError):
+            codes = None
+
+    if codes is None:
+        decoded = [decodeIdentifier(product_id) if isinstance(product_id, str) and len(product_id) == productLength else None for product_id in product_ids]
+        return {name: [None if values is None else getattr(values, name) for values in decoded] for name in fields}
+
+    # Upper case letters, then identifiers of the right length with separators and digits in place
+    codes = codes - 32 * ((codes >= ord('a')) & (codes <= ord('z'))).astype(numpy.uint8)
+
+    valid = (codes[:, productLength] == 0) & (codes[:, productLength - 1] != 0) & (codes[:, 0] == ord('L'))
+    for i in separators:
+        valid &= codes[:, i] == ord('_')
+    for start, end in digits:
+        valid &= ((codes[:, start:end] >= ord('0')) & (codes[:, start:end] <= ord('9'))).all(axis=1)
+
+    if not valid.all():
+        codes[~valid] = ord('0')
+
+    chars = codes[:, :productLength].view('S1')
+
+    def text(start, end):
+        return numpy.ascontiguousarray(chars[:, start:end]).view('S{0}'.format(end - start)).ravel().astype('U').tolist()
+
+    def number(start, end):
+        return numpy.ascontiguousarray(chars[:, start:end]).view('S{0}'.format(end - start)).ravel().astype(numpy.int64).tolist()
+
+    def date(start):
+        dash = numpy.full((len(chars), 1), b'-', dtype='S1')
+        iso = numpy.concatenate([chars[:, start:start + 4], dash, chars[:, start + 4:start + 6], dash, chars[:, start + 6:start + 8]], axis=1)
+        return iso.view('S10').ravel().astype('U').tolist()
+
+    decoders = {'sensor': (text, 1, 2), 'satellite': (text, 2, 4), 'correction': (text, 5, 9), 'path': (number, 10, 13), 'row': (number, 13, 16),
+                'acqdate': (date, 17), 'procdate': (date, 26), 'collection': (number, 35, 37), 'category': (text, 38, 40)}
+
+    columns = {name: decoders[name][0](*decoders[name][1:]) for name in fields}
+
+    if not valid.all():
+        flags = valid.tolist()
+        columns = {name: [value if flag else None for value, flag in zip(values, flags)] for name, values in columns.items()}
+
+    return columns
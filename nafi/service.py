@@ -0,0 +1,330 @@
+
+import os
+import json
+import socket
+import socketserver
+
+from threading import Lock
+
+from nafi.utils import LogEngine
+from nafi.utils import Globals
+
+from nafi.database import connectionPool
+from nafi.metadata import metadata, L8metadata, landsat8Manager
+from nafi.exceptions import metadataException
+
+
+#===============================================================================
+# Long-lived Landsat 8 metadata query service. A single process keeps the
+# metadata database open, its scene indexes in the page cache and the query
+# results in memory, and answers the queries of the workflow processes over a
+# local socket (TCP on localhost or Unix domain socket). The requests and
+# responses are JSON documents, one per line:
+#
+#   {"method": "getSceneProductIDs", "args": [...], "kwargs": {...}}
+#   {"result": ...} or {"error": "message"}
+#
+# Only the read-only query methods of 'landsat8Manager' are served.
+#===============================================================================
+
+def parseAddress(address):
+    """ Return (family, address) of a service address: 'unix:/path/to/socket',
+        'host:port' or a port number (on localhost)
+    """
+
+    address = str(address).strip()
+
+    if address.startswith('unix:'):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise metadataException('Unix domain sockets are not supported on this platform: {0}'.format(address))
+        return socket.AF_UNIX, os.path.expanduser(address[5:])
+
+    host, _, port = address.rpartition(':')
+
+    try:
+        return socket.AF_INET, (host or 'localhost', int(port))
+    except ValueError:
+        raise metadataException('Invalid metadata service address: \'{0}\', expected \'host:port\' or \'unix:/path\''.format(address))
+
+
+def sceneRows(scenes):
+    """ Return the fields of L8metadata objects as lists, in 'sceneQuery' column order
+    """
+
+    return [[getattr(meta, field) for field in metadata.__slots__] for meta in scenes]
+
+
+class metadataService:
+    """ Metadata query service: serves the read-only queries of a landsat8Manager
+        on 'address' until 'shutdown' is called
+    """
+
+    # Served methods and the type of their result:
+    #   'scenes': list of L8metadata, 'pathrows': {(path, row): [L8metadata, ...]},
+    #   'rows': list of tuples, 'tuple' and 'value': returned as is
+    methods = {'getSceneProductIDs': 'scenes',
+               'getScenesIntersecting': 'scenes',
+               'getScenesByPathRow': 'pathrows',
+               'getCloudSummary': 'rows',
+               'getSeasonalAvailability': 'rows',
+               'getLastValidators': 'tuple',
+               'getNumberofRecords': 'value'}
+
+    # The database file is memory mapped: all the service connections share
+    # the same pages (OS page cache) instead of a private cache each
+    pragmas = [('mmap_size', 4 * 1024 * Globals.MBYTES), ('cache_size', -65536)]
+
+    class requestHandler(socketserver.StreamRequestHandler):
+
+        def handle(self):
+
+            service = self.server.service
+
+            # A client keeps its connection open: one request per line
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                self.wfile.write(json.dumps(service.dispatch(line)).encode() + b'\n')
+                self.wfile.flush()
+
+            return
+
+        def finish(self):
+
+            socketserver.StreamRequestHandler.finish(self)
+
+            # The connections of the handler thread are closed along with it
+            self.server.service.closeConnections()
+            return
+
+    class tcpServer(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+        class unixServer(socketserver.ThreadingUnixStreamServer):
+            daemon_threads = True
+
+    def __init__(self, address=None):
+
+        self.family, self.address = parseAddress(address or Globals.METADATA_SERVICE or 'localhost:8765')
+        self.logger = LogEngine().logger
+        self.manager = None
+        self.server = None
+        self.requests = 0
+        self.__lock = Lock()
+
+        return
+
+    def warmUp(self):
+        """ Read the covering scene index and the footprints R-tree once, so that
+            the first queries find their pages in memory
+        """
+
+        with self.manager.getConnection() as conn:
+            records = conn.execute('select count(), sum(Path + Row), max(CC_Land) from scene_meta indexed by idx_scene_lookup;').fetchone()[0]
+            conn.execute('select count(), max(max_lon) from scene_rtree;').fetchone()
+
+        self.logger.info('Metadata service: %d scenes indexed', records)
+        return records
+
+    def dispatch(self, line):
+        """ Run the request 'line' (JSON document) and return the response
+        """
+
+        try:
+            request = json.loads(line)
+            method = request.get('method')
+
+            if method not in metadataService.methods:
+                raise metadataException('Unknown metadata service method: {0}'.format(repr(method)))
+
+            result = getattr(self.manager, method)(*request.get('args', []), **request.get('kwargs', {}))
+
+            kind = metadataService.methods[method]
+            if kind == 'scenes':
+                result = sceneRows(result)
+            elif kind == 'pathrows':
+                result = [[path, row, sceneRows(scenes)] for (path, row), scenes in result.items()]
+
+            with self.__lock:
+                self.requests += 1
+
+            return {'result': result}
+
+        except (metadataException, ValueError, TypeError, AttributeError) as error:
+            self.logger.error('Metadata service request failed: %s', repr(error))
+            return {'error': str(error)}
+
+    def closeConnections(self):
+        """ Close the database connections of the calling thread
+        """
+
+        connectionPool.close(self.manager.getDatabaseName())
+        if self.manager.cache is not None and self.manager.cache.filename is not None:
+            connectionPool.close(self.manager.cache.filename)
+
+        return
+
+    def serve(self):
+        """ Open the metadata database, warm it up and serve the requests until 'shutdown'
+        """
+
+        connectionPool.pragmas = connectionPool.pragmas + metadataService.pragmas
+
+        self.manager = landsat8Manager()
+        self.warmUp()
+
+        if self.family == socket.AF_INET:
+            self.server = metadataService.tcpServer(self.address, metadataService.requestHandler)
+        else:
+            # A socket file left by a service which did not shut down cleanly
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            self.server = metadataService.unixServer(self.address, metadataService.requestHandler)
+
+        self.server.service = self
+        self.logger.info('Metadata service listening on %s', repr(self.server.server_address))
+
+        try:
+            self.server.serve_forever()
+
+        finally:
+            self.server.server_close()
+            if self.family != socket.AF_INET and os.path.exists(self.address):
+                os.remove(self.address)
+            self.logger.info('Metadata service stopped after %d requests', self.requests)
+
+        return
+
+    def shutdown(self):
+        """ Stop serving, to be called from another thread
+        """
+
+        if self.server is not None:
+            self.server.shutdown()
+
+        return
+
+
+class landsat8Client:
+    """ Client of the metadata service with the query methods of landsat8Manager
+        (same arguments and results): a drop-in replacement of the manager for the
+        processes which only query the metadata
+    """
+
+    # Seconds to wait for the service to connect or answer
+    timeout = 30.
+
+    def __init__(self, address=None):
+
+        self.family, self.address = parseAddress(address or Globals.METADATA_SERVICE)
+        self.logger = LogEngine().logger
+        self.__lock = Lock()
+
+        try:
+            self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+            self.sock.settimeout(landsat8Client.timeout)
+            self.sock.connect(self.address)
+            self.stream = self.sock.makefile('rwb')
+
+        except OSError as error:
+            self.sock.close()
+            raise metadataException('Cannot connect to the metadata service at {0}: {1}'.format(repr(self.address), repr(error)))
+
+        return
+
+    def call(self, method, *args, **kwargs):
+        """ Send a request to the service and return its result
+        """
+
+        request = json.dumps({'method': method, 'args': args, 'kwargs': kwargs}).encode() + b'\n'
+
+        try:
+            with self.__lock:
+                self.stream.write(request)
+                self.stream.flush()
+                line = self.stream.readline()
+
+        except OSError as error:
+            raise metadataException('Metadata service error: {0}'.format(repr(error)))
+
+        if not line:
+            raise metadataException('Metadata service at {0} closed the connection'.format(repr(self.address)))
+
+        response = json.loads(line)
+        if 'error' in response:
+            raise metadataException('Metadata service error: {0}'.format(response['error']))
+
+        return response['result']
+
+    def close(self):
+        """ Close the connection to the service
+        """
+
+        self.stream.close()
+        self.sock.close()
+        return
+
+    def getSceneProductIDs(self, path, row, begin_date, end_date, cc_land=100., mode='objects', months=None, doy=None, tiers=None, processed_after=None):
+        """ See landsat8Manager.getSceneProductIDs
+        """
+
+        data = self.call('getSceneProductIDs', path, row, begin_date, end_date, cc_land, months=months, doy=doy, tiers=tiers, processed_after=processed_after)
+        return landsat8Manager.formatScenes([tuple(fields) for fields in data], mode)
+
+    def getScenesByPathRow(self, pathrows, begin_date, end_date, cc_land=100.):
+        """ See landsat8Manager.getScenesByPathRow
+        """
+
+        data = self.call('getScenesByPathRow', pathrows, begin_date, end_date, cc_land)
+        return {(path, row): [L8metadata(fields) for fields in rows] for path, row, rows in data}
+
+    def getScenesIntersecting(self, geometry, begin_date, end_date, cc_land=100.):
+        """ See landsat8Manager.getScenesIntersecting
+        """
+
+        data = self.call('getScenesIntersecting', geometry, begin_date, end_date, cc_land)
+        return [L8metadata(fields) for fields in data]
+
+    def getCloudSummary(self, path, row, first_year=None, last_year=None, months=None):
+        """ See landsat8Manager.getCloudSummary
+        """
+
+        return [tuple(fields) for fields in self.call('getCloudSummary', path, row, first_year, last_year, months)]
+
+    def getSeasonalAvailability(self, path, row, months=None, threshold=20):
+        """ See landsat8Manager.getSeasonalAvailability
+        """
+
+        return [tuple(fields) for fields in self.call('getSeasonalAvailability', path, row, months, threshold)]
+
+    def getLastValidators(self):
+        """ See landsat8Manager.getLastValidators
+        """
+
+        return tuple(self.call('getLastValidators'))
+
+    def getNumberofRecords(self, category=None):
+        """ See landsat8Manager.getNumberofRecords
+        """
+
+        return self.call('getNumberofRecords', category)
+
+
+def getMetadataManager(address=None):
+    """ Return a client of the metadata service at 'address' (default:
+        'Globals.METADATA_SERVICE') when one is configured and running,
+        a local landsat8Manager otherwise
+    """
+
+    address = address or Globals.METADATA_SERVICE
+
+    if address:
+        try:
+            return landsat8Client(address)
+
+        except metadataException as error:
+            LogEngine().logger.warning('%s, querying the metadata database directly', str(error))
+
+    return landsat8Manager()
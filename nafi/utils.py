@@ -43,6 +43,15 @@ class Globals():
     # Enable 'benchmark' decorator function
     ALLOW_BENCHMARK = True
 
+    # Metadata queries result cache: number of results kept in memory
+    # (0 disables the cache) and persistent disk tier
+    METADATA_CACHE_SIZE = 1024
+    METADATA_CACHE_DISK = True
+
+    # Address of the metadata query service ('host:port' or 'unix:/path/to/socket'),
+    # None to always open the metadata database locally
+    METADATA_SERVICE = None
+
     # Constants
     MBYTES = 1024 * 1024
 
@@ -309,6 +318,35 @@ def readConfig(f_config):
         else:
             config_lk['cleanup-exclude'] = exclusions.split(',')
 
+        _key = '[ENV]: download_workers'
+        config_lk['download_workers'] = _config.getint('ENV', 'download_workers', fallback=1)
+        if config_lk['download_workers'] < 1:
+            raise ValueError('[ENV] download_workers must be a positive integer')
+
+        _key = '[ENV]: download_engine'
+        config_lk['download_engine'] = _config.get('ENV', 'download_engine', fallback='threads').strip().lower()
+        if config_lk['download_engine'] not in ('threads', 'asyncio'):
+            raise ValueError('[ENV] download_engine must be \'threads\' or \'asyncio\'')
+
+        _key = '[ENV]: download_segments'
+        config_lk['download_segments'] = _config.getint('ENV', 'download_segments', fallback=1)
+        if config_lk['download_segments'] < 1:
+            raise ValueError('[ENV] download_segments must be a positive integer')
+
+        _key = '[ENV]: segment_min_size'
+        config_lk['segment_min_size'] = _config.getint('ENV', 'segment_min_size', fallback=16)
+        if config_lk['segment_min_size'] < 1:
+            raise ValueError('[ENV] segment_min_size must be a positive integer (MB)')
+
+        _key = '[ENV]: verify_archives'
+        config_lk['verify_archives'] = _config.getboolean('ENV', 'verify_archives', fallback=False)
+
+        _key = '[ENV]: stream_extract'
+        config_lk['stream_extract'] = _config.getboolean('ENV', 'stream_extract', fallback=False)
+
+        _key = '[ENV]: metadata_service'
+        config_lk['metadata_service'] = _config.get('ENV', 'metadata_service', fallback='').strip() or None
+
 
         # Load [SAGA] section parameters
         _key = '[SAGA]: saga_cmd'
@@ -370,6 +408,16 @@ def readConfig(f_config):
         else:
             config_lk['cc_land'] = float(config_lk['cc_land'])
 
+        # Optional area of interest: a point 'lon, lat' or a bounding box
+        # 'min_lon, min_lat, max_lon, max_lat' (decimal degrees)
+        aoi = _config.get('SCENES', 'aoi', fallback='').replace(' ', '')
+        if not aoi:
+            config_lk['aoi'] = None
+        else:
+            config_lk['aoi'] = tuple(float(value) for value in aoi.split(','))
+            if len(config_lk['aoi']) not in (2, 4):
+                raise ValueError('[SCENES] aoi must be a point (lon, lat) or a bounding box (min_lon, min_lat, max_lon, max_lat)')
+
 
         if config_lk['verbose']:
             logger = logging.getLogger(Globals.LOGNAME)
@@ -432,12 +480,20 @@ def displayRunConfiguration(config_lk, _status=None):
         data_matrix.append(trow)
 
         #[SCENES]
-        if 'scenes' in _status:
+        trow = []
+        trow.append('[SCENES]')
+        trow.append('              ')
+        data_matrix.append(trow)
 
-            trow = []
-            trow.append('[SCENES]')
-            trow.append('              ')
-            data_matrix.append(trow)
+        trow = []
+        trow.append('Area of interest, point or bbox (aoi)')
+        if config_lk['aoi'] is None:
+            trow.append('None')
+        else:
+            trow.append(config_lk['aoi'])
+        data_matrix.append(trow)
+
+        if 'scenes' in _status:
 
             for scene in _status['scenes']:
 
@@ -494,6 +550,44 @@ def displayRunConfiguration(config_lk, _status=None):
             trow.append(config_lk['cleanup-exclude'])
         data_matrix.append(trow)
 
+        trow = []
+        trow.append('Concurrent scene downloads (download_workers)')
+        trow.append(config_lk['download_workers'])
+        data_matrix.append(trow)
+
+        trow = []
+        trow.append('Download engine (threads/asyncio)')
+        trow.append(config_lk['download_engine'])
+        data_matrix.append(trow)
+
+        trow = []
+        trow.append('Byte ranges per archive (download_segments)')
+        trow.append(config_lk['download_segments'])
+        data_matrix.append(trow)
+
+        trow = []
+        trow.append('Minimum byte range size, MB (segment_min_size)')
+        trow.append(config_lk['segment_min_size'])
+        data_matrix.append(trow)
+
+        trow = []
+        trow.append('Verify downloaded archives (verify_archives)')
+        trow.append(config_lk['verify_archives'])
+        data_matrix.append(trow)
+
+        trow = []
+        trow.append('Extract bands while downloading (stream_extract)')
+        trow.append(config_lk['stream_extract'])
+        data_matrix.append(trow)
+
+        trow = []
+        trow.append('Metadata query service (metadata_service)')
+        if config_lk['metadata_service'] is None:
+            trow.append('None')
+        else:
+            trow.append(config_lk['metadata_service'])
+        data_matrix.append(trow)
+
         # [SAGA]
         trow = []
         trow.append('[SAGA]')
@@ -783,7 +877,7 @@ def benchmark(func):
     if not Globals.ALLOW_BENCHMARK:
         return func
 
-    def report(*args):
+    def report(*args, **kwargs):
 
         summary = ''
         result = None
@@ -797,7 +891,7 @@ def benchmark(func):
             description = args[3]
             puid = self.p_uid
 
-            result = func(*args)
+            result = func(*args, **kwargs)
             elapsed = time.time() -st
 
             # Fill in report
@@ -811,7 +905,7 @@ def benchmark(func):
             self = args[0]
             puid = self.p_uid
 
-            result = func(*args)
+            result = func(*args, **kwargs)
             elapsed = time.time() -st
 
             # Fill in report
@@ -823,7 +917,7 @@ def benchmark(func):
 
             # Get object reference and important values before command execution
             self = args[0]
-            result = func(*args)
+            result = func(*args, **kwargs)
             elapsed = time.time() -st
 
             # Fill in report
@@ -17,6 +17,8 @@ from nafi.utils import LogEngine
 from nafi.utils import benchmark
 from nafi.utils import Globals
 
+from nafi.database import connectionPool
+
 from nafi.exceptions import workflowException
 
 
@@ -47,25 +49,22 @@ class workflowManager:
 
     @contextmanager
     def getConnection(self):
-        """ Manage the connection with the SQLite database and enable
-            foreign keys support. The connection is wrapped within a
-            context manager generator
+        """ Manage the connection with the SQLite database. The thread persistent
+            connection (foreign keys support enabled) is taken from the shared pool
+            and wrapped within a context manager generator
         """
 
+        conn = None
+
         try:
-            if os.path.exists(self.rootdir) is False:
-                os.makedirs(self.rootdir)
             db_name = os.path.join(self.rootdir, '{0}.db'.format(self.wfname))
-            conn = sqlite3.connect(db_name)
-
-            # Enable foreign key support for database
-            cur = conn.cursor()
-            cur.execute('pragma foreign_keys = on;')
+            conn = connectionPool.getConnection(db_name)
 
             yield conn
 
         except Exception as error:
-            conn.rollback()
+            if conn is not None:
+                conn.rollback()
             raise workflowException('Workflow Database Error: {0}'.format(repr(error)))
 
         else:
@@ -136,6 +135,8 @@ class workflowManager:
                     if data is not None:
                         self.wfid = data[0]
 
+                cur.close()
+
             except sqlite3.Error as error:
                 cur.close()
                 raise workflowException('Database {0}: {1}'.format(self.wfname, repr(error)))
@@ -172,6 +173,7 @@ class workflowManager:
                 data = cur.execute("""\
                                         select pUID, Desc from process_run where PATH=? and ROW=? and Acqdate=? 
                                         and fk_wfid=?""", (landsatScene.path, landsatScene.row, landsatScene.acqdate, self.wfid)).fetchall()
+                cur.close()
 
                 if len(data) == 0:
                     return ()
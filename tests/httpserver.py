@@ -0,0 +1,156 @@
+
+import threading
+import email.utils
+import http.server
+
+
+#===============================================================================
+# Local stand-in for the USGS servers: serves in-memory payloads (fake scene
+# archives, bulk metadata files) over HTTP on localhost, with the behaviours
+# the downloaders rely on: validators (ETag, Last-Modified) and conditional
+# requests, byte ranges (Range, If-Range), redirections with cookies, chunked
+# transfer encoding, and connections dropped in the middle of a body.
+# Response headers can be replaced per path ('headers', None drops a header)
+# to stand in for misbehaving servers.
+#===============================================================================
+
+class standInServer:
+    """ HTTP server on a free localhost port, serving 'files' ({path: bytes}).
+        Every request is recorded in 'requests' as (path, headers)
+    """
+
+    class requestHandler(http.server.BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            return
+
+        def do_GET(self):
+
+            server = self.server.standin
+            path = self.path.split('?')[0]
+
+            with server.lock:
+                server.requests.append((path, dict(self.headers)))
+                truncate = server.truncate.pop(path, None)
+
+            if path in server.redirects:
+                self.send_response(302)
+                self.send_header('Location', server.redirects[path])
+                self.send_header('Set-Cookie', 'session=standin; Path=/')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            data = server.files.get(path)
+            if data is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            etag = server.getETag(path)
+
+            if self.headers.get('If-None-Match') == etag or (self.headers.get('If-None-Match') is None and self.headers.get('If-Modified-Since') == server.modified):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            status, start, stop = 200, 0, len(data)
+            byte_range = self.headers.get('Range')
+
+            if byte_range and server.ranges and self.headers.get('If-Range') in (None, etag, server.modified):
+                first, _, last = byte_range.split('=')[1].partition('-')
+                start, stop, status = int(first), min(int(last) + 1, len(data)) if last else len(data), 206
+
+                if start >= len(data):
+                    self.send_response(416)
+                    self.send_header('Content-Range', 'bytes */{0}'.format(len(data)))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+            body = data[start:stop]
+
+            headers = {'ETag': etag, 'Last-Modified': server.modified}
+            if server.ranges:
+                headers['Accept-Ranges'] = 'bytes'
+            if status == 206:
+                headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, stop - 1, len(data))
+            if path in server.chunked:
+                headers['Transfer-Encoding'] = 'chunked'
+            else:
+                headers['Content-Length'] = str(len(body))
+            headers.update(server.headers.get(path, {}))
+
+            self.send_response(status)
+            for name, value in headers.items():
+                if value is not None:
+                    self.send_header(name, value)
+            self.end_headers()
+
+            if truncate is not None:
+                # Connection dropped after 'truncate' bytes of the body
+                if path in server.chunked:
+                    self.wfile.write('{0:x}\r\n'.format(len(body)).encode())
+                self.wfile.write(body[:truncate])
+                self.wfile.flush()
+                self.close_connection = True
+                return
+
+            if path in server.chunked:
+                for offset in range(0, len(body), 65536):
+                    block = body[offset:offset + 65536]
+                    self.wfile.write('{0:x}\r\n'.format(len(block)).encode() + block + b'\r\n')
+                self.wfile.write(b'0\r\n\r\n')
+            else:
+                self.wfile.write(body)
+
+            return
+
+    def __init__(self):
+
+        self.files = {}
+        self.redirects = {}
+        self.chunked = set()
+        self.truncate = {}
+        self.headers = {}
+        self.ranges = True
+        self.modified = email.utils.formatdate(1500000000, usegmt=True)
+
+        self.requests = []
+        self.lock = threading.Lock()
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), standInServer.requestHandler)
+        self.server.daemon_threads = True
+        self.server.standin = self
+        self.thread = None
+
+        return
+
+    def getETag(self, path):
+        """ Strong validator of the payload at 'path', changes with its content
+        """
+
+        return '"{0:x}-{1:x}"'.format(len(self.files[path]), hash(self.files[path]) & 0xffffffff)
+
+    def url(self, path):
+        """ Return the URL of 'path' on the server
+        """
+
+        return 'http://127.0.0.1:{0}{1}'.format(self.server.server_address[1], path)
+
+    def start(self):
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        return
@@ -0,0 +1,273 @@
+
+import os
+import io
+import types
+import shutil
+import asyncio
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from nafi.utils import LogEngine
+from nafi.utils import Globals
+
+from nafi.metadata import metadata, L8metadata
+from nafi.database import connectionPool
+from nafi.asyncdownload import openURL, asyncDownloader
+from nafi.exceptions import downloadException
+
+from tests.httpserver import standInServer
+
+
+def setUpModule():
+
+    LogEngine().initLogger(name='tests')
+    return
+
+
+def fakeArchive(product_id, size=200000):
+    """ Return a gzipped tar archive holding the band files of 'product_id'
+    """
+
+    stream = io.BytesIO()
+
+    with tarfile.open(fileobj=stream, mode='w:gz') as tar:
+        for band in range(1, 12):
+            data = os.urandom(size)
+            member = tarfile.TarInfo('{0}_B{1}.TIF'.format(product_id, band))
+            member.size = len(data)
+            tar.addfile(member, io.BytesIO(data))
+
+    return stream.getvalue()
+
+
+def readBody(response):
+    """ Read the body of an asyncResponse to its end
+    """
+
+    async def read():
+        data = b''
+        while True:
+            chunk = await response.read(65536, 10.)
+            if not chunk:
+                return data
+            data += chunk
+
+    return read()
+
+
+class openURLTest(unittest.TestCase):
+    """ HTTP client of the asyncio download engine against the stand-in server
+    """
+
+    def setUp(self):
+
+        self.server = standInServer().start()
+        self.session = requests.Session()
+        self.payload = os.urandom(300000)
+
+        return
+
+    def tearDown(self):
+
+        self.server.stop()
+        self.session.close()
+        return
+
+    def fetch(self, path, headers=None):
+
+        async def fetch():
+            response = await openURL(self.session, self.server.url(path), headers=headers, timeout=10.)
+            try:
+                return response.status_code, response.headers, await readBody(response)
+            finally:
+                response.close()
+
+        return asyncio.run(fetch())
+
+    def test_fixed_length(self):
+
+        self.server.files['/scene.tgz'] = self.payload
+        status, headers, body = self.fetch('/scene.tgz')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(int(headers['content-length']), len(self.payload))
+        self.assertEqual(body, self.payload)
+
+    def test_redirect(self):
+
+        self.server.files['/scene.tgz'] = self.payload
+        self.server.redirects['/download'] = self.server.url('/scene.tgz')
+        status, _, body = self.fetch('/download')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.payload)
+        # The cookie set with the redirection is stored and sent back
+        self.assertEqual(self.session.cookies.get('session'), 'standin')
+        self.assertIn('session=standin', self.server.requests[-1][1].get('Cookie', ''))
+
+    def test_chunked(self):
+
+        self.server.files['/scene.tgz'] = self.payload
+        self.server.chunked.add('/scene.tgz')
+        status, headers, body = self.fetch('/scene.tgz')
+
+        self.assertEqual(status, 200)
+        self.assertNotIn('content-length', headers)
+        self.assertEqual(body, self.payload)
+
+    def test_truncated(self):
+
+        for path in ('/fixed.tgz', '/chunked.tgz'):
+            self.server.files[path] = self.payload
+            self.server.truncate[path] = 100000
+        self.server.chunked.add('/chunked.tgz')
+
+        for path in ('/fixed.tgz', '/chunked.tgz'):
+            with self.assertRaises(downloadException):
+                self.fetch(path)
+
+    def test_range(self):
+
+        self.server.files['/scene.tgz'] = self.payload
+        status, headers, body = self.fetch('/scene.tgz', {'Range': 'bytes=1000-'})
+
+        self.assertEqual(status, 206)
+        self.assertEqual(headers['content-range'], 'bytes 1000-{0}/{1}'.format(len(self.payload) - 1, len(self.payload)))
+        self.assertEqual(body, self.payload[1000:])
+
+    def test_connection_refused(self):
+
+        self.server.stop()
+        self.server = standInServer().start()
+        url = self.server.url('/scene.tgz')
+        self.server.stop()
+
+        async def fetch():
+            await openURL(self.session, url, timeout=10.)
+
+        with self.assertRaises(downloadException):
+            asyncio.run(fetch())
+
+        self.server = standInServer().start()
+
+    def test_proxy_refused(self):
+
+        self.server.files['/scene.tgz'] = self.payload
+        self.session.proxies['http'] = 'http://proxy.invalid:3128'
+
+        with self.assertRaises(downloadException):
+            self.fetch('/scene.tgz')
+
+
+class asyncDownloaderTest(unittest.TestCase):
+    """ Concurrent downloads of fake scene archives by the asyncio engine
+    """
+
+    def setUp(self):
+
+        self.server = standInServer().start()
+        self.directory = tempfile.mkdtemp()
+
+        self.basedir = mock.patch.object(Globals, 'DOWNLOADER_BASEDIR', os.path.join(self.directory, 'db'))
+        self.baseURL = mock.patch.object(metadata, 'baseURL', self.server.url('/download/{0}/{1}/STANDARD/EE'))
+        self.basedir.start()
+        self.baseURL.start()
+        os.makedirs(Globals.DOWNLOADER_BASEDIR)
+
+        self.scenes = []
+        for day in range(1, 5):
+            product_id = 'LC08_L1TP_044069_201811{0:02d}_20181129_01_T1'.format(day)
+            scene_id = 'LC80440692018{0:03d}LGN00'.format(304 + day)
+            self.scenes.append(L8metadata(('OLI_TIRS', 1, 'T1', 44, 69, '2018-11-{0:02d}'.format(day), scene_id, product_id, 10.)))
+            self.server.files['/download/12864/{0}/STANDARD/EE'.format(scene_id)] = fakeArchive(product_id)
+
+        self.config = {'login_timer': 3600, 'online': False, 'cleanup': False, 'working_d': os.path.join(self.directory, 'work'),
+                       'download_workers': 3, 'download_engine': 'asyncio'}
+
+        return
+
+    def tearDown(self):
+
+        connectionPool.close(os.path.join(Globals.DOWNLOADER_BASEDIR, 'downloadDataManager.db'))
+        self.baseURL.stop()
+        self.basedir.stop()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+        return
+
+    def download(self, config=None):
+        """ Download the scenes, return the landsatScene objects queued
+        """
+
+        downloader = asyncDownloader(dict(self.config, **(config or {})))
+        downloader.browser = types.SimpleNamespace(session=requests.Session())
+
+        downloader.startEngine()
+        try:
+            for future in [downloader.submitDownload(meta) for meta in self.scenes]:
+                future.result()
+        finally:
+            downloader.stopEngine()
+
+        queued = []
+        while not downloader.getTasksQueue().empty():
+            queued.append(downloader.getTasksQueue().get())
+
+        return downloader, queued
+
+    def archivePath(self, meta):
+
+        return os.path.join(self.config['working_d'], '044069', meta.acqdate.replace('-', ''), meta.product_id + '.tgz')
+
+    def test_download(self):
+
+        downloader, queued = self.download()
+
+        self.assertEqual(sorted(scene.metadata.product_id for scene in queued), sorted(meta.product_id for meta in self.scenes))
+
+        for meta in self.scenes:
+            with open(self.archivePath(meta), 'rb') as handle:
+                self.assertEqual(handle.read(), self.server.files['/download/12864/{0}/STANDARD/EE'.format(meta.scene_id)])
+            self.assertEqual(downloader.dbase.getDownloadSize(meta.product_id + '.tgz', self.config['working_d']), os.path.getsize(self.archivePath(meta)))
+
+        # Downloaded once: the second run queues the scenes without downloading them
+        requests_count = len(self.server.requests)
+        _, queued = self.download()
+
+        self.assertEqual(len(queued), len(self.scenes))
+        self.assertEqual(len(self.server.requests), requests_count + len(self.scenes))
+
+    def test_resume(self):
+
+        meta = self.scenes[0]
+        path = '/download/12864/{0}/STANDARD/EE'.format(meta.scene_id)
+        self.server.truncate[path] = 500000
+
+        with self.assertRaises(downloadException):
+            self.download()
+
+        self.assertEqual(os.path.getsize(self.archivePath(meta) + '.part'), 500000)
+
+        _, queued = self.download()
+
+        self.assertEqual(len(queued), len(self.scenes))
+        self.assertIn((path, 'bytes=500000-'), [(request, headers.get('Range')) for request, headers in self.server.requests])
+        with open(self.archivePath(meta), 'rb') as handle:
+            self.assertEqual(handle.read(), self.server.files[path])
+
+    def test_stream_extract(self):
+
+        _, queued = self.download({'stream_extract': True})
+
+        for scene in queued:
+            self.assertTrue(scene.extracted)
+            bands = scene.extractBands(self.config['working_d'])
+            self.assertEqual(len([name for name in os.listdir(bands) if name.endswith('.TIF')]), 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
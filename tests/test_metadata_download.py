@@ -0,0 +1,133 @@
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from nafi.utils import LogEngine
+from nafi.utils import Globals
+
+from nafi.metadata import metaParser
+from nafi.database import connectionPool
+from nafi.exceptions import metadataException
+
+from tests.httpserver import standInServer
+
+
+def setUpModule():
+
+    LogEngine().initLogger(name='tests')
+    return
+
+
+class downloadL8MetaTest(unittest.TestCase):
+    """ Download of the Landsat 8 bulk metadata archive from the stand-in server:
+        full (200), unchanged (304) and resumed (206) transfers
+    """
+
+    archive = 'LANDSAT_8_C1.csv.gz'
+
+    def setUp(self):
+
+        self.server = standInServer().start()
+        self.directory = tempfile.mkdtemp()
+        self.path = '/' + downloadL8MetaTest.archive
+
+        lines = ['sceneID,productID,sensor'] + ['LC8{0:013d},{1},OLI_TIRS'.format(n, os.urandom(16).hex()) for n in range(20000)]
+        self.server.files[self.path] = gzip.compress('\n'.join(lines).encode())
+
+        self.patches = [mock.patch.object(Globals, 'METADATA_LC8_BASEDIR', os.path.join(self.directory, 'db')),
+                        mock.patch.object(metaParser, 'metaURL', self.server.url(self.path)),
+                        mock.patch.object(metaParser, 'getRootDirectory', return_value=self.directory)]
+        for patch in self.patches:
+            patch.start()
+        os.makedirs(Globals.METADATA_LC8_BASEDIR)
+
+        self.parser = metaParser()
+        self.outfile = os.path.join(self.directory, downloadL8MetaTest.archive)
+
+        return
+
+    def tearDown(self):
+
+        connectionPool.close(self.parser.dbase.getDatabaseName())
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+        return
+
+    def writePart(self, size, validator):
+        """ Leave a partial archive of 'size' bytes, as an interrupted download would
+        """
+
+        with open(self.outfile + '.part', 'wb') as handle:
+            handle.write(self.server.files[self.path][:size])
+        with open(self.outfile + '.validator', 'w') as handle:
+            handle.write(validator)
+
+        return
+
+    def assertDownloaded(self, fn_meta):
+
+        self.assertEqual(fn_meta, self.outfile)
+        with open(self.outfile, 'rb') as handle:
+            self.assertEqual(handle.read(), self.server.files[self.path])
+        self.assertFalse(os.path.exists(self.outfile + '.part'))
+        self.assertFalse(os.path.exists(self.outfile + '.validator'))
+
+    def test_download(self):
+
+        self.assertDownloaded(self.parser.downloadL8Meta(conditional=False))
+        self.assertEqual(self.parser.etag, self.server.getETag(self.path))
+        self.assertNotIn('Range', self.server.requests[-1][1])
+
+    def test_not_modified(self):
+
+        with mock.patch.object(self.parser.dbase, 'getLastValidators', return_value=(self.server.getETag(self.path), None)):
+            self.assertEqual(self.parser.downloadL8Meta(), '')
+
+        self.assertEqual(self.server.requests[-1][1].get('If-None-Match'), self.server.getETag(self.path))
+        self.assertFalse(os.path.exists(self.outfile))
+
+    def test_resume(self):
+
+        self.writePart(20000, self.server.getETag(self.path))
+
+        self.assertDownloaded(self.parser.downloadL8Meta(conditional=False))
+        self.assertEqual(self.server.requests[-1][1].get('Range'), 'bytes=20000-')
+        self.assertEqual(self.server.requests[-1][1].get('If-Range'), self.server.getETag(self.path))
+
+    def test_resume_interrupted(self):
+
+        # Dropped after a few chunks: the second request resumes the partial archive
+        self.server.truncate[self.path] = 300000
+
+        self.assertDownloaded(self.parser.downloadL8Meta(conditional=False))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertRegex(self.server.requests[-1][1].get('Range', ''), r'^bytes=[1-9]\d*-$')
+
+    def test_resume_modified(self):
+
+        # Archive changed since the partial download: the server sends all of it
+        self.writePart(20000, '"outdated"')
+
+        self.assertDownloaded(self.parser.downloadL8Meta(conditional=False))
+        self.assertEqual(self.server.requests[-1][1].get('If-Range'), '"outdated"')
+
+    def test_invalid_content_range(self):
+
+        size = len(self.server.files[self.path])
+
+        for content_range in (None, 'bytes */{0}'.format(size), 'bytes 0-{0}/{1}'.format(size - 1, size)):
+            self.server.headers[self.path] = {'Content-Range': content_range}
+            self.writePart(20000, self.server.getETag(self.path))
+
+            with self.assertRaises(metadataException):
+                self.parser.downloadL8Meta(conditional=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
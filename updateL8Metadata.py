@@ -12,83 +12,83 @@ from nafi.utils import Globals
 from nafi.metadata import metaParser
 from nafi.metadata import metadataException
 
-parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-parser.add_argument('-v', '--version', help='Displays all module versions', default=False, action='store_true')
-parser.add_argument('--debug', '--debug', help='Run script in debug mode', default=False, action='store_true')
-args = parser.parse_args()
-
-
-logname = 'L8_Meta'
-level = logging.INFO
-basedir = Globals.METADATA_LC8_LOG_BASEDIR
-
-# Get log level
-if args.debug: 
-    level = logging.DEBUG
-#   delete existing log file
-    logfile = os.path.join(os.path.expanduser(basedir), 'L8_Meta_db.log')
-    if os.path.isfile(logfile):
-        os.remove(logfile)
+
+# The metadata parser may start worker processes: the script body must
+# only run in the main process (required on Windows)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-v', '--version', help='Displays all module versions', default=False, action='store_true')
+    parser.add_argument('--debug', '--debug', help='Run script in debug mode', default=False, action='store_true')
+    parser.add_argument('-s', '--stream', help='Import metadata straight from the USGS server, nothing written to disk', default=False, action='store_true')
+    parser.add_argument('--full', help='Delete all metadata records and reload them, instead of merging the changes', default=False, action='store_true')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of processes parsing the metadata')
+    args = parser.parse_args()
+
+
+    logname = 'L8_Meta'
+    level = logging.INFO
+    basedir = Globals.METADATA_LC8_LOG_BASEDIR
+
+    # Get log level
+    if args.debug: 
+        level = logging.DEBUG
+    #   delete existing log file
+        logfile = os.path.join(os.path.expanduser(basedir), 'L8_Meta_db.log')
+        if os.path.isfile(logfile):
+            os.remove(logfile)
               
                   
-# Init logging engine
-engine = LogEngine()
-engine.initLogger(name=logname, location=basedir)
-engine.addFilelogHandler(basename='L8_Meta_db')
-engine.setLogLevel(level)
-
-
-# Get logger instance
-logger = engine.logger
-logger.info('Python interpreter: {0}'.format(sys.version))
-logger.info(' ')
-logger.info('Date: %s', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-logger.info('Version: {0}'.format(Globals.VERSION))
-logger.info('Log level: {0}'.format(logging.getLevelName(level)))
-logger.info(' ')
-
-# define max time since last update
-MAX_FILE_AGE = 6
-
-try:
-
-    st = time.time()
-
-    parser = metaParser()
-    
-    rootdir = os.path.expanduser(Globals.METADATA_LC8_BASEDIR)
-    L8_csv = os.path.join(rootdir, 'LANDSAT_8_C1.csv')
-    
-    if level == logging.INFO:
-        
-        if not os.path.isfile(L8_csv):
-            L8_csv = parser.downloadL8Meta()
+    # Init logging engine
+    engine = LogEngine()
+    engine.initLogger(name=logname, location=basedir)
+    engine.addFilelogHandler(basename='L8_Meta_db')
+    engine.setLogLevel(level)
+
+
+    # Get logger instance
+    logger = engine.logger
+    logger.info('Python interpreter: {0}'.format(sys.version))
+    logger.info(' ')
+    logger.info('Date: %s', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    logger.info('Version: {0}'.format(Globals.VERSION))
+    logger.info('Log level: {0}'.format(logging.getLevelName(level)))
+    logger.info(' ')
+
+    try:
+
+        st = time.time()
+
+        parser = metaParser()
+
+        # The archive is only downloaded (or streamed) if it has changed since the last
+        # import, unless a full reload is requested
+        conditional = not args.full
+
+        if args.stream:
+            parser.streamL8Metadata(not args.full, args.workers, conditional)
+
         else:
-            #check if the file is less than 6 hours
-            c_time = os.path.getctime(L8_csv)
-            tdiff = (st - c_time) / 3600.
-            
-            if tdiff > MAX_FILE_AGE:
-                logger.info('The L8 metadata file is %d hours old. It needs to be downloaded anew', round(tdiff))    
-                L8_csv = parser.downloadL8Meta()
-            else:
-                logger.info('The L8 metadata CSV file is only %d hours old', round(tdiff))    
-         
-    else:
-        # we don't need to check if file is up to date        
-        if not os.path.isfile(L8_csv):
-            L8_csv = parser.downloadL8Meta()
-    
-    
-    parser.loadL8Metadata(L8_csv)
-    elapsed = time.time() -st
-
-    logger.info('Running time: %.1fs' % elapsed)
-    logger.info('Done parsing metadata...')
-
-
-except metadataException as error:
-    logger.critical(repr(error))
-
-
-exit(0)
+            rootdir = os.path.expanduser(Globals.METADATA_LC8_BASEDIR)
+            L8_archive = os.path.join(rootdir, 'LANDSAT_8_C1.csv.gz')
+
+            # In debug mode, an archive already downloaded is reused as is
+            if level == logging.INFO or not os.path.isfile(L8_archive):
+                L8_archive = parser.downloadL8Meta(False, conditional)
+
+            # The gzipped archive is decompressed on the fly
+            if L8_archive:
+                parser.loadL8Metadata(L8_archive, not args.full, args.workers)
+
+        elapsed = time.time() -st
+
+        logger.info('Running time: %.1fs' % elapsed)
+        logger.info('Done parsing metadata...')
+
+
+    except metadataException as error:
+        logger.critical(repr(error))
+
+
+    exit(0)